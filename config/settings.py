@@ -65,6 +65,11 @@ INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# the toolbar stays installed while `manage.py test` runs with DEBUG = False
+DEBUG_TOOLBAR_CONFIG = {
+    'IS_RUNNING_TESTS': False,
+}
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -136,6 +141,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -163,6 +171,59 @@ REST_FRAMEWORK = {
 }
 
 
+# ?export=true lists are streamed item by item (store.mixins.StreamingListMixin)
+STORE_STREAM_EXPORTS = True
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # a cache shared by all workers, enable it with STORE_CACHE_ALIAS = 'shared'
+    # 'shared': {
+    #     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    #     'LOCATION': 'redis://127.0.0.1:6379',
+    # },
+}
+
+# cache of the catalog responses, versions and metrics (store.cache). It has
+# to be shared by all processes for a change in one of them to invalidate the
+# responses cached by the others (see `manage.py check --deploy`). With the
+# local memory cache every process rebuilds them after
+# STORE_LOCAL_CACHE_TIMEOUT seconds instead. The notification streams
+# (store.notifications.stream) are woken up through this cache too, with a
+# local one they ask the database every few polls.
+STORE_CACHE_ALIAS = 'default'
+STORE_LOCAL_CACHE_TIMEOUT = 60
+
+# where carts are kept (store.carts). 'store.carts.CacheCartStore' keeps them
+# in the store cache and writes them to the database with the flush_carts
+# command, it needs a cache shared by all workers.
+STORE_CART_BACKEND = 'store.carts.DatabaseCartStore'
+STORE_CART_TIMEOUT = 7 * 24 * 60 * 60
+
+# chunked uploads (store.uploads) are assembled here, on the same filesystem
+# as MEDIA_ROOT so finalizing only renames them
+STORE_UPLOAD_DIR = MEDIA_ROOT / 'uploads'
+STORE_UPLOAD_MAX_SIZE = 10 * 1024 ** 3
+STORE_UPLOAD_MAX_CHUNK = 64 * 1024 ** 2
+
+# how lecture files are sent (store.lectures): 'django' streams them with
+# FileResponse (sendfile() under servers with a wsgi.file_wrapper),
+# 'x-accel-redirect' hands them to nginx through an internal location, e.g.
+#   location /protected-media/ { internal; alias /path/to/media/; }
+# and 'x-sendfile' to Apache's mod_xsendfile
+STORE_MEDIA_DELIVERY = 'django'
+STORE_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# resized copies of course, category, teacher and customer images
+# (store.images): name -> largest width and height, in every format
+STORE_IMAGE_SIZES = {'small': 320, 'medium': 768, 'large': 1440}
+STORE_IMAGE_FORMATS = ('webp', 'jpeg')
+# one process per CPU by default
+STORE_IMAGE_PROCESSES = None
+
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT', ),
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -181,3 +242,15 @@ AUTH_USER_MODEL = 'core.CustomUser'
 # ZarinPal
 SANDBOX = True
 ZARINPALL_MERCHANT_ID = 'aaabbbaaabbbaaabbbaaabbbaaabbbaaabbb'
+# None uses the real gateway, 'http://127.0.0.1:8765' the runfakezarinpal command
+ZARINPAL_API_BASE = None
+# (connect, read) seconds, retries of failed connections and 502/503/504
+# and the seconds all attempts of a call may take. Read timeouts are never
+# retried, the gateway may have taken the request.
+ZARINPAL_TIMEOUT = (3.05, 10)
+ZARINPAL_RETRIES = 2
+ZARINPAL_DEADLINE = 15
+ZARINPAL_POOL_SIZE = 10
+# failures in a row that stop calls to the gateway, and for how many seconds
+ZARINPAL_BREAKER_THRESHOLD = 5
+ZARINPAL_BREAKER_RESET = 30
@@ -9,7 +9,8 @@ from django.utils.http import urlencode
 
 
 
-from .models import Cart, CartItem, Category, Certificate, CompletedLesson, Course, Customer, EnrolledCourse, Note, Notification, Order, OrderItem, Comment, Question_Answer, Question_Answer_Message, Teacher, Variant, VariantItem, Wishlist
+from .orders import revenue
+from .models import Cart, CartItem, Category, Certificate, CompletedLesson, Course, Customer, EnrolledCourse, MediaJob, Note, Notification, Order, OrderItem, OutboxEvent, Comment, Question_Answer, Question_Answer_Message, Teacher, UploadSession, Variant, VariantItem, Wishlist
 
 
                 
@@ -61,21 +62,27 @@ class OrderItemInline(admin.TabularInline):
 
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'customer', 'status','datetime_created', 'num_of_items']
+    list_display = ['id', 'customer', 'status','datetime_created', 'total', 'num_of_items']
+    list_select_related = ['customer__user']
     list_editable = ['status']
+    list_filter = ['status', 'datetime_created']
     list_per_page = 5
     ordering = ['-datetime_created',]
+    date_hierarchy = 'datetime_created'
+    readonly_fields = ['total', 'items_count']
     inlines =[OrderItemInline]
-
-
-    def get_queryset(self, request: HttpRequest):
-        return super().get_queryset(request).prefetch_related('items').annotate(items_count=Count('items'))
+    actions = ['show_revenue']
 
 
     @admin.display(ordering='items_count', description='# items')
     def num_of_items(self, order):
         return order.items_count
 
+    @admin.action(description='Show revenue of selected orders')
+    def show_revenue(self, request, queryset):
+        totals = revenue(queryset)
+        self.message_user(request, f'{totals["orders"]} orders, {totals["items"]} items, revenue {totals["revenue"]:.2f}', messages.INFO)
+
 class CommentAdmin(admin.ModelAdmin):
     list_display = ['id', 'course', 'status']
     list_editable = ['status']
@@ -88,7 +95,6 @@ admin.site.register(Course, CourseAdmin)
 admin.site.register(Category)
 admin.site.register(Order, OrderAdmin)
 admin.site.register(Comment, CommentAdmin)
-admin.site.register(Teacher)
 admin.site.register(VariantItem)
 admin.site.register(Question_Answer)
 admin.site.register(Question_Answer_Message)
@@ -140,9 +146,43 @@ class CartAdmin(admin.ModelAdmin):
 
 class VariantItemInline(admin.TabularInline):
     model = VariantItem
-    fields = ['title', 'file', 'duration']   
+    fields = ['title', 'file', 'duration', 'content_duration']
+    readonly_fields = ['duration', 'content_duration']
 
 @admin.register(Variant)
 class VariantAdmin(admin.ModelAdmin):
     model = Variant
-    inlines = [VariantItemInline]    
\ No newline at end of file
+    inlines = [VariantItemInline]    
+
+
+@admin.register(MediaJob)
+class MediaJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'variant_item', 'status', 'attempts', 'datetime_created', 'datetime_finished']
+    list_filter = ['status']
+    list_select_related = ['variant_item__variant']
+    list_per_page = 20
+    readonly_fields = ['attempts', 'error', 'datetime_started', 'datetime_finished']
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'datetime_created', 'available_at', 'datetime_finished']
+    list_filter = ['status', 'name']
+    list_per_page = 20
+    readonly_fields = ['attempts', 'error', 'datetime_started', 'datetime_finished']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'target', 'target_id', 'filename', 'size', 'received', 'status', 'datetime_created']
+    list_filter = ['status', 'target']
+    list_per_page = 20
+    readonly_fields = ['received', 'sha256', 'file', 'datetime_completed']
+
+
+@admin.register(Teacher)
+class TeacherAdmin(admin.ModelAdmin):
+    list_display = ['id', 'full_name', 'students_count', 'courses_count', 'reviews_count', 'average_rating']
+    list_per_page = 10
+    search_fields = ['full_name']
+    readonly_fields = ['students_count', 'courses_count', 'reviews_count', 'rating_total', 'average_rating']
@@ -7,4 +7,6 @@ class StoreConfig(AppConfig):
     name = 'store'
 
     def ready(self) -> None:
+        import store.checks
         import store.signals.handlers
+        import store.consumers
@@ -0,0 +1,109 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def get_cache():
+    """
+      the cache used by the store app, STORE_CACHE_ALIAS picks one of
+      settings.CACHES so a shared backend (e.g. redis) can replace the
+      per-process local memory cache
+    """
+    return caches[getattr(settings, 'STORE_CACHE_ALIAS', 'default')]
+
+
+def is_shared(cache=None):
+    """
+      False for the local memory cache, which every process has its own of
+    """
+    return not isinstance(cache or get_cache(), LocMemCache)
+
+
+def version_timeout():
+    """
+      versions never expire in a shared cache. A local one doesn't see the
+      bumps of the other processes (web workers, runoutbox), so there they
+      expire after STORE_LOCAL_CACHE_TIMEOUT seconds and everything cached
+      under them is rebuilt.
+    """
+    if is_shared():
+        return None
+    return getattr(settings, 'STORE_LOCAL_CACHE_TIMEOUT', 60)
+
+
+def version_key(name):
+    return f'store:version:{name}'
+
+
+def new_version():
+    # a version that was never handed out before, even when the key was evicted
+    return time.time_ns() // 1000
+
+
+def get_version(name):
+    return get_cache().get_or_set(version_key(name), new_version, timeout=version_timeout())
+
+
+def get_versions(names):
+    """
+      current versions of names with one round trip to the cache
+    """
+    cache = get_cache()
+    keys = {version_key(name): name for name in names}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    missing = {key: new_version() for key, name in keys.items() if name not in versions}
+    if missing:
+        cache.set_many(missing, timeout=version_timeout())
+        versions.update({keys[key]: version for key, version in missing.items()})
+    return [versions[name] for name in names]
+
+
+def bump_version(*names):
+    """
+      invalidates every entry cached under the current version of names
+    """
+    cache = get_cache()
+    for name in names:
+        try:
+            cache.incr(version_key(name))
+        except ValueError:
+            cache.set(version_key(name), new_version(), timeout=version_timeout())
+
+
+def metrics_key(name, event):
+    return f'store:metrics:{name}:{event}'
+
+
+def record(name, event):
+    """
+      counts a cache event (hit or miss) of name, shared between processes
+      when the cache backend is
+    """
+    cache = get_cache()
+    key = metrics_key(name, event)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_metrics(names):
+    cache = get_cache()
+    counts = cache.get_many([metrics_key(name, event) for name in names for event in ('hits', 'misses')])
+    metrics = {}
+    for name in names:
+        hits = counts.get(metrics_key(name, 'hits'), 0)
+        misses = counts.get(metrics_key(name, 'misses'), 0)
+        metrics[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return metrics
+
+
+def reset_metrics(names):
+    get_cache().delete_many([metrics_key(name, event) for name in names for event in ('hits', 'misses')])
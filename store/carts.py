@@ -0,0 +1,442 @@
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from decimal import Decimal
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from store.cache import get_cache
+from store.models import Cart, CartItem, Course
+
+
+CART_TIMEOUT = 7 * 24 * 60 * 60
+
+JOURNAL_KEY = 'store:carts:journal'
+FLUSHED_KEY = 'store:carts:flushed'
+GAP_KEY = 'store:carts:gap'
+
+# seconds a cart lock is held at most and waited for
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5
+
+
+class CartBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The cart is being changed, try again.'
+    default_code = 'cart_busy'
+
+
+def cart_store():
+    """
+      the cart backend selected by STORE_CART_BACKEND, DatabaseCartStore by
+      default. CacheCartStore needs a cache shared by all workers, see
+      STORE_CACHE_ALIAS.
+    """
+    return import_string(getattr(settings, 'STORE_CART_BACKEND', 'store.carts.DatabaseCartStore'))()
+
+
+def parse_cart_id(cart_id):
+    try:
+        return UUID(str(cart_id))
+    except ValueError:
+        raise NotFound('Cart not found.')
+
+
+def parse_item_id(item_id):
+    try:
+        return int(item_id)
+    except (TypeError, ValueError):
+        raise NotFound('Cart item not found.')
+
+
+def course_key(course_id):
+    return f'store:cart-course:{course_id}'
+
+
+def get_course(course_id):
+    """
+      the id, name and unit_price shown for a course in a cart, read from the
+      cache and loaded from the database once per course
+    """
+    cache = get_cache()
+    course = cache.get(course_key(course_id))
+    if course is None:
+        course = Course.objects.filter(id=course_id).values('id', 'name', 'unit_price').first()
+        if course is None:
+            raise ValidationError({'course': [f'Invalid pk "{course_id}" - object does not exist.']})
+        cache.set(course_key(course_id), course, CART_TIMEOUT)
+    return course
+
+
+def get_courses(course_ids, field='course'):
+    """
+      get_course() for many courses with one round trip to the cache and at
+      most one query, every id has to exist
+    """
+    cache = get_cache()
+    keys = {course_key(course_id): course_id for course_id in course_ids}
+    courses = {course['id']: course for course in cache.get_many(keys).values()}
+    missing = [course_id for course_id in keys.values() if course_id not in courses]
+    if missing:
+        loaded = {course['id']: course for course in Course.objects.filter(id__in=missing).values('id', 'name', 'unit_price')}
+        invalid = [course_id for course_id in missing if course_id not in loaded]
+        if invalid:
+            raise ValidationError({field: [f'Invalid pk "{course_id}" - object does not exist.' for course_id in invalid]})
+        cache.set_many({course_key(course_id): course for course_id, course in loaded.items()}, CART_TIMEOUT)
+        courses.update(loaded)
+    return courses
+
+
+def check_bulk(add, remove):
+    both = set(add) & set(remove)
+    if both:
+        raise ValidationError({'remove': [f'Course {course_id} is also added.' for course_id in sorted(both)]})
+
+
+def forget_course(course_id):
+    get_cache().delete(course_key(course_id))
+
+
+class DatabaseCartStore:
+    """
+      carts stored in Cart and CartItem, every call reads or writes the database
+    """
+
+    def create(self):
+        cart = Cart.objects.create()
+        return {'id': str(cart.id), 'items': [], 'total_price': 0}
+
+    def get(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        if not Cart.objects.filter(id=cart_id).exists():
+            raise NotFound('Cart not found.')
+        return self.cart(cart_id)
+
+    def cart(self, cart_id):
+        items = self.items(cart_id)
+        return {
+            'id': str(cart_id),
+            'items': items,
+            'total_price': sum(item['course']['unit_price'] for item in items),
+        }
+
+    def delete(self, cart_id):
+        deleted, _ = Cart.objects.filter(id=parse_cart_id(cart_id)).delete()
+        if not deleted:
+            raise NotFound('Cart not found.')
+
+    def items(self, cart_id):
+        items = CartItem.objects.filter(cart_id=parse_cart_id(cart_id)).order_by('id') \
+            .values('id', 'course_id', 'course__name', 'course__unit_price')
+        return [self.represent(item) for item in items]
+
+    def get_item(self, cart_id, item_id):
+        item = CartItem.objects.filter(cart_id=parse_cart_id(cart_id), id=parse_item_id(item_id)) \
+            .values('id', 'course_id', 'course__name', 'course__unit_price').first()
+        if item is None:
+            raise NotFound('Cart item not found.')
+        return self.represent(item)
+
+    def add_item(self, cart_id, course_id):
+        cart_id = parse_cart_id(cart_id)
+        if not Cart.objects.filter(id=cart_id).exists():
+            raise NotFound('Cart not found.')
+        course = get_course(course_id)
+        item, _ = CartItem.objects.get_or_create(cart_id=cart_id, course_id=course_id)
+        return {'id': item.id, 'course': course}
+
+    def update_item(self, cart_id, item_id, course_id):
+        course = get_course(course_id)
+        try:
+            with transaction.atomic():
+                updated = CartItem.objects.filter(cart_id=parse_cart_id(cart_id), id=parse_item_id(item_id)).update(course_id=course_id)
+        except IntegrityError:
+            raise ValidationError({'course': ['This course is already in the cart.']})
+        if not updated:
+            raise NotFound('Cart item not found.')
+        return {'id': parse_item_id(item_id), 'course': course}
+
+    def remove_item(self, cart_id, item_id):
+        deleted, _ = CartItem.objects.filter(cart_id=parse_cart_id(cart_id), id=parse_item_id(item_id)).delete()
+        if not deleted:
+            raise NotFound('Cart item not found.')
+
+    def update_items(self, cart_id, add=(), remove=()):
+        """
+          adds the courses in add that aren't in the cart yet and removes the
+          courses in remove, in one transaction
+        """
+        check_bulk(add, remove)
+        cart_id = parse_cart_id(cart_id)
+        if add:
+            get_courses(add, field='add')
+        with transaction.atomic():
+            if not Cart.objects.filter(id=cart_id).exists():
+                raise NotFound('Cart not found.')
+            if add:
+                CartItem.objects.bulk_create([CartItem(cart_id=cart_id, course_id=course_id) for course_id in add], ignore_conflicts=True)
+            if remove:
+                CartItem.objects.filter(cart_id=cart_id, course_id__in=remove).delete()
+        return self.cart(cart_id)
+
+    def checking_out(self, cart_id):
+        # the cart is in the database already, checkout() locks its row
+        return nullcontext()
+
+    def persist(self, cart_ids):
+        pass
+
+    def represent(self, item):
+        return {
+            'id': item['id'],
+            'course': {'id': item['course_id'], 'name': item['course__name'], 'unit_price': item['course__unit_price']},
+        }
+
+
+class CacheCartStore:
+    """
+      carts kept in the store cache with their running total, the database
+      is only read for carts the cache doesn't know (yet).
+
+      Every write appends the cart id to a journal in the cache, flush()
+      (the flush_carts command) writes the journaled carts to Cart and
+      CartItem in batches. Checkout persists its cart first, see
+      checking_out().
+
+      Items are keyed by course, the id of a cart item is its course id. The
+      unit price shown is the one the course had when it was added, checkout
+      charges the current price.
+    """
+
+    def __init__(self):
+        self.cache = get_cache()
+        self.timeout = getattr(settings, 'STORE_CART_TIMEOUT', CART_TIMEOUT)
+
+    def key(self, cart_id):
+        return f'store:cart:{cart_id}'
+
+    def load(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        entry = self.cache.get(self.key(cart_id))
+        if entry is None:
+            entry = self.load_from_database(cart_id)
+            # add(): a writer may have cached a newer state meanwhile
+            if not self.cache.add(self.key(cart_id), entry, self.timeout):
+                return self.load(cart_id)
+        if entry.get('deleted'):
+            raise NotFound('Cart not found.')
+        return entry
+
+    def load_from_database(self, cart_id):
+        cart = Cart.objects.filter(id=cart_id).values('id', 'created_at').first()
+        if cart is None:
+            raise NotFound('Cart not found.')
+        courses = Course.objects.filter(cart_items__cart_id=cart_id).values('id', 'name', 'unit_price')
+        items = {course['id']: course for course in courses}
+        return {
+            'id': str(cart_id),
+            'created_at': cart['created_at'],
+            'items': items,
+            'total_price': sum((course['unit_price'] for course in items.values()), Decimal(0)),
+        }
+
+    @contextmanager
+    def locked(self, cart_id):
+        """
+          serializes the writes of a cart, every write loads the cart, changes
+          it and stores it again. cache.add() is atomic, only one process
+          gets the lock key.
+        """
+        key = f'{self.key(parse_cart_id(cart_id))}:lock'
+        token = uuid4().hex
+        deadline = time.monotonic() + LOCK_WAIT
+        while not self.cache.add(key, token, LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise CartBusy()
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def save(self, entry):
+        self.cache.set(self.key(entry['id']), entry, self.timeout)
+        self.journal(entry['id'])
+
+    def journal(self, cart_id):
+        try:
+            sequence = self.cache.incr(JOURNAL_KEY)
+        except ValueError:
+            self.cache.add(JOURNAL_KEY, 0, timeout=None)
+            sequence = self.cache.incr(JOURNAL_KEY)
+        self.cache.set(f'{JOURNAL_KEY}:{sequence}', cart_id, self.timeout)
+
+    def create(self):
+        entry = {'id': str(uuid4()), 'created_at': timezone.now(), 'items': {}, 'total_price': Decimal(0)}
+        self.save(entry)
+        return self.represent(entry)
+
+    def get(self, cart_id):
+        return self.represent(self.load(cart_id))
+
+    def delete(self, cart_id):
+        with self.locked(cart_id):
+            entry = self.load(cart_id)
+            self.save({'id': entry['id'], 'deleted': True})
+
+    def items(self, cart_id):
+        return self.represent(self.load(cart_id))['items']
+
+    def get_item(self, cart_id, item_id):
+        course = self.load(cart_id)['items'].get(parse_item_id(item_id))
+        if course is None:
+            raise NotFound('Cart item not found.')
+        return {'id': course['id'], 'course': course}
+
+    def add_item(self, cart_id, course_id):
+        course = get_course(course_id)
+        with self.locked(cart_id):
+            entry = self.load(cart_id)
+            if course['id'] not in entry['items']:
+                entry['items'][course['id']] = course
+                entry['total_price'] += course['unit_price']
+                self.save(entry)
+        return {'id': course['id'], 'course': course}
+
+    def update_item(self, cart_id, item_id, course_id):
+        course = get_course(course_id)
+        with self.locked(cart_id):
+            entry = self.load(cart_id)
+            old_course = entry['items'].pop(parse_item_id(item_id), None)
+            if old_course is None:
+                raise NotFound('Cart item not found.')
+            if course['id'] in entry['items']:
+                raise ValidationError({'course': ['This course is already in the cart.']})
+            entry['items'][course['id']] = course
+            entry['total_price'] += course['unit_price'] - old_course['unit_price']
+            self.save(entry)
+        return {'id': course['id'], 'course': course}
+
+    def remove_item(self, cart_id, item_id):
+        with self.locked(cart_id):
+            entry = self.load(cart_id)
+            course = entry['items'].pop(parse_item_id(item_id), None)
+            if course is None:
+                raise NotFound('Cart item not found.')
+            entry['total_price'] -= course['unit_price']
+            self.save(entry)
+
+    def update_items(self, cart_id, add=(), remove=()):
+        check_bulk(add, remove)
+        courses = get_courses(add, field='add')
+        with self.locked(cart_id):
+            entry = self.load(cart_id)
+            added = {course_id: course for course_id, course in courses.items() if course_id not in entry['items']}
+            removed = [entry['items'].pop(course_id) for course_id in set(remove) if course_id in entry['items']]
+            if added or removed:
+                entry['items'].update(added)
+                entry['total_price'] += sum(course['unit_price'] for course in added.values()) \
+                    - sum(course['unit_price'] for course in removed)
+                self.save(entry)
+        return self.represent(entry)
+
+    def represent(self, entry):
+        return {
+            'id': entry['id'],
+            'items': [{'id': course['id'], 'course': course} for course in entry['items'].values()],
+            'total_price': entry['total_price'],
+        }
+
+    @contextmanager
+    def checking_out(self, cart_id):
+        """
+          writes the cart to the database for checkout() and keeps it locked
+          until the checkout is done, so no change lands in between. The
+          cached cart is dropped once the checkout commits.
+        """
+        with self.locked(cart_id):
+            self.write([cart_id])
+            yield
+            transaction.on_commit(lambda: self.cache.delete(self.key(parse_cart_id(cart_id))))
+
+    def persist(self, cart_ids):
+        """
+          writes the cached state of cart_ids to Cart and CartItem, with the
+          carts locked so a checkout can't run in between
+        """
+        with ExitStack() as stack:
+            for cart_id in sorted(map(str, cart_ids)):
+                stack.enter_context(self.locked(cart_id))
+            return self.write(cart_ids)
+
+    def write(self, cart_ids):
+        entries = list(self.cache.get_many([self.key(parse_cart_id(cart_id)) for cart_id in cart_ids]).values())
+        deleted = [entry['id'] for entry in entries if entry.get('deleted')]
+        carts = [entry for entry in entries if not entry.get('deleted')]
+        cart_ids = [UUID(entry['id']) for entry in carts]
+        course_ids = {course_id for entry in carts for course_id in entry['items']}
+        existing_courses = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+
+        wanted = {(UUID(entry['id']), course_id) for entry in carts for course_id in entry['items'] if course_id in existing_courses}
+
+        with transaction.atomic():
+            stored = {
+                (cart_id, course_id): item_id
+                for item_id, cart_id, course_id in CartItem.objects.filter(cart_id__in=cart_ids).values_list('id', 'cart_id', 'course_id')
+            }
+            if deleted:
+                Cart.objects.filter(id__in=deleted).delete()
+            Cart.objects.bulk_create([Cart(id=cart_id) for cart_id in cart_ids], ignore_conflicts=True)
+            if carts:
+                # created_at is auto_now_add, bulk_create stamps the time of the flush
+                Cart.objects.filter(id__in=cart_ids).update(
+                    created_at=Case(*(When(id=UUID(entry['id']), then=entry['created_at']) for entry in carts)),
+                )
+            CartItem.objects.filter(id__in=[item_id for key, item_id in stored.items() if key not in wanted]).delete()
+            CartItem.objects.bulk_create(
+                [CartItem(cart_id=cart_id, course_id=course_id) for cart_id, course_id in wanted - stored.keys()],
+                ignore_conflicts=True,
+            )
+        return len(entries)
+
+    def flush(self, batch_size=1000):
+        """
+          persists every cart written since the last flush and returns how
+          many were written. Run one flush at a time.
+        """
+        flushed_to = self.cache.get(FLUSHED_KEY, 0)
+        last = self.cache.get(JOURNAL_KEY, 0)
+        gap = self.cache.get(GAP_KEY)
+        persisted = 0
+        while flushed_to < last:
+            upto = min(flushed_to + batch_size, last)
+            keys = [f'{JOURNAL_KEY}:{sequence}' for sequence in range(flushed_to + 1, upto + 1)]
+            found = self.cache.get_many(keys)
+
+            # a write can take its sequence number a moment before its journal
+            # entry lands, stop at the first gap and skip it if it is still
+            # there on the next flush (the entry expired)
+            missing = next(
+                (sequence for sequence, key in enumerate(keys, flushed_to + 1) if key not in found and sequence != gap),
+                None,
+            )
+            if missing is not None:
+                self.cache.set(GAP_KEY, missing, timeout=None)
+                upto = missing - 1
+                keys = keys[:upto - flushed_to]
+
+            if keys:
+                persisted += self.persist(set(found[key] for key in keys if key in found))
+                self.cache.delete_many(keys)
+            if upto == flushed_to:
+                break
+            flushed_to = upto
+            self.cache.set(FLUSHED_KEY, flushed_to, timeout=None)
+        return persisted
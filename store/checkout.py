@@ -0,0 +1,65 @@
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from store import counters, outbox, students
+from store.cache import bump_version
+from store.models import Cart, CartItem, Customer, EnrolledCourse, Order, OrderItem
+from store.progress import course_lessons
+
+
+def checkout(cart_id, user_id):
+    """
+      turns the cart into an unpaid order with one pending enrollment per
+      course and deletes the cart, all in one transaction.
+
+      The cart row is locked first, a second checkout of the same cart waits
+      for this one and then finds no cart.
+    """
+    with transaction.atomic():
+        if not Cart.objects.select_for_update().filter(id=cart_id).exists():
+            raise ValidationError({'cart_id': ['There is no cart with this cart id']})
+
+        cart_items = list(
+            CartItem.objects.filter(cart_id=cart_id).annotate(lessons_total=course_lessons())
+            .values_list('course_id', 'course__unit_price', 'course__teacher_id', 'lessons_total')
+        )
+        if not cart_items:
+            raise ValidationError({'cart_id': ['Your cart is empty, please add some courses']})
+
+        customer_id = Customer.objects.filter(user_id=user_id).values_list('id', flat=True).get()
+        order = Order.objects.create(
+            customer_id=customer_id,
+            total=sum(unit_price for _, unit_price, _, _ in cart_items),
+            items_count=len(cart_items),
+        )
+
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, course_id=course_id, unit_price=unit_price, teacher_id=teacher_id)
+            for course_id, unit_price, teacher_id, _ in cart_items
+        ])
+        # MySQL doesn't return the ids of bulk inserted rows
+        if order_items[0].pk is None:
+            order_items = OrderItem.objects.filter(order=order).only('id', 'course_id')
+
+        lessons = {course_id: lessons_total for course_id, _, _, lessons_total in cart_items}
+        EnrolledCourse.objects.bulk_create([
+            EnrolledCourse(
+                course_id=item.course_id,
+                lessons_total=lessons[item.course_id],
+                user_id=user_id,
+                student_id=user_id,
+                order_item_id=item.id,
+                status=EnrolledCourse.ENROLLMENT_STATUS_PENDING,
+            ) for item in order_items
+        ])
+        # bulk_create doesn't send post_save, the order totals and lessons_total are set above
+        counters.students_added(customer_id, [teacher_id for _, _, teacher_id, _ in cart_items], {'order_id': order.id})
+        students.forget_summaries([user_id])
+        # the order_created consumers run in runoutbox, after the response
+        outbox.publish('order_created', {'order_id': order.id, 'user_id': user_id})
+        transaction.on_commit(lambda: bump_version('courses', *[f'courses:{course_id}' for course_id, _, _, _ in cart_items]))
+
+        # the items are fast deleted with one DELETE by cart
+        Cart.objects.filter(id=cart_id).delete()
+        return order
+
@@ -0,0 +1,17 @@
+from django.core.checks import Tags, Warning, register
+
+from store.cache import get_cache, is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared(get_cache()):
+        return []
+    return [
+        Warning(
+            'STORE_CACHE_ALIAS points at a local memory cache, every process has its own.',
+            hint='Cache invalidations, unread notification counts and cached carts are not seen by the other '
+                 'processes. Point STORE_CACHE_ALIAS at a shared backend such as redis.',
+            id='store.W001',
+        )
+    ]
@@ -0,0 +1,35 @@
+from django.db import transaction
+
+from store import images, notifications
+from store.models import Order
+from store.outbox import consumer
+from store.signals import order_created
+
+
+@consumer('order_created')
+def send_order_created(payloads):
+    # the receivers of order_created used to run inside the checkout request
+    orders = Order.objects.in_bulk([payload['order_id'] for payload in payloads])
+    errors = []
+    for order in orders.values():
+        errors.extend(response for _, response in order_created.send_robust(Order, order=order) if isinstance(response, Exception))
+    # every receiver got its orders, a failure retries the batch
+    if errors:
+        raise errors[0]
+
+
+@consumer('order_paid')
+def notify_paid_orders(payloads):
+    with transaction.atomic():
+        notifications.orders_paid([payload['order_id'] for payload in payloads])
+
+
+@consumer('image_changed')
+def derive_changed_images(payloads):
+    ids = {}
+    for payload in payloads:
+        ids.setdefault(payload['model'], set()).add(payload['id'])
+    instances = []
+    for name, model_ids in ids.items():
+        instances.extend(images.IMAGE_MODELS[name].objects.filter(id__in=model_ids))
+    images.derive_images(images.image_pool(), instances)
@@ -0,0 +1,210 @@
+import math
+
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from store.models import PUBLISHED_COURSE, Comment, Course, Order, OrderItem, Teacher
+
+
+COUNTER_FIELDS = ['students_count', 'courses_count', 'reviews_count', 'rating_total', 'average_rating']
+
+
+def loaded_values(instance, *fields):
+    """
+      values of fields the instance had in the database before this save,
+      or None when they are unknown (a new instance or deferred fields)
+    """
+    values = getattr(instance, '_loaded_values', None)
+    if values is None or any(field not in values for field in fields):
+        return None
+    return values
+
+
+def students_added(customer_id, teacher_ids, new_items):
+    """
+      call after creating order items of customer_id for teacher_ids,
+      new_items are lookups matching the just created items (e.g. {'order_id': order.id}).
+      The customer is a new student only for teachers they never bought from before.
+
+      Two orders of the same customer racing for the same teacher can both
+      count them, reconcile_counters repairs that drift.
+    """
+    teacher_ids = set(teacher_ids)
+    if not teacher_ids:
+        return
+    known = OrderItem.objects.filter(teacher_id__in=teacher_ids, order__customer_id=customer_id) \
+        .exclude(**new_items).values_list('teacher_id', flat=True).distinct()
+    new_teachers = teacher_ids - set(known)
+    if new_teachers:
+        Teacher.objects.filter(id__in=new_teachers).update(students_count=F('students_count') + 1)
+
+
+def students_removed(customer_id, teacher_ids):
+    """
+      call after deleting order items of customer_id for teacher_ids
+    """
+    teacher_ids = set(teacher_ids)
+    if not teacher_ids:
+        return
+    remaining = OrderItem.objects.filter(teacher_id__in=teacher_ids, order__customer_id=customer_id) \
+        .values_list('teacher_id', flat=True).distinct()
+    lost_teachers = teacher_ids - set(remaining)
+    if lost_teachers:
+        Teacher.objects.filter(id__in=lost_teachers, students_count__gt=0).update(students_count=F('students_count') - 1)
+
+
+def courses_changed(teacher_id, delta):
+    teachers = Teacher.objects.filter(id=teacher_id)
+    if delta < 0:
+        teachers = teachers.filter(courses_count__gte=-delta)
+    teachers.update(courses_count=F('courses_count') + delta)
+
+
+def reviews_changed(teachers, count, rating):
+    """
+      adds count reviews with a rating sum of rating (both may be negative)
+      to the teachers queryset in one UPDATE.
+
+      average_rating has to be assigned first: MySQL evaluates SET from left
+      to right and would read the already incremented counters, the other
+      backends always read the old row.
+    """
+    if not count and not rating:
+        return
+    if count < 0:
+        teachers = teachers.filter(reviews_count__gte=-count)
+    teachers.update(
+        average_rating=Coalesce(
+            Cast(F('rating_total') + rating, FloatField()) / NullIf(F('reviews_count') + count, Value(0)),
+            Value(0.0),
+        ),
+        reviews_count=F('reviews_count') + count,
+        rating_total=F('rating_total') + rating,
+    )
+
+
+def order_item_saved(item, created):
+    old = loaded_values(item, 'teacher_id', 'order_id')
+    customer_id = item.order.customer_id
+    if created:
+        students_added(customer_id, [item.teacher_id], {'id': item.id})
+    elif old is not None and (old['teacher_id'], old['order_id']) != (item.teacher_id, item.order_id):
+        old_customer_id = customer_id
+        if old['order_id'] != item.order_id:
+            old_customer_id = Order.objects.filter(id=old['order_id']).values_list('customer_id', flat=True).first()
+        students_removed(old_customer_id, [old['teacher_id']])
+        students_added(customer_id, [item.teacher_id], {'id': item.id})
+
+
+def order_item_deleted(item):
+    students_removed(item.order.customer_id, [item.teacher_id])
+
+
+def course_saved(course, created):
+    old = loaded_values(course, 'teacher_id', 'platform_status', 'teacher_course_status')
+    if not created and old is None:
+        reconcile_teachers(Teacher.objects.filter(id=course.teacher_id))
+        return
+
+    was_published = not created and old['platform_status'] == 'Published' and old['teacher_course_status'] == 'Published'
+    old_teacher_id = course.teacher_id if created else old['teacher_id']
+
+    if old_teacher_id != course.teacher_id:
+        if was_published:
+            courses_changed(old_teacher_id, -1)
+        if course.is_published():
+            courses_changed(course.teacher_id, 1)
+        # the reviews of the course move to the new teacher
+        reviews = Comment.Approved.filter(course_id=course.id).aggregate(count=Count('id'), rating=Coalesce(Sum('rating'), 0))
+        reviews_changed(Teacher.objects.filter(id=old_teacher_id), -reviews['count'], -reviews['rating'])
+        reviews_changed(Teacher.objects.filter(id=course.teacher_id), reviews['count'], reviews['rating'])
+    elif was_published != course.is_published():
+        courses_changed(course.teacher_id, 1 if course.is_published() else -1)
+
+
+def course_deleted(course):
+    old = loaded_values(course, 'teacher_id', 'platform_status', 'teacher_course_status') or {}
+    if old.get('platform_status', course.platform_status) == 'Published' \
+            and old.get('teacher_course_status', course.teacher_course_status) == 'Published':
+        courses_changed(old.get('teacher_id', course.teacher_id), -1)
+
+
+def comment_saved(comment, created):
+    old = loaded_values(comment, 'course_id', 'status', 'rating')
+    if not created and old is None:
+        reconcile_teachers(Teacher.objects.filter(course=comment.course_id))
+        return
+
+    # (count, rating) to add per course
+    changes = {}
+    if not created and old['status'] == Comment.COMMENT_STATUS_APPROVED:
+        count, rating = changes.get(old['course_id'], (0, 0))
+        changes[old['course_id']] = (count - 1, rating - old['rating'])
+    if comment.is_approved():
+        count, rating = changes.get(comment.course_id, (0, 0))
+        changes[comment.course_id] = (count + 1, rating + comment.rating)
+
+    for course_id, (count, rating) in changes.items():
+        reviews_changed(Teacher.objects.filter(course=course_id), count, rating)
+
+
+def comment_deleted(comment):
+    old = loaded_values(comment, 'course_id', 'status', 'rating') or {}
+    if old.get('status', comment.status) == Comment.COMMENT_STATUS_APPROVED:
+        reviews_changed(
+            Teacher.objects.filter(course=old.get('course_id', comment.course_id)),
+            -1,
+            -old.get('rating', comment.rating),
+        )
+
+
+def reconcile_teachers(teachers=None, chunk_size=1000):
+    """
+      recomputes the counters of teachers (all by default) from the source
+      tables, chunk_size teachers at a time, and returns how many of them
+      had drifted
+    """
+    teachers = (teachers if teachers is not None else Teacher.objects.all()).order_by('id').only('id', *COUNTER_FIELDS)
+    drifted = 0
+    last_id = 0
+    while True:
+        chunk = list(teachers.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return drifted
+        last_id = chunk[-1].id
+        ids = [teacher.id for teacher in chunk]
+
+        students = dict(
+            OrderItem.objects.filter(teacher_id__in=ids).order_by().values('teacher_id')
+            .annotate(count=Count('order__customer_id', distinct=True)).values_list('teacher_id', 'count')
+        )
+        courses = dict(
+            Course.objects.filter(PUBLISHED_COURSE, teacher_id__in=ids).order_by().values('teacher_id')
+            .annotate(count=Count('id')).values_list('teacher_id', 'count')
+        )
+        reviews = {
+            row['course__teacher_id']: row
+            for row in Comment.Approved.filter(course__teacher_id__in=ids).order_by().values('course__teacher_id')
+            .annotate(count=Count('id'), rating=Sum('rating'))
+        }
+
+        changed = []
+        for teacher in chunk:
+            review = reviews.get(teacher.id, {'count': 0, 'rating': 0})
+            values = {
+                'students_count': students.get(teacher.id, 0),
+                'courses_count': courses.get(teacher.id, 0),
+                'reviews_count': review['count'],
+                'rating_total': review['rating'],
+                'average_rating': review['rating'] / review['count'] if review['count'] else 0.0,
+            }
+            if any(
+                not math.isclose(getattr(teacher, name), value) if name == 'average_rating' else getattr(teacher, name) != value
+                for name, value in values.items()
+            ):
+                for name, value in values.items():
+                    setattr(teacher, name, value)
+                changed.append(teacher)
+
+        Teacher.objects.bulk_update(changed, COUNTER_FIELDS)
+        drifted += len(changed)
@@ -0,0 +1,444 @@
+"""
+  high volume fake data for load tests.
+
+  every row is computed from (seed, primary key) only, so a table can be
+  split into id ranges that are generated and inserted by any number of
+  processes and the result is always the same dataset. Foreign keys are
+  derived with the same arithmetic instead of being looked up.
+"""
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from faker import Faker
+
+from core.models import CustomUser
+from store.models import Category, Comment, CompletedLesson, Course, Customer, EnrolledCourse, Notification, Order, OrderItem, Teacher, Variant, VariantItem
+
+
+FAKE_USERNAME_PREFIX = 'fake_'
+
+# rows generated at scale 1, --scale multiplies them
+BASE_COUNTS = {
+    'users': 2000,
+    'teachers': 100,
+    'categories': 20,
+    'courses': 1000,
+    'orders': 4000,
+}
+
+DATES_START = datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+DATES_SPAN = 2 * 365 * 24 * 3600
+
+
+class Plan:
+    """
+      sizes of the dataset plus the shared text pools, it is pickled and
+      sent to the worker processes
+    """
+
+    def __init__(self, seed=42, scale=1.0, variants_per_course=3, lectures_per_variant=4,
+                 items_per_order=2, comments_per_course=3, max_completed_lessons=4,
+                 paid_ratio=0.8, password='password', batch_size=5000, user_id_offset=0, **counts):
+        self.seed = seed
+        for name, base in BASE_COUNTS.items():
+            value = counts.get(name)
+            setattr(self, name, max(1, int(value if value is not None else base * scale)))
+        self.teachers = min(self.teachers, self.users)
+        self.variants_per_course = variants_per_course
+        self.lectures_per_variant = lectures_per_variant
+        self.items_per_order = min(items_per_order, self.courses)
+        self.comments_per_course = comments_per_course
+        self.max_completed_lessons = max_completed_lessons
+        self.paid_ratio = paid_ratio
+        self.batch_size = batch_size
+        self.user_id_offset = user_id_offset
+        self.password_hash = make_password(password)
+
+        faker = Faker()
+        Faker.seed(seed)
+        self.names = [faker.name() for _ in range(500)]
+        self.titles = [faker.sentence(nb_words=4).rstrip('.') for _ in range(500)]
+        self.words = [faker.word() for _ in range(200)]
+        self.paragraphs = [faker.paragraph(nb_sentences=3) for _ in range(200)]
+        self.countries = [faker.country() for _ in range(50)]
+
+    @property
+    def variants(self):
+        return self.courses * self.variants_per_course
+
+    @property
+    def lectures(self):
+        return self.variants * self.lectures_per_variant
+
+    @property
+    def order_items(self):
+        return self.orders * self.items_per_order
+
+    @property
+    def comments(self):
+        return self.courses * self.comments_per_course
+
+    def pick(self, salt, key, n):
+        # Knuth multiplicative hash, cheap and stable across processes
+        return (key * 2654435761 + self.seed * 40503 + salt * 97) % 4294967296 % n
+
+    def choice(self, pool, salt, key):
+        return pool[self.pick(salt, key, len(pool))]
+
+    def date(self, salt, key):
+        return DATES_START + timedelta(seconds=self.pick(salt, key, DATES_SPAN))
+
+    def user_id(self, number):
+        return self.user_id_offset + number
+
+    def course_teacher(self, course_id):
+        return 1 + self.pick(2, course_id, self.teachers)
+
+    def course_price(self, course_id):
+        return Decimal(5 + self.pick(3, course_id, 195)) + Decimal('0.99')
+
+    def order_customer(self, order_id):
+        return 1 + self.pick(5, order_id, self.users)
+
+    def order_is_paid(self, order_id):
+        return self.pick(6, order_id, 1000) < self.paid_ratio * 1000
+
+    def order_item_course(self, order_item_id):
+        order_id, position = divmod(order_item_id - 1, self.items_per_order)
+        first = self.pick(7, order_id + 1, self.courses)
+        return 1 + (first + position) % self.courses
+
+    def order_item_order(self, order_item_id):
+        return 1 + (order_item_id - 1) // self.items_per_order
+
+    def course_lectures(self, course_id):
+        first_variant = (course_id - 1) * self.variants_per_course + 1
+        first_lecture = (first_variant - 1) * self.lectures_per_variant + 1
+        return range(first_lecture, first_lecture + self.variants_per_course * self.lectures_per_variant)
+
+
+def build_users(plan, start, stop):
+    return [
+        CustomUser(
+            id=plan.user_id(i),
+            username=f'{FAKE_USERNAME_PREFIX}{plan.seed}_{i}',
+            email=f'{FAKE_USERNAME_PREFIX}{plan.seed}_{i}@example.com',
+            first_name=plan.choice(plan.names, 10, i).split(' ')[0],
+            last_name=plan.choice(plan.names, 11, i).split(' ')[-1],
+            password=plan.password_hash,
+        ) for i in range(start, stop)
+    ]
+
+
+def build_customers(plan, start, stop):
+    return [
+        Customer(
+            id=i,
+            user_id=plan.user_id(i),
+            phone_number=f'0912{plan.pick(12, i, 10 ** 7):07d}',
+            country=plan.choice(plan.countries, 13, i),
+        ) for i in range(start, stop)
+    ]
+
+
+def build_teachers(plan, start, stop):
+    return [
+        Teacher(
+            id=i,
+            user_id=plan.user_id(i),
+            full_name=plan.choice(plan.names, 14, i),
+            bio=plan.choice(plan.titles, 15, i),
+            about=plan.choice(plan.paragraphs, 16, i),
+            country=plan.choice(plan.countries, 17, i),
+        ) for i in range(start, stop)
+    ]
+
+
+def build_categories(plan, start, stop):
+    return [
+        Category(id=i, title=f'{plan.choice(plan.words, 18, i).title()} {i}', slug=f'category-{i}')
+        for i in range(start, stop)
+    ]
+
+
+def build_courses(plan, start, stop):
+    courses = []
+    for i in range(start, stop):
+        published = plan.pick(19, i, 10) > 0
+        courses.append(Course(
+            id=i,
+            name=f'{plan.choice(plan.titles, 20, i)} {i}',
+            slug=f'course-{i}',
+            description=plan.choice(plan.paragraphs, 21, i),
+            unit_price=plan.course_price(i),
+            category_id=1 + plan.pick(1, i, plan.categories),
+            teacher_id=plan.course_teacher(i),
+            language=plan.choice(['english', 'Spanish', 'French'], 22, i),
+            level=plan.choice(['Beginner', 'Intermediate', 'Advanced'], 23, i),
+            platform_status='Published' if published else 'Draft',
+            teacher_course_status='Published' if published else 'Draft',
+            featured=plan.pick(24, i, 20) == 0,
+            datetime_created=plan.date(25, i),
+        ))
+    return courses
+
+
+def build_variants(plan, start, stop):
+    return [
+        Variant(
+            id=i,
+            course_id=1 + (i - 1) // plan.variants_per_course,
+            title=plan.choice(plan.titles, 26, i),
+            date=plan.date(27, i),
+        ) for i in range(start, stop)
+    ]
+
+
+def build_lectures(plan, start, stop):
+    lectures = []
+    for i in range(start, stop):
+        seconds = 60 + plan.pick(28, i, 3600)
+        lectures.append(VariantItem(
+            id=i,
+            variant_id=1 + (i - 1) // plan.lectures_per_variant,
+            title=plan.choice(plan.titles, 29, i),
+            description=plan.choice(plan.paragraphs, 30, i),
+            file=f'course_file/fake/{i}.mp4',
+            duration=timedelta(seconds=seconds),
+            content_duration=f'{seconds // 60} m {seconds % 60} s',
+            preview=plan.pick(31, i, 10) == 0,
+            date=plan.date(32, i),
+        ))
+    return lectures
+
+
+def build_orders(plan, start, stop):
+    return [
+        Order(
+            id=i,
+            customer_id=plan.order_customer(i),
+            status=Order.ORDER_STATUS_PAID if plan.order_is_paid(i) else Order.ORDER_STATUS_UNPAID,
+            datetime_created=plan.date(33, i),
+        ) for i in range(start, stop)
+    ]
+
+
+def build_order_items(plan, start, stop):
+    items = []
+    for i in range(start, stop):
+        course_id = plan.order_item_course(i)
+        items.append(OrderItem(
+            id=i,
+            order_id=plan.order_item_order(i),
+            course_id=course_id,
+            teacher_id=plan.course_teacher(course_id),
+            unit_price=plan.course_price(course_id),
+        ))
+    return items
+
+
+def build_enrollments(plan, start, stop):
+    # one enrollment per paid order item, sharing its primary key
+    enrollments = []
+    for i in range(start, stop):
+        order_id = plan.order_item_order(i)
+        if not plan.order_is_paid(order_id):
+            continue
+        user_id = plan.user_id(plan.order_customer(order_id))
+        enrollments.append(EnrolledCourse(
+            id=i,
+            course_id=plan.order_item_course(i),
+            user_id=user_id,
+            student_id=user_id,
+            order_item_id=i,
+            date=plan.date(33, order_id),
+        ))
+    return enrollments
+
+
+def build_completed_lessons(plan, start, stop):
+    lessons = []
+    for enrollment in build_enrollments(plan, start, stop):
+        lectures = plan.course_lectures(enrollment.course_id)
+        completed = plan.pick(34, enrollment.id, plan.max_completed_lessons + 1)
+        for lecture_id in lectures[:completed]:
+            lessons.append(CompletedLesson(
+                course_id=enrollment.course_id,
+                user_id=enrollment.user_id,
+                variant_item_id=lecture_id,
+                date=enrollment.date + timedelta(days=1 + plan.pick(35, lecture_id, 60)),
+            ))
+    return lessons
+
+
+def build_comments(plan, start, stop):
+    comments = []
+    statuses = [Comment.COMMENT_STATUS_APPROVED] * 7 + [Comment.COMMENT_STATUS_WAITING] * 2 + [Comment.COMMENT_STATUS_NOT_APPROVED]
+    for i in range(start, stop):
+        comments.append(Comment(
+            id=i,
+            course_id=1 + (i - 1) // plan.comments_per_course,
+            name=plan.choice(plan.names, 36, i),
+            body=plan.choice(plan.paragraphs, 37, i),
+            rating=1 + plan.pick(38, i, 5),
+            status=plan.choice(statuses, 39, i),
+            datetime_created=plan.date(40, i),
+        ))
+    return comments
+
+
+def build_order_notifications(plan, start, stop):
+    notifications = []
+    for i in range(start, stop):
+        order_id = plan.order_item_order(i)
+        teacher_id = plan.course_teacher(plan.order_item_course(i))
+        notifications.append(Notification(
+            user_id=plan.user_id(teacher_id),
+            teacher_id=teacher_id,
+            order_id=order_id,
+            order_item_id=i,
+            type='New Order',
+            seen=plan.pick(41, i, 2) == 0,
+            date=plan.date(33, order_id),
+        ))
+    return notifications
+
+
+def build_review_notifications(plan, start, stop):
+    notifications = []
+    for i in range(start, stop):
+        teacher_id = plan.course_teacher(1 + (i - 1) // plan.comments_per_course)
+        notifications.append(Notification(
+            user_id=plan.user_id(teacher_id),
+            teacher_id=teacher_id,
+            review_id=i,
+            type='New Review',
+            seen=plan.pick(42, i, 2) == 0,
+            date=plan.date(40, i),
+        ))
+    return notifications
+
+
+# (name, model, number of source ids, builder) in insertion order
+TABLES = [
+    ('users', CustomUser, lambda plan: plan.users, build_users),
+    ('customers', Customer, lambda plan: plan.users, build_customers),
+    ('teachers', Teacher, lambda plan: plan.teachers, build_teachers),
+    ('categories', Category, lambda plan: plan.categories, build_categories),
+    ('courses', Course, lambda plan: plan.courses, build_courses),
+    ('variants', Variant, lambda plan: plan.variants, build_variants),
+    ('lectures', VariantItem, lambda plan: plan.lectures, build_lectures),
+    ('orders', Order, lambda plan: plan.orders, build_orders),
+    ('order items', OrderItem, lambda plan: plan.order_items, build_order_items),
+    ('enrollments', EnrolledCourse, lambda plan: plan.order_items, build_enrollments),
+    ('completed lessons', CompletedLesson, lambda plan: plan.order_items, build_completed_lessons),
+    ('comments', Comment, lambda plan: plan.comments, build_comments),
+    ('order notifications', Notification, lambda plan: plan.order_items, build_order_notifications),
+    ('review notifications', Notification, lambda plan: plan.comments, build_review_notifications),
+]
+BUILDERS = {name: (model, builder) for name, model, _, builder in TABLES}
+
+
+@contextmanager
+def historical_dates():
+    """
+      bulk_create() runs pre_save(), which replaces auto_now_add values with
+      the current time. Switch it off so the generated dates are kept.
+    """
+    fields = [
+        field for model in (Course, Order, Comment) for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def insert_chunk(task):
+    name, start, stop, plan = task
+    model, builder = BUILDERS[name]
+    objects = builder(plan, start, stop)
+    with transaction.atomic(), historical_dates():
+        model.objects.bulk_create(objects, batch_size=min(plan.batch_size, 1000))
+    return len(objects)
+
+
+def init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def chunks(name, total, plan):
+    for start in range(1, total + 1, plan.batch_size):
+        yield name, start, min(start + plan.batch_size, total + 1), plan
+
+
+def generate(plan, processes=1, log=None):
+    """
+      inserts the whole dataset described by plan, table by table, spreading
+      the chunks of each table over `processes` worker processes
+    """
+    totals = {}
+    pool = None
+    if processes > 1:
+        # the workers must open their own database connections
+        connections.close_all()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        pool = context.Pool(processes, initializer=init_worker)
+
+    try:
+        for name, model, count, _ in TABLES:
+            tasks = chunks(name, count(plan), plan)
+            if pool is None:
+                inserted = sum(insert_chunk(task) for task in tasks)
+            else:
+                inserted = sum(pool.imap_unordered(insert_chunk, tasks))
+            totals[name] = inserted
+            if log:
+                log(f'{name}: {inserted} rows')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    reset_sequences()
+    return totals
+
+
+def reset_sequences():
+    # explicit primary keys don't advance sequences on every backend (PostgreSQL)
+    models = {model for _, model, _, _ in TABLES}
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def flush(models):
+    """
+      empties the given tables and removes previously generated users
+    """
+    tables = [model._meta.db_table for model in models]
+    connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables, reset_sequences=True, allow_cascade=True))
+
+    CustomUser.objects.filter(username__startswith=FAKE_USERNAME_PREFIX).delete()
+
+
+def create_missing_customers():
+    # real users lose their profile when the customer table is flushed
+    Customer.objects.bulk_create(
+        [Customer(user_id=user_id) for user_id in CustomUser.objects.filter(customer__isnull=True).values_list('id', flat=True)],
+        batch_size=1000,
+    )
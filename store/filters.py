@@ -1,15 +1,47 @@
-from django_filters.rest_framework import FilterSet
+from django_filters.rest_framework import CharFilter, FilterSet
+from rest_framework.filters import SearchFilter
 
-from .models import Course
+from .models import Course, CourseSearchTerm, Order
+from .search import search_courses
 
 class CourseFilter(FilterSet):
+    # served by the search index, they match words starting with the given text
+    name__icontains = CharFilter(method='search_field')
+    description__icontains = CharFilter(method='search_field')
+
     class Meta:
         model = Course
         fields = {
-            'name': ['icontains'],
-            'description': ['icontains'],
             'unit_price': ['exact', 'lt', 'gt'],
             'teacher': ['exact'],
             'language': ['exact'],
             'level': ['exact'],
         }
+
+    def search_field(self, queryset, name, value):
+        field = CourseSearchTerm.FIELD_NAME if name.startswith('name') else CourseSearchTerm.FIELD_DESCRIPTION
+        return search_courses(queryset, value, fields=[field])
+
+
+class OrderFilter(FilterSet):
+    class Meta:
+        model = Order
+        fields = {
+            'status': ['exact'],
+            'total': ['exact', 'lt', 'gt', 'lte', 'gte'],
+            'items_count': ['exact', 'gte'],
+            'datetime_created': ['date', 'gte', 'lt'],
+        }
+
+
+class CourseSearchFilter(SearchFilter):
+    """
+      ?search= over course name, description, category title and teacher
+      name using the search index, best matches first
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_courses(queryset, ' '.join(terms))
@@ -0,0 +1,166 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from store.cache import bump_version
+from store.counters import loaded_values
+from store.models import Category, Course, Customer, Teacher
+from store.outbox import publish
+
+
+# payload name -> model with an image and an image_hash field
+IMAGE_MODELS = {
+    'category': Category,
+    'course': Course,
+    'customer': Customer,
+    'teacher': Teacher,
+}
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_pool = None
+
+
+def sizes():
+    # name: largest width and height
+    return getattr(settings, 'STORE_IMAGE_SIZES', {'small': 320, 'medium': 768, 'large': 1440})
+
+
+def formats():
+    return getattr(settings, 'STORE_IMAGE_FORMATS', ('webp', 'jpeg'))
+
+
+def image_pool():
+    """
+      the process pool of the runoutbox consumers, started on first use
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'STORE_IMAGE_PROCESSES', None))
+    return _pool
+
+
+def derived_name(image_hash, size, image_format):
+    return f'derived/{image_hash[:2]}/{image_hash}-{size}.{EXTENSIONS[image_format]}'
+
+
+def image_urls(image_hash):
+    if not image_hash:
+        return None
+    return {
+        size: {image_format: default_storage.url(derived_name(image_hash, size, image_format)) for image_format in formats()}
+        for size in sizes()
+    }
+
+
+def derive(path, root, widths, image_formats):
+    """
+      runs inside the worker processes: hashes the image at path and writes
+      the derivatives of that hash under root that don't exist yet, so an
+      image that was processed before is only read once. Returns the hash.
+    """
+    from PIL import Image, ImageOps
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(data)
+    image_hash = digest.hexdigest()
+
+    missing = [
+        (width, image_format, os.path.join(root, derived_name(image_hash, size, image_format)))
+        for size, width in widths.items() for image_format in image_formats
+    ]
+    missing = [target for target in missing if not os.path.exists(target[2])]
+    if not missing:
+        return image_hash
+
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        for width, image_format, target in missing:
+            derivative = image.copy()
+            derivative.thumbnail((width, width), Image.Resampling.LANCZOS)
+            if image_format == 'jpeg' or not transparent:
+                derivative = derivative.convert('RGB')
+            else:
+                derivative = derivative.convert('RGBA')
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # another process may be writing the same hash, the last rename wins
+            temporary = f'{target}.{os.getpid()}.tmp'
+            derivative.save(temporary, format=image_format.upper(), quality=82, optimize=True)
+            os.replace(temporary, target)
+    return image_hash
+
+
+def forget_responses(model, ids):
+    """
+      invalidates the cached responses showing the images of model. This
+      runs in runoutbox, with a local cache the web workers only see the
+      bump once their versions expire (store.cache.version_timeout). No
+      cached response shows customers.
+    """
+    if model is Teacher:
+        ids = Course.objects.filter(teacher_id__in=ids).values_list('id', flat=True)
+        model = Course
+    if model is Course:
+        bump_version('courses', *(f'courses:{id}' for id in ids))
+    elif model is Category:
+        bump_version('categories', 'category-tree', *(f'categories:{id}' for id in ids))
+
+
+def derive_images(pool, instances, log=None):
+    """
+      derives the images of instances in the pool and stores their hashes.
+      Instances with the same file are processed once, a file that is
+      missing or isn't an image is skipped. Returns the number of rows
+      updated.
+    """
+    root = default_storage.path('')
+    futures = {}
+    paths = {}
+    for instance in instances:
+        if not instance.image or not os.path.exists(instance.image.path):
+            continue
+        paths.setdefault(instance.image.path, []).append(instance)
+    for path, same_file in paths.items():
+        futures[pool.submit(derive, path, root, sizes(), formats())] = same_file
+
+    updated = 0
+    for future in as_completed(futures):
+        same_file = futures[future]
+        try:
+            image_hash = future.result()
+        except Exception as error:
+            if log:
+                log(f'{same_file[0].image.name}: {error!r}')
+            continue
+        ids = {}
+        for instance in same_file:
+            instance.image_hash = image_hash
+            ids.setdefault(type(instance), []).append(instance.id)
+        for model, model_ids in ids.items():
+            # rows whose image was replaced in the meantime are left alone
+            updated += model.objects.filter(id__in=model_ids, image=same_file[0].image.name).update(image_hash=image_hash)
+            forget_responses(model, model_ids)
+    return updated
+
+
+def image_saved(instance, created):
+    """
+      queues a new or replaced image for the image_changed consumer
+      (store.consumers), which derives it in image_pool()
+    """
+    values = loaded_values(instance, 'image')
+    if not created and values is not None and (values['image'] or '') == str(instance.image or ''):
+        return
+    if instance.image_hash:
+        # the derivatives of the old image
+        type(instance).objects.filter(id=instance.id).update(image_hash='')
+        instance.image_hash = ''
+    if instance.image:
+        name = next(name for name, model in IMAGE_MODELS.items() if isinstance(instance, model))
+        publish('image_changed', {'model': name, 'id': instance.id})
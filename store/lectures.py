@@ -0,0 +1,152 @@
+import io
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+
+from core.models import CustomUser
+from store.models import EnrolledCourse, VariantItem
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange(io.RawIOBase):
+    """
+      bytes start..start+length of a file as a file of its own. FileResponse
+      takes its Content-Length from seek()/tell() and the wsgi.file_wrapper
+      sendfile()s from the descriptor's position, so the range goes out
+      without passing through Python when the server supports it.
+    """
+    def __init__(self, file, start, length):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.name = file.name
+        self.file.seek(start)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self.file.seek(self.start + min(max(offset, 0), self.length))
+        return self.tell()
+
+    def read(self, size=-1):
+        remaining = self.length - self.tell()
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def lecture(variant_item_id):
+    try:
+        return VariantItem.objects.select_related('variant__course__teacher').only(
+            'id', 'file', 'preview', 'variant__course__id', 'variant__course__teacher__user_id',
+        ).get(id=variant_item_id)
+    except VariantItem.DoesNotExist:
+        raise Http404('Lecture not found.')
+
+
+def can_watch(user_id, item):
+    """
+      previews are public, the rest is for students with an active
+      enrollment, the course's teacher and staff
+    """
+    if item.preview:
+        return True
+    if user_id is None:
+        return False
+    course = item.variant.course
+    return course.teacher.user_id == user_id or EnrolledCourse.objects.filter(
+        course_id=course.id, user_id=user_id, status=EnrolledCourse.ENROLLMENT_STATUS_ACTIVE,
+    ).exists() or CustomUser.objects.filter(id=user_id, is_staff=True).exists()
+
+
+def parse_range(header, size):
+    """
+      (start, end) of a single `bytes=` range, None to send the whole file
+      (no header, several ranges or another unit). Raises ValueError when
+      the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # the last `last` bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def delivery():
+    return getattr(settings, 'STORE_MEDIA_DELIVERY', 'django')
+
+
+def lecture_response(item, range_header=None):
+    """
+      the lecture file of item. With STORE_MEDIA_DELIVERY = 'x-accel-redirect'
+      or 'x-sendfile' the web server reads the file and answers Range
+      requests itself, otherwise a FileResponse of the requested range.
+    """
+    if not item.file:
+        raise Http404('The lecture has no file.')
+
+    mode = delivery()
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=mimetypes.guess_type(item.file.name)[0] or 'application/octet-stream')
+        if mode == 'x-accel-redirect':
+            prefix = getattr(settings, 'STORE_MEDIA_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(item.file.name)
+        else:
+            response['X-Sendfile'] = item.file.path
+        return response
+
+    try:
+        file = open(item.file.path, 'rb')
+    except FileNotFoundError:
+        raise Http404('The lecture has no file.')
+    size = os.fstat(file.fileno()).st_size
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    filename = os.path.basename(item.file.name)
+    if byte_range is None:
+        response = FileResponse(file, filename=filename)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), filename=filename, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
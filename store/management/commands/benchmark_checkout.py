@@ -0,0 +1,166 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.exceptions import ValidationError
+
+from store import counters
+from store.checkout import checkout
+from store.management.commands.benchmark_endpoints import SCALES, percentile, seed
+from store.models import Cart, CartItem, Course, Customer, EnrolledCourse, Order, OrderItem
+
+
+def legacy_checkout(cart_id, user_id):
+    """
+      the checkout OrderCreateSerializer did before store.checkout, kept to
+      compare against
+    """
+    if not Cart.objects.filter(id=cart_id).exists():
+        raise ValidationError('There is no cart with this cart id')
+    if CartItem.objects.filter(cart_id=cart_id).count() == 0:
+        raise ValidationError('Your cart is empty, please add some courses')
+
+    with transaction.atomic():
+        customer = Customer.objects.get(user_id=user_id)
+        order = Order()
+        order.customer = customer
+        order.save()
+
+        cart_items = CartItem.objects.select_related('course').filter(cart_id=cart_id)
+        order_items = [
+            OrderItem(
+                order=order,
+                course=cart_item.course,
+                unit_price=cart_item.course.unit_price,
+                teacher=cart_item.course.teacher,
+            ) for cart_item in cart_items
+        ]
+        OrderItem.objects.bulk_create(order_items)
+        counters.students_added(customer.id, [item.teacher_id for item in order_items], {'order_id': order.id})
+
+        Cart.objects.get(id=cart_id).delete()
+        return order
+
+
+PATHS = {
+    'legacy': legacy_checkout,
+    'pipeline': checkout,
+}
+
+
+def fill_carts(count, items, course_ids):
+    carts = Cart.objects.bulk_create([Cart() for _ in range(count)])
+    CartItem.objects.bulk_create([
+        CartItem(cart_id=cart.id, course_id=course_ids[(index * items + offset) % len(course_ids)])
+        for index, cart in enumerate(carts) for offset in range(items)
+    ])
+    return [cart.id for cart in carts]
+
+
+class Command(BaseCommand):
+    help = "Compares query count and latency of the old and the new checkout, and checks out one cart in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES.keys(), default='1k',
+                            help='Number of courses and enrollments to seed')
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Checkouts per path')
+        parser.add_argument('--items', type=int, default=5,
+                            help='Courses per cart')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Parallel checkouts of the same cart')
+        parser.add_argument('--output', default='checkout-report.json',
+                            help='Where to write the JSON report')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded test database between runs')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = settings.DATABASES['default']['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not Course.objects.exists():
+                self.stdout.write(f'Seeding {options["scale"]} courses and enrollments...')
+                seed(SCALES[options['scale']])
+
+            user_id = Customer.objects.order_by('id').values_list('user_id', flat=True).first()
+            course_ids = list(Course.objects.order_by('id').values_list('id', flat=True)[:options['items'] * 10])
+
+            report = {'database': connection.vendor, 'scale': options['scale'], 'items': options['items'], 'paths': {}}
+            for name, path in PATHS.items():
+                report['paths'][name] = self.measure(path, fill_carts(options['iterations'], options['items'], course_ids), user_id)
+                result = report['paths'][name]
+                self.stdout.write(f'{name}: {result["queries"]} queries, p50 {result["p50_ms"]}ms, p95 {result["p95_ms"]}ms')
+
+            report['concurrency'] = self.race(options['threads'], options['items'], course_ids, user_id)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+
+    def measure(self, path, cart_ids, user_id):
+        timings = []
+        queries = 0
+        for cart_id in cart_ids:
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                path(cart_id, user_id)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(context))
+        return {
+            'queries': queries,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+        }
+
+    def race(self, threads, items, course_ids, user_id):
+        """
+          every thread checks out the same cart, exactly one may get an order
+        """
+        if not connection.features.has_select_for_update:
+            self.stdout.write(f'concurrency: skipped, {connection.vendor} has no SELECT ... FOR UPDATE')
+            return None
+
+        [cart_id] = fill_carts(1, items, course_ids)
+        orders_before = Order.objects.count()
+        enrollments_before = EnrolledCourse.objects.count()
+        barrier = threading.Barrier(threads)
+        results = []
+
+        def run():
+            try:
+                barrier.wait()
+                checkout(cart_id, user_id)
+                results.append('ordered')
+            except ValidationError:
+                results.append('rejected')
+            except Exception as error:
+                results.append(f'error: {error}')
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        result = {
+            'threads': threads,
+            'ordered': results.count('ordered'),
+            'rejected': results.count('rejected'),
+            'errors': [result for result in results if result.startswith('error')],
+            'orders_created': Order.objects.count() - orders_before,
+            'enrollments_created': EnrolledCourse.objects.count() - enrollments_before,
+        }
+        self.stdout.write(f'concurrency: {result["ordered"]} ordered, {result["rejected"]} rejected, {len(result["errors"])} errors')
+        if result['ordered'] != 1 or result['orders_created'] != 1 or result['enrollments_created'] != items or result['errors']:
+            raise CommandError(f'Parallel checkouts of one cart went wrong: {result}')
+        return result
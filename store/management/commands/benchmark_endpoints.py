@@ -0,0 +1,331 @@
+import json
+import math
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import URLResolver, get_resolver, reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import CustomUser
+from store.counters import reconcile_teachers
+from store.management.commands.runfakezarinpal import make_server
+from store.orders import reconcile_orders
+from store.progress import reconcile_progress
+from store.questions import reconcile_questions
+from store.datagen import Plan, generate
+from store.sales import rebuild_rollups
+from store.search import rebuild_index
+from store.models import Cart, CartItem, Category, Comment, Course, MediaJob, Order, OrderItem, Question_Answer, Question_Answer_Message, UploadSession, VariantItem
+
+
+SCALES = {
+    '1k': 1_000,
+    '10k': 10_000,
+    '100k': 100_000,
+}
+
+BUDGETS_FILE = Path(__file__).resolve().parents[2] / 'benchmarks' / 'budgets.json'
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+BATCH_SIZE = 1000
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def discover_routes():
+    """
+      names of every route in store/urls.py and the djoser urls, the
+      format suffix duplicates of a route share its name
+    """
+    routes = []
+
+    def walk(patterns, namespace, include):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                module = getattr(pattern.urlconf_name, '__name__', '')
+                walk(
+                    pattern.url_patterns,
+                    pattern.namespace or namespace,
+                    include or module == 'store.urls' or module.startswith('djoser.urls'),
+                )
+            elif include and pattern.name:
+                name = f'{namespace}:{pattern.name}' if namespace else pattern.name
+                if name not in routes:
+                    routes.append(name)
+
+    walk(get_resolver().url_patterns, None, False)
+    return routes
+
+
+def seed(size):
+    """
+      fills the empty test database with `size` courses and `size` enrollments
+    """
+    plan = Plan(
+        users=max(size // 10, 10),
+        teachers=max(size // 100, 1),
+        categories=max(size // 100, 1),
+        courses=size,
+        orders=size,
+        items_per_order=1,
+        variants_per_course=2,
+        lectures_per_variant=2,
+        comments_per_course=1,
+        paid_ratio=1.0,
+        password=BENCHMARK_PASSWORD,
+    )
+    generate(plan)
+    reconcile_teachers()
+    reconcile_orders()
+    reconcile_progress()
+    rebuild_rollups()
+    rebuild_index()
+    CustomUser.objects.filter(id=plan.user_id(1)).update(is_staff=True)
+
+    MediaJob.objects.bulk_create([MediaJob(variant_item_id=i) for i in range(1, size // 100 + 2)])
+    carts = Cart.objects.bulk_create([Cart() for _ in range(max(size // 10, 1))], batch_size=BATCH_SIZE)
+    CartItem.objects.bulk_create(
+        [CartItem(cart_id=cart.id, course_id=1 + (i * 2 + offset) % size) for i, cart in enumerate(carts) for offset in range(2)],
+        batch_size=BATCH_SIZE,
+    )
+
+    # a few busy Q&A threads on the first courses
+    questions = Question_Answer.objects.bulk_create(
+        [Question_Answer(course_id=1 + i % 10, user_id=plan.user_id(1 + i % plan.users), title=f'Question {i}') for i in range(max(size // 10, 1))],
+        batch_size=BATCH_SIZE,
+    )
+    Question_Answer_Message.objects.bulk_create(
+        [
+            Question_Answer_Message(course_id=question.course_id, question_id=question.id, user_id=plan.user_id(1 + offset % plan.users), message=f'Reply {offset}')
+            for question in questions for offset in range(20)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    reconcile_questions()
+
+
+def sample_values(gateway):
+    """
+      ids and objects the budgets refer to as `$name`. Every seeded order is
+      paid, an unpaid one is added to pay and one paid at the fake `gateway`
+      to verify.
+    """
+    order = Order.objects.select_related('customer__user').order_by('id').first()
+    user = order.customer.user
+    cart_item = CartItem.objects.order_by('id').first()
+    question = Question_Answer.objects.order_by('id').first()
+    refresh = RefreshToken.for_user(user)
+    staff = CustomUser.objects.get(is_staff=True)
+    upload, _ = UploadSession.objects.get_or_create(
+        user=staff, target=UploadSession.TARGET_LECTURE_FILE, target_id=VariantItem.objects.order_by('id').values_list('id', flat=True).first(),
+        defaults={'filename': 'lecture.mp4', 'size': 1024 ** 3},
+    )
+    unpaid_order = Order.objects.create(customer_id=order.customer_id, total=order.total)
+    authority = gateway.request({'Amount': int(order.total)})['Authority']
+    gateway.payments[authority]['paid'] = True
+    Order.objects.create(customer_id=order.customer_id, total=order.total, zarinpal_authority=authority)
+    return {
+        'course': Course.objects.order_by('id').values_list('id', flat=True).first(),
+        'category': Category.objects.order_by('id').values_list('id', flat=True).first(),
+        'comment': Comment.objects.order_by('id').values_list('id', flat=True).first(),
+        'media_job': MediaJob.objects.order_by('id').values_list('id', flat=True).first(),
+        'cart': str(cart_item.cart_id),
+        'cart_item': cart_item.id,
+        'comment_course': Comment.objects.order_by('id').values_list('course_id', flat=True).first(),
+        'question': question.id,
+        'question_course': question.course_id,
+        'customer': order.customer_id,
+        'teacher': OrderItem.objects.filter(order__status=Order.ORDER_STATUS_PAID).order_by('id').values_list('teacher_id', flat=True).first(),
+        'order': order.id,
+        'unpaid_order': unpaid_order.id,
+        'authority': authority,
+        'user': user.id,
+        'user_ids': ','.join(str(user_id) for user_id in CustomUser.objects.order_by('id').values_list('id', flat=True)[:50]),
+        'username': user.username,
+        'password': BENCHMARK_PASSWORD,
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'staff': staff,
+        'upload': str(upload.id),
+        'user_object': user,
+    }
+
+
+def resolve_placeholders(value, samples):
+    if isinstance(value, str) and value.startswith('$'):
+        return samples[value[1:]]
+    if isinstance(value, dict):
+        return {key: resolve_placeholders(item, samples) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_placeholders(item, samples) for item in value]
+    return value
+
+
+class Command(BaseCommand):
+    help = "Seeds a test database and measures query count, latency and peak memory of every API route"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', choices=SCALES.keys(),
+                            help='Number of courses and enrollments to seed, can be repeated (default: 1k)')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Untimed requests per endpoint before measuring')
+        parser.add_argument('--budgets', default=str(BUDGETS_FILE),
+                            help='JSON file with the per-endpoint budgets')
+        parser.add_argument('--output', default='benchmark-report.json',
+                            help='Where to write the JSON report')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded test database between runs')
+        parser.add_argument('--no-fail', action='store_true',
+                            help='Write the report without failing on budget violations')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Keep the response caches on, by default every request does the full database work')
+
+    def handle(self, *args, **options):
+        with open(options['budgets']) as budgets_file:
+            budgets = json.load(budgets_file)
+
+        routes = discover_routes()
+        missing = [route for route in routes if route not in budgets]
+        if missing:
+            raise CommandError(f'No budget committed for: {", ".join(missing)}')
+
+        report = {
+            'generated_at': datetime.now(dt_timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'cache': options['with_cache'],
+            'scales': {},
+        }
+        violations = []
+
+        setup_test_environment(debug=False)
+        # measure the API itself, not the development toolbar
+        middleware = [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar')]
+        caches = settings.CACHES
+        if not options['with_cache']:
+            caches = {**caches, getattr(settings, 'STORE_CACHE_ALIAS', 'default'): {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        # the payment routes talk to a local fake gateway instead of Zarinpal
+        gateway = make_server(quiet=True)
+        threading.Thread(target=gateway.serve_forever, daemon=True).start()
+        try:
+            with override_settings(MIDDLEWARE=middleware, CACHES=caches, ZARINPAL_API_BASE=f'http://127.0.0.1:{gateway.server_port}'):
+                for scale in options['scale'] or ['1k']:
+                    scale_report = self.run_scale(scale, routes, budgets, options, gateway.RequestHandlerClass.gateway)
+                    report['scales'][scale] = scale_report
+                    for name, result in scale_report['endpoints'].items():
+                        violations.extend(f'[{scale}] {name}: {violation}' for violation in result.get('violations', []))
+        finally:
+            gateway.shutdown()
+            gateway.server_close()
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        self.stdout.write(f'Report written to {options["output"]}')
+
+        if violations:
+            for violation in violations:
+                self.stderr.write(violation)
+            if not options['no_fail']:
+                raise CommandError(f'{len(violations)} budget violations')
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget'))
+
+    def run_scale(self, scale, routes, budgets, options, gateway):
+        size = SCALES[scale]
+        old_name = settings.DATABASES['default']['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not Course.objects.exists():
+                self.stdout.write(f'Seeding {scale} courses and enrollments...')
+                started = time.perf_counter()
+                seed(size)
+                self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+            samples = sample_values(gateway)
+            endpoints = {}
+            for name in routes:
+                budget = budgets[name]
+                if 'skip' in budget:
+                    endpoints[name] = {'skipped': budget['skip']}
+                    continue
+                endpoints[name] = self.measure(name, budget, scale, samples, options)
+                self.stdout.write(
+                    f'{scale} {name}: {endpoints[name]["queries"]} queries, '
+                    f'p50 {endpoints[name]["p50_ms"]}ms, p95 {endpoints[name]["p95_ms"]}ms'
+                )
+            return {'size': size, 'endpoints': endpoints}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def measure(self, name, budget, scale, samples, options):
+        client = APIClient()
+        auth = budget.get('auth', 'anonymous')
+        if auth == 'user':
+            client.force_authenticate(user=samples['user_object'])
+        elif auth == 'staff':
+            client.force_authenticate(user=samples['staff'])
+
+        kwargs = {key: samples[value] for key, value in budget.get('kwargs', {}).items()}
+        url = reverse(name, kwargs=kwargs)
+        method = getattr(client, budget.get('method', 'get'))
+        data = resolve_placeholders(budget.get('data'), samples)
+
+        def send():
+            return method(url, data, format='json') if data is not None else method(url)
+
+        for _ in range(options['warmup']):
+            send()
+
+        timings = []
+        query_count = 0
+        for _ in range(options['iterations']):
+            # request_started clears the query log, start every capture from an empty one
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = send()
+                timings.append((time.perf_counter() - started) * 1000)
+            query_count = max(query_count, len(queries.captured_queries))
+
+        tracemalloc.start()
+        send()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result = {
+            'url': url,
+            'status': response.status_code,
+            'queries': query_count,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'peak_memory_kb': round(peak_memory / 1024, 1),
+        }
+
+        violations = []
+        expected_status = budget.get('status', 200)
+        if response.status_code != expected_status:
+            violations.append(f'status {response.status_code}, expected {expected_status}')
+        if 'max_queries' in budget and result['queries'] > budget['max_queries']:
+            violations.append(f'{result["queries"]} queries, budget {budget["max_queries"]}')
+        p95_budget = budget.get('p95_ms', {}).get(scale)
+        if p95_budget is not None and result['p95_ms'] > p95_budget:
+            violations.append(f'p95 {result["p95_ms"]}ms, budget {p95_budget}ms')
+        peak_budget = budget.get('peak_memory_kb')
+        if peak_budget is not None and result['peak_memory_kb'] > peak_budget:
+            violations.append(f'peak memory {result["peak_memory_kb"]}KB, budget {peak_budget}KB')
+        if violations:
+            result['violations'] = violations
+        return result
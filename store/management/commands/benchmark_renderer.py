@@ -0,0 +1,144 @@
+import json
+import multiprocessing
+import resource
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import CustomUser
+from store.management.commands.benchmark_endpoints import SCALES, seed
+from store.models import Course
+
+
+MODES = {
+    'buffered': False,
+    'streaming': True,
+}
+
+
+def proc_status_kb(field):
+    """
+      VmRSS (current) or VmHWM (peak) of this process in KB, None off Linux
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM to the current RSS (Linux only)
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure(url, streaming, pipe):
+    """
+      runs in a forked process, so both modes start from the same heap
+    """
+    with override_settings(STORE_STREAM_EXPORTS=streaming):
+        client = APIClient()
+        client.force_authenticate(user=CustomUser.objects.get(is_staff=True))
+
+        reset_peak_rss()
+        baseline = proc_status_kb('VmRSS') or 0
+
+        started = time.perf_counter()
+        response = client.get(url)
+        size = 0
+        ttfb = None
+        if response.streaming:
+            for chunk in response.streaming_content:
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                size += len(chunk)
+        else:
+            ttfb = time.perf_counter() - started
+            size = len(response.content)
+        total = time.perf_counter() - started
+
+        peak = proc_status_kb('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    pipe.send({
+        'status': response.status_code,
+        'bytes': size,
+        'ttfb_ms': round(ttfb * 1000, 2),
+        'total_ms': round(total * 1000, 2),
+        'rss_baseline_kb': baseline,
+        'rss_peak_kb': peak,
+        'rss_growth_kb': peak - baseline,
+    })
+    pipe.close()
+
+
+class Command(BaseCommand):
+    help = "Compares peak RSS and time to first byte of a buffered and a streamed ?export=true list"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES.keys(), default='10k',
+                            help='Number of courses and enrollments to seed')
+        parser.add_argument('--route', default='store:order-list',
+                            help='List route to export (default: store:order-list)')
+        parser.add_argument('--output', default='renderer-report.json',
+                            help='Where to write the JSON report')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the seeded test database between runs')
+
+    def handle(self, *args, **options):
+        fork = multiprocessing.get_context('fork')
+        url = f'{reverse(options["route"])}?export=true'
+
+        setup_test_environment(debug=False)
+        old_name = settings.DATABASES['default']['NAME']
+        middleware = [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar')]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with override_settings(MIDDLEWARE=middleware):
+                if not Course.objects.exists():
+                    self.stdout.write(f'Seeding {options["scale"]} courses and enrollments...')
+                    seed(SCALES[options['scale']])
+
+                results = {}
+                for mode, streaming in MODES.items():
+                    # an in-memory sqlite database only survives the fork on the
+                    # inherited connection, server databases get a fresh one
+                    if connection.vendor != 'sqlite':
+                        connection.close()
+                    receiver, sender = fork.Pipe(duplex=False)
+                    process = fork.Process(target=measure, args=(url, streaming, sender))
+                    process.start()
+                    sender.close()
+                    try:
+                        results[mode] = receiver.recv()
+                    except EOFError:
+                        results[mode] = None
+                    process.join()
+                    if results[mode] is None:
+                        raise CommandError(f'The {mode} run crashed with exit code {process.exitcode}')
+                    self.stdout.write(
+                        f'{mode}: {results[mode]["bytes"]} bytes, ttfb {results[mode]["ttfb_ms"]}ms, '
+                        f'total {results[mode]["total_ms"]}ms, peak RSS +{results[mode]["rss_growth_kb"]}KB'
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if results['buffered']['bytes'] != results['streaming']['bytes']:
+            self.stderr.write('The buffered and streamed responses differ in size')
+
+        with open(options['output'], 'w') as output:
+            json.dump({'url': url, 'scale': options['scale'], 'database': connection.vendor, 'modes': results},
+                      output, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
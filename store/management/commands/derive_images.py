@@ -0,0 +1,37 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.images import IMAGE_MODELS, derive_images
+
+
+class Command(BaseCommand):
+    help = "Derives the resized copies of existing course, category, teacher and customer images in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Number of Pillow processes (default: number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows read per round')
+        parser.add_argument('--model', choices=sorted(IMAGE_MODELS), action='append',
+                            help='Only these models (default: all)')
+        parser.add_argument('--all', action='store_true',
+                            help='Also rows that already have derivatives, e.g. after changing STORE_IMAGE_SIZES')
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=max(1, options['processes'])) as pool:
+            for name in options['model'] or sorted(IMAGE_MODELS):
+                rows = IMAGE_MODELS[name].objects.exclude(image='').exclude(image=None).order_by('id').only('id', 'image', 'image_hash')
+                if not options['all']:
+                    rows = rows.filter(image_hash='')
+                last_id = 0
+                updated = 0
+                while True:
+                    batch = list(rows.filter(id__gt=last_id)[:options['batch_size']])
+                    if not batch:
+                        break
+                    last_id = batch[-1].id
+                    updated += derive_images(pool, batch, log=self.stderr.write)
+                self.stdout.write(f'{name}: {updated} images derived')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from store.carts import cart_store
+
+
+class Command(BaseCommand):
+    help = "Writes the carts changed in the cache to the database (STORE_CART_BACKEND = CacheCartStore)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Carts written per transaction')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Seconds between flushes, 0 flushes once and exits')
+
+    def handle(self, *args, **options):
+        store = cart_store()
+        if not hasattr(store, 'flush'):
+            raise CommandError(f'{type(store).__name__} writes carts to the database directly, there is nothing to flush')
+
+        while True:
+            close_old_connections()
+            flushed = store.flush(options['batch_size'])
+            if flushed:
+                self.stdout.write(f'Flushed {flushed} carts')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Carts flushed'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from store.uploads import prune_sessions
+
+
+class Command(BaseCommand):
+    help = "Deletes chunked uploads that were never finalized and their part files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=2 * 24 * 60 * 60,
+                            help='Delete sessions opened more than this many seconds ago')
+
+    def handle(self, *args, **options):
+        pruned = prune_sessions(options['older_than'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {pruned} upload sessions'))
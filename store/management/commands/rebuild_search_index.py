@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the course search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Courses indexed per transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        indexed = rebuild_index(chunk_size=options['chunk_size'], log=self.stdout.write)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'DONE: {indexed} courses indexed in {elapsed:.1f}s'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.counters import reconcile_teachers
+from store.orders import reconcile_orders
+from store.progress import reconcile_progress
+from store.questions import reconcile_questions
+
+
+class Command(BaseCommand):
+    help = "Recomputes the stored student, course and review counters of every teacher, the totals of every order, the progress of every enrollment and the reply counts of every question"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Teachers, orders, enrollments or questions recomputed per round')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        drifted = reconcile_teachers(chunk_size=options['chunk_size'])
+        orders_drifted = reconcile_orders(chunk_size=options['chunk_size'])
+        enrollments_drifted = reconcile_progress(chunk_size=options['chunk_size'])
+        questions_drifted = reconcile_questions(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'DONE: {drifted} teachers, {orders_drifted} orders, {enrollments_drifted} enrollments '
+            f'and {questions_drifted} questions corrected in {elapsed:.1f}s'
+        ))
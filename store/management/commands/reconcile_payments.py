@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.payments import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = "Verifies unpaid orders that went to Zarinpal, marks the paid ones paid and cancels the abandoned ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Orders read and updated per round')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Verifications sent to the gateway at once')
+        parser.add_argument('--settle-after', type=int, default=15,
+                            help='Minutes an order is left to its own callback before it is verified here')
+        parser.add_argument('--cancel-after', type=int, default=24,
+                            help='Hours after which an order the gateway has no payment for is canceled')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Seconds between runs, 0 runs once and exits')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            started = time.perf_counter()
+            totals = reconcile_payments(
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                settle_after=timedelta(minutes=options['settle_after']),
+                cancel_after=timedelta(hours=options['cancel_after']),
+                log=self.stdout.write,
+            )
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'DONE: {totals["paid"]} paid, {totals["canceled"]} canceled, {totals["pending"]} pending, '
+                f'{totals["failed"]} failed in {elapsed:.1f}s'
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
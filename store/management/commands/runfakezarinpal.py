@@ -0,0 +1,130 @@
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+
+
+class FakeGateway:
+    """
+      what the fake server remembers: the payments requested and verified
+    """
+
+    def __init__(self, latency=0, failure_rate=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.payments = {}
+        self.sequence = itertools.count(1)
+        self.ref_ids = itertools.count(100000)
+        self.lock = threading.Lock()
+
+    def request(self, data):
+        with self.lock:
+            authority = f'A{next(self.sequence):035d}'
+            self.payments[authority] = {'amount': data.get('Amount'), 'callback': data.get('CallbackURL'), 'paid': False, 'ref_id': None}
+        return {'Status': 100, 'Authority': authority}
+
+    def verify(self, data):
+        with self.lock:
+            payment = self.payments.get(data.get('Authority'))
+            if payment is None:
+                return {'Status': -11, 'errors': {'code': -11, 'message': 'Unknown authority'}}
+            if not payment['paid']:
+                return {'Status': -21, 'errors': {'code': -21, 'message': 'No payment was made'}}
+            if payment['amount'] != data.get('Amount'):
+                return {'Status': -50, 'errors': {'code': -50, 'message': 'Amount mismatch'}}
+            if payment['ref_id'] is not None:
+                return {'Status': 101, 'RefID': payment['ref_id']}
+            payment['ref_id'] = next(self.ref_ids)
+            return {'Status': 100, 'RefID': payment['ref_id']}
+
+
+class Handler(BaseHTTPRequestHandler):
+    gateway = None
+    quiet = False
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def delay(self):
+        if self.gateway.latency:
+            time.sleep(self.gateway.latency)
+        return random.random() < self.gateway.failure_rate
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            data = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self.send_json(400, {'Status': -1, 'errors': {'code': -1, 'message': 'Invalid JSON'}})
+
+        if self.delay():
+            return self.send_json(503, {'Status': -1, 'errors': {'code': -1, 'message': 'Injected failure'}})
+        if self.path == '/pg/rest/WebGate/PaymentRequest.json':
+            return self.send_json(200, self.gateway.request(data))
+        if self.path == '/pg/rest/WebGate/PaymentVerification.json':
+            return self.send_json(200, self.gateway.verify(data))
+        self.send_json(404, {'Status': -1, 'errors': {'code': -1, 'message': 'Not found'}})
+
+    def do_GET(self):
+        # the payment page, pays at once and sends the user back
+        prefix = '/pg/StartPay/'
+        payment = self.gateway.payments.get(self.path[len(prefix):]) if self.path.startswith(prefix) else None
+        if payment is None:
+            return self.send_json(404, {'Status': -1, 'errors': {'code': -1, 'message': 'Not found'}})
+        payment['paid'] = True
+        self.send_response(302)
+        self.send_header('Location', f'{payment["callback"]}?{urlencode({"Authority": self.path[len(prefix):], "Status": "OK"})}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(host='127.0.0.1', port=0, latency=0, failure_rate=0, quiet=False):
+    """
+      a fake gateway server, port 0 picks a free one (server.server_port)
+    """
+    handler = type('FakeZarinpalHandler', (Handler,), {
+        'gateway': FakeGateway(latency, failure_rate),
+        'quiet': quiet,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class Command(BaseCommand):
+    help = "Runs a local fake Zarinpal gateway, point ZARINPAL_API_BASE at it (e.g. http://127.0.0.1:8765)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Seconds every request and verification takes')
+        parser.add_argument('--failure-rate', type=float, default=0,
+                            help='Share of requests answered with a 503')
+        parser.add_argument('--quiet', action='store_true',
+                            help="Don't log every request")
+
+    def handle(self, *args, **options):
+        server = make_server(options['host'], options['port'], options['latency'], options['failure_rate'], options['quiet'])
+        self.stdout.write(f'Fake Zarinpal listening on http://{options["host"]}:{options["port"]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS('Fake Zarinpal stopped'))
@@ -0,0 +1,68 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.media import claim_jobs, complete_job, fail_job, probe_duration, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Processes queued MediaJobs: probes lecture files in a process pool and stores their duration"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Number of probe processes (default: number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=0,
+                            help='Jobs claimed per round (default: 2 x processes)')
+        parser.add_argument('--max-attempts', type=int, default=3,
+                            help='Attempts before a job is marked as failed')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=3600,
+                            help='Requeue running jobs started more than this many seconds ago')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue and exit instead of polling forever')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        batch_size = options['batch_size'] or processes * 2
+
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs')
+
+        self.stdout.write(f'Media worker started with {processes} processes')
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            while True:
+                close_old_connections()
+                jobs = claim_jobs(batch_size)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.run_batch(pool, jobs, options['max_attempts'])
+
+        self.stdout.write(self.style.SUCCESS('Media worker stopped'))
+
+    def run_batch(self, pool, jobs, max_attempts):
+        futures = {}
+        for job in jobs:
+            try:
+                path = job.variant_item.file.storage.path(job.file_name)
+            except Exception as error:
+                fail_job(job, error, max_attempts)
+                continue
+            futures[pool.submit(probe_duration, path)] = job
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                complete_job(job, future.result())
+                self.stdout.write(f'Job {job.id}: variant item {job.variant_item_id} probed')
+            except Exception as error:
+                fail_job(job, error, max_attempts)
+                self.stderr.write(f'Job {job.id}: {error}')
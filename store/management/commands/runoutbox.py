@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.outbox import CONSUMERS, claim_events, dispatch, prune_events, requeue_stale_events
+
+
+class Command(BaseCommand):
+    help = "Delivers OutboxEvents to their consumers in a thread pool, retrying failed batches with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Consumer threads')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Events claimed per round')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Attempts before an event is marked as failed')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue running events started more than this many seconds ago')
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Delete delivered events older than this many days on start')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox and exit instead of polling forever')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_events(options['stale_after'])
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale events')
+        pruned = prune_events(timedelta(days=options['keep_days']))
+        if pruned:
+            self.stdout.write(f'Deleted {pruned} delivered events')
+
+        self.stdout.write(f'Outbox dispatcher started with {options["workers"]} threads, consumers of: {", ".join(sorted(CONSUMERS))}')
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            while True:
+                close_old_connections()
+                events = claim_events(options['batch_size'])
+                if not events:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                delivered = dispatch(pool, events, options['max_attempts'], log=self.stderr.write)
+                self.stdout.write(f'{delivered} of {len(events)} events delivered')
+
+        self.stdout.write(self.style.SUCCESS('Outbox dispatcher stopped'))
@@ -1,125 +1,72 @@
-# setup_test_data.py
-import random
-from faker import Faker
-from datetime import datetime, timedelta
+import time
 
-from django.db import transaction
+from django.apps import apps
 from django.core.management.base import BaseCommand
+from django.db.models import Max
 
-from store.models import Address, Cart, CartItem, Category, Comment, Order, OrderItem, Product, Discount, Customer
-from store.factories import (
-    CartFactory,
-    CategoryFactory,
-    CommentFactory,
-    OrderItemFactory,
-    ProductFactory,
-    DiscountFactory,
-    CustomerFactory,
-    AddressFactory,
-    OrderFactory,
-    CartItemFactory,
-)
+from core.models import CustomUser
+from store import datagen
+from store.counters import reconcile_teachers
+from store.orders import reconcile_orders
+from store.progress import reconcile_progress
+from store.sales import rebuild_rollups
+from store.search import rebuild_index
 
-faker = Faker()
-
-list_of_models = [CartItem, Cart, OrderItem, Order, Product, Category, Comment, Discount, Address, Customer]
-
-NUM_CATEGORIES = 100
-NUM_DISCOUNTS = 10
-NUM_PRODUCTS = 1000
-NUM_CUSTOMERS = 100
-NUM_ORDERS = 30
-NUM_CARTS = 100
 
 class Command(BaseCommand):
-    help = "Generates fake data"
+    help = "Generates fake LMS data with bulk inserts, deterministic for a given --seed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Same seed and sizes always produce the same dataset')
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiplies the default sizes (scale 1 is about 65k rows, 200 is about 13M)')
+        for name, base in datagen.BASE_COUNTS.items():
+            parser.add_argument(f'--{name}', type=int,
+                                help=f'Number of {name}, overrides --scale (default {base} x scale)')
+        parser.add_argument('--variants-per-course', type=int, default=3)
+        parser.add_argument('--lectures-per-variant', type=int, default=4)
+        parser.add_argument('--items-per-order', type=int, default=2)
+        parser.add_argument('--comments-per-course', type=int, default=3)
+        parser.add_argument('--paid-ratio', type=float, default=0.8,
+                            help='Share of paid orders, only paid order items get an enrollment')
+        parser.add_argument('--password', default='password',
+                            help='Password of every generated user')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per chunk, every chunk is inserted in its own transaction')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes generating and inserting chunks in parallel')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
 
-    @transaction.atomic
-    def handle(self, *args, **kwargs):
         self.stdout.write("Deleting old data...")
-        models = list_of_models
-        for m in models:
-            m.objects.all().delete()
-
-        self.stdout.write("Creating new data...\n")
-
-        # Categories data
-        print(f"Adding {NUM_CATEGORIES} categories...", end='')
-        all_categories = [CategoryFactory(top_product=None) for _ in range(NUM_CATEGORIES)]
-        print('DONE')
-        
-        # Discounts data
-        print(f"Adding {NUM_DISCOUNTS} discounts...", end='')
-        all_discounts = [DiscountFactory() for _ in range(NUM_DISCOUNTS)]
-        print('DONE')
-
-        # Products data
-        print(f"Adding {NUM_PRODUCTS} product...", end='')
-        all_products = list()
-        for _ in range(NUM_PRODUCTS):
-            new_product = ProductFactory(category_id=random.choice(all_categories).id)
-            new_product.datetime_created = faker.date_time_ad(start_datetime=datetime(2022,1,1), end_datetime=datetime(2023,1,1))
-            new_product.datetime_modified = new_product.datetime_created + timedelta(hours=random.randint(1, 5000))
-            all_products.append(new_product)
-        print('DONE')
-
-        # Customers data
-        print(f"Adding {NUM_CUSTOMERS} customers...", end='')
-        all_customers = [CustomerFactory() for _ in range(NUM_CUSTOMERS)]
-        print('DONE')
-
-        # Addresses data
-        print(f"Adding customers addresses...", end='')
-        all_addresses = [
-            AddressFactory(customer_id=customer.id) for customer in all_customers
-        ]
-        print('DONE')
-
-        # Orders data
-        print(f"Adding {NUM_ORDERS} orders...", end='')
-        all_orders = [OrderFactory(
-            customer_id=random.choice(all_customers).id
-        ) for _ in range(NUM_ORDERS)]
-        for order in all_orders:
-            order.datetime_created = faker.date_time_ad(start_datetime=datetime(2022,6,1), end_datetime=datetime(2023,1,1))
-        print('DONE')
-
-        # OrderItems data
-        print(f"Adding order items...", end='')
-        all_order_items = list()
-        for order in all_orders:
-            products = random.sample(all_products, random.randint(1, 10))
-            for product in products:
-                order_item = OrderItemFactory(
-                    order_id=order.id,
-                    product_id=product.id,
-                    unit_price=product.unit_price,
-                )
-                all_order_items.append(order_item)
-        print('DONE')
-
-        # Comments data
-        print(f"Adding product comments...", end='')
-        for product in all_products:
-            for _ in range(random.randint(1, 5)):
-                comment = CommentFactory(product_id=product.id)
-                comment.datetime_created = faker.date_time_ad(start_datetime=datetime(2015,1,1), end_datetime=datetime(2023,1,1))
-        print('DONE')
-
-        # Carts data
-        print(f"Adding {NUM_CARTS} carts...", end='')
-        all_carts = [CartFactory() for _ in range(NUM_CARTS)]
-        print('DONE')
-
-        # CartItems data
-        print(f"Adding cart items...", end='')
-        all_cart_items = list()
-        for cart in all_carts:
-            products = random.sample(all_products, random.randint(1, 10))
-            for product in products:
-                cart_item = CartItemFactory(
-                    cart_id=cart.id,
-                    product_id=product.id,
-                )
-                all_cart_items.append(cart_item)
-        print('DONE')
+        datagen.flush(apps.get_app_config('store').get_models())
+
+        plan = datagen.Plan(
+            seed=options['seed'],
+            scale=options['scale'],
+            variants_per_course=options['variants_per_course'],
+            lectures_per_variant=options['lectures_per_variant'],
+            items_per_order=options['items_per_order'],
+            comments_per_course=options['comments_per_course'],
+            paid_ratio=options['paid_ratio'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            user_id_offset=CustomUser.objects.aggregate(max_id=Max('id'))['max_id'] or 0,
+            **{name: options[name] for name in datagen.BASE_COUNTS},
+        )
+
+        self.stdout.write(f"Creating new data with {options['processes']} processes...")
+        totals = datagen.generate(plan, processes=options['processes'], log=self.stdout.write)
+        datagen.create_missing_customers()
+        # bulk inserts skip the signals that keep the teacher counters, order totals, enrollment progress, sales rollups and the search index up to date
+        reconcile_teachers()
+        reconcile_orders()
+        reconcile_progress()
+        rebuild_rollups()
+        self.stdout.write("Building the search index...")
+        rebuild_index()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'DONE: {sum(totals.values())} rows in {elapsed:.1f}s'))
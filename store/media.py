@@ -0,0 +1,80 @@
+import math
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.models import MediaJob, VariantItem
+
+
+def probe_duration(path):
+    """
+      runs inside the worker processes: opens the clip only long enough to
+      read its duration and always closes the ffmpeg reader afterwards
+    """
+    from moviepy.editor import VideoFileClip
+
+    clip = VideoFileClip(path)
+    try:
+        return clip.duration
+    finally:
+        clip.close()
+
+
+def format_duration(duration_seconds):
+    minutes, remainder = divmod(duration_seconds, 60)
+    minutes = math.floor(minutes)
+    seconds = math.floor(remainder)
+    return f'{minutes} m {seconds} s'
+
+
+def claim_jobs(batch_size):
+    with transaction.atomic():
+        jobs = list(
+            # of=('self',): the lecture rows stay editable while they are probed
+            MediaJob.pending_jobs.select_for_update(skip_locked=True, of=('self',))
+            .select_related('variant_item')
+            .order_by('id')[:batch_size]
+        )
+        if jobs:
+            MediaJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=MediaJob.JOB_STATUS_RUNNING,
+                attempts=F('attempts') + 1,
+                datetime_started=timezone.now(),
+            )
+    return jobs
+
+
+def requeue_stale_jobs(stale_after):
+    started_before = timezone.now() - timedelta(seconds=stale_after)
+    return MediaJob.objects.filter(
+        status=MediaJob.JOB_STATUS_RUNNING,
+        datetime_started__lt=started_before,
+    ).update(status=MediaJob.JOB_STATUS_PENDING)
+
+
+def complete_job(job, duration_seconds):
+    # the file may have been replaced while it was probed, its own job sets the duration then
+    VariantItem.objects.filter(id=job.variant_item_id, file=job.file_name).update(
+        duration=timedelta(seconds=duration_seconds),
+        content_duration=format_duration(duration_seconds),
+    )
+    MediaJob.objects.filter(id=job.id).update(
+        status=MediaJob.JOB_STATUS_DONE,
+        error='',
+        datetime_finished=timezone.now(),
+    )
+
+
+def fail_job(job, error, max_attempts):
+    # job.attempts is the value before claim_jobs incremented it
+    if job.attempts + 1 < max_attempts:
+        status = MediaJob.JOB_STATUS_PENDING
+    else:
+        status = MediaJob.JOB_STATUS_FAILED
+    MediaJob.objects.filter(id=job.id).update(
+        status=status,
+        error=str(error),
+        datetime_finished=timezone.now(),
+    )
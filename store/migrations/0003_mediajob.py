@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_order_zarinpal_authority_order_zarinpal_data_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('New Order', 'New Order'), ('New Review', 'New Review'), ('New Course Question', 'New Course Question'), ('Course Published', 'Course Published'), ('Draft', 'Draft'), ('Course Enrollment Completed', 'Course Enrollment Completed')], max_length=255),
+        ),
+        migrations.CreateModel(
+            name='MediaJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('p', 'Pending'), ('r', 'Running'), ('d', 'Done'), ('f', 'Failed')], default='p', max_length=1)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+                ('datetime_started', models.DateTimeField(blank=True, null=True)),
+                ('datetime_finished', models.DateTimeField(blank=True, null=True)),
+                ('variant_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_jobs', to='store.variantitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='store_media_status_7c3e2a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_mediajob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacher',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='courses_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='students_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
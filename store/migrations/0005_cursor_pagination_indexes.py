@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_teacher_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['course', 'datetime_created', 'id'], name='store_comme_course__d24ec9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['datetime_created', 'id'], name='store_cours_datetim_b8c778_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrolledcourse',
+            index=models.Index(fields=['user', 'date', 'id'], name='store_enrol_user_id_b3fdfe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['datetime_created', 'id'], name='store_order_datetim_04b34f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'datetime_created', 'id'], name='store_order_custome_bd5b28_idx'),
+        ),
+    ]
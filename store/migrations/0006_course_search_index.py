@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('field', models.CharField(choices=[('n', 'Name'), ('d', 'Description'), ('c', 'Category'), ('t', 'Teacher')], max_length=1)),
+                ('weight', models.PositiveIntegerField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='store.course')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'course', 'weight'], name='store_cours_term_73c7b8_idx'), models.Index(fields=['course', 'field'], name='store_cours_course__306d41_idx')],
+            },
+        ),
+    ]
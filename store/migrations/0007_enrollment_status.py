@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_course_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='status',
+            field=models.CharField(choices=[('p', 'Pending payment'), ('a', 'Active')], default='a', max_length=1),
+        ),
+    ]
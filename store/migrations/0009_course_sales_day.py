@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSalesDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sales_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='store.course')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_days', to='store.teacher')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['teacher', 'day'], name='store_cours_teacher_5d6a01_idx'), models.Index(fields=['day'], name='store_cours_day_0faf01_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='coursesalesday',
+            constraint=models.UniqueConstraint(fields=('teacher', 'course', 'day'), name='unique_course_sales_day'),
+        ),
+    ]
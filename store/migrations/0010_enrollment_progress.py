@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:16
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_progress(apps, schema_editor):
+    EnrolledCourse = apps.get_model('store', 'EnrolledCourse')
+    CompletedLesson = apps.get_model('store', 'CompletedLesson')
+    VariantItem = apps.get_model('store', 'VariantItem')
+    lessons = VariantItem.objects.filter(variant__course_id=OuterRef('course_id')).order_by().values('variant__course_id')
+    completed = CompletedLesson.objects.filter(course_id=OuterRef('course_id'), user_id=OuterRef('user_id')).order_by()
+    EnrolledCourse.objects.update(
+        lessons_total=Coalesce(Subquery(lessons.annotate(count=Count('id')).values('count')), Value(0)),
+        lessons_completed=Coalesce(
+            Subquery(completed.values('user_id').annotate(count=Count('variant_item_id', distinct=True)).values('count')),
+            Value(0),
+        ),
+        last_activity=Subquery(completed.order_by('-date').values('date')[:1]),
+    )
+    EnrolledCourse.objects.update(
+        progress=Coalesce(Cast(F('lessons_completed'), FloatField()) * 100 / NullIf(F('lessons_total'), Value(0)), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_course_sales_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='lessons_completed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='lessons_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrolledcourse',
+            name='progress',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(fill_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_reply_count(apps, schema_editor):
+    Question_Answer = apps.get_model('store', 'Question_Answer')
+    Question_Answer_Message = apps.get_model('store', 'Question_Answer_Message')
+    messages = Question_Answer_Message.objects.filter(question=OuterRef('pk')).order_by().values('question')
+    Question_Answer.objects.update(
+        reply_count=Coalesce(Subquery(messages.annotate(count=Count('id')).values('count')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_enrollment_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question_answer',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='question_answer_message',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='store.question_answer'),
+        ),
+        migrations.AddIndex(
+            model_name='question_answer',
+            index=models.Index(fields=['course', 'date', 'id'], name='store_quest_course__896770_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question_answer_message',
+            index=models.Index(fields=['question', 'date', 'id'], name='store_quest_questio_f432e3_idx'),
+        ),
+        migrations.RunPython(fill_reply_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_question_reply_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'seen'], name='store_notif_user_id_86c51e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'date', 'id'], name='store_notif_user_id_43f234_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:24
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_outbox_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('target', models.CharField(choices=[('lecture-file', 'Lecture file'), ('course-file', 'Course file'), ('course-image', 'Course image')], max_length=20)),
+                ('target_id', models.PositiveBigIntegerField()),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('received', models.PositiveBigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(choices=[('o', 'Open'), ('c', 'Complete')], default='o', max_length=1)),
+                ('file', models.CharField(blank=True, max_length=255)),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+                ('datetime_completed', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'datetime_created'], name='store_uploa_status_adbd62_idx')],
+            },
+        ),
+    ]
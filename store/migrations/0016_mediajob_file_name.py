@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:36
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_file_name(apps, schema_editor):
+    MediaJob = apps.get_model('store', 'MediaJob')
+    VariantItem = apps.get_model('store', 'VariantItem')
+    MediaJob.objects.update(file_name=Subquery(VariantItem.objects.filter(id=OuterRef('variant_item_id')).values('file')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediajob',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_file_name, migrations.RunPython.noop),
+    ]
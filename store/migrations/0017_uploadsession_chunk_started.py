@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_mediajob_file_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='chunk_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
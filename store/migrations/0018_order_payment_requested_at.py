@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:58
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_payment_requested_at(apps, schema_editor):
+    # the best known time for orders that already went to the gateway
+    Order = apps.get_model('store', 'Order')
+    Order.objects.exclude(zarinpal_authority='').update(payment_requested_at=F('datetime_created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_uploadsession_chunk_started'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='payment_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_payment_requested_at, migrations.RunPython.noop),
+    ]
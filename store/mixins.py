@@ -0,0 +1,86 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.response import Response
+
+from store.cache import get_cache, get_versions, record
+from store.renders import StreamingJSONRenderer
+
+
+class StreamingListMixin:
+    """
+      ?export=true makes staff users get the whole list instead of a page.
+      It is streamed one item at a time, rows are read with iterator() and
+      prefetched per chunk, so memory doesn't grow with the list.
+
+      STORE_STREAM_EXPORTS = False renders exports in one piece instead.
+    """
+    export_param = 'export'
+    export_chunk_size = 500
+
+    def is_export(self, request):
+        return request.query_params.get(self.export_param) in ('1', 'true') and request.user.is_staff
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_export(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if not getattr(settings, 'STORE_STREAM_EXPORTS', True):
+            return Response(self.get_serializer(queryset, many=True).data)
+
+        serializer = self.get_serializer()
+        items = (serializer.to_representation(obj) for obj in queryset.iterator(chunk_size=self.export_chunk_size))
+        renderer_context = self.get_renderer_context()
+        return StreamingHttpResponse(
+            StreamingJSONRenderer().render_stream(items, renderer_context=renderer_context),
+            content_type=StreamingJSONRenderer.media_type,
+        )
+
+
+class VersionedCacheMixin:
+    """
+      caches the data of list() and retrieve() under the request URL and the
+      versions they depend on, see get_cache_versions(). Bumping a version
+      (store.signals.handlers) makes every entry built with the old one
+      unreachable, nothing has to be deleted.
+
+      Only the data is cached, it is rendered per request so content
+      negotiation and the browsable API keep working.
+    """
+    cache_name = None
+    cache_timeout = 60 * 60
+
+    def get_cache_versions(self):
+        """
+          names of the versions the response depends on, the collection for
+          a list and the object for a detail page
+        """
+        if self.action == 'retrieve':
+            return [f'{self.cache_name}:{self.kwargs[self.lookup_url_kwarg or self.lookup_field]}']
+        return [self.cache_name]
+
+    def cached(self, view, request, *args, **kwargs):
+        metric = f'{self.cache_name}-{self.action}'
+        versions = get_versions(self.get_cache_versions())
+        digest = md5(f'{request.build_absolute_uri()}|{versions}'.encode()).hexdigest()
+        key = f'store:response:{metric}:{digest}'
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is not None:
+            record(metric, 'hits')
+            return Response(data)
+
+        record(metric, 'misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
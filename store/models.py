@@ -1,11 +1,12 @@
 from django.utils import timezone
-import math
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from uuid import uuid4
 from django.utils.text import slugify
-from moviepy.editor import VideoFileClip
+
+from store.prefetch import PrefetchableRelation
 
 
 
@@ -56,9 +57,47 @@ RATING = (
 
 
 
-class Category(models.Model):
+class LoadedValuesMixin:
+    """
+      keeps the column values a row had in the database in _loaded_values,
+      so post_save handlers can tell what a save changed (see store.counters
+      and store.search). It is refreshed once save() returns.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        loaded_values = getattr(self, '_loaded_values', {}) if update_fields is not None else {}
+        for field in self._meta.concrete_fields:
+            if update_fields is None or field.name in update_fields or field.attname in update_fields:
+                loaded_values[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded_values
+
+
+class ImageHashMixin:
+    """
+      image_hash is only written with update() (see store.images). A full
+      save() of an instance loaded before the derivatives were stored would
+      put the old hash back, so it saves every other field.
+    """
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'image_hash']
+        super().save(*args, **kwargs)
+
+
+class Category(ImageHashMixin, LoadedValuesMixin, models.Model):
     title = models.CharField(max_length=255)
     image = models.FileField(upload_to='course-file', default='category.jpg', blank=True, null=True)
+    # content hash of image, names its derivatives (see store.images)
+    image_hash = models.CharField(max_length=64, blank=True)
     slug = models.SlugField(unique=True)
 
     class Meta:
@@ -90,9 +129,11 @@ class Discount(models.Model):
 
 
 
-class Teacher(models.Model):
+class Teacher(ImageHashMixin, LoadedValuesMixin, models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     image = models.FileField(upload_to='course-file', blank=True, null=True, default='default.jpg')
+    # content hash of image, names its derivatives (see store.images)
+    image_hash = models.CharField(max_length=64, blank=True)
     full_name = models.CharField(max_length=255)
     bio = models.CharField(max_length=255, blank=True)
     facebook = models.URLField(blank=True, null=True)
@@ -100,6 +141,13 @@ class Teacher(models.Model):
     about = models.TextField(blank=True, null=True)
     country = models.CharField(max_length=255, blank=True)
 
+    # maintained by store.counters, run reconcile_counters to repair drift
+    students_count = models.PositiveIntegerField(default=0)
+    courses_count = models.PositiveIntegerField(default=0)
+    reviews_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+
     def __str__(self):
         return self.full_name
     
@@ -113,7 +161,10 @@ class Teacher(models.Model):
         return Course.objects.filter(teacher=self).count()
 
 
-class Course(models.Model):
+PUBLISHED_COURSE = Q(platform_status='Published', teacher_course_status='Published')
+
+
+class Course(ImageHashMixin, LoadedValuesMixin, models.Model):
     name = models.CharField(max_length=255)
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='courses')
     slug = models.SlugField()
@@ -122,6 +173,8 @@ class Course(models.Model):
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE)
     file = models.FileField(upload_to='course-file', blank=True, null=True)
     image = models.FileField(upload_to='course-file', blank=True, null=True)
+    # content hash of image, names its derivatives (see store.images)
+    image_hash = models.CharField(max_length=64, blank=True)
     language = models.CharField(max_length=255, choices=LANGUAGE, default='English')
     level = models.CharField(max_length=255, choices=LEVEL, default='Beginner')
     platform_status = models.CharField(max_length=255, choices=PLATFORM_STATUS, default='Published')
@@ -132,12 +185,55 @@ class Course(models.Model):
     datetime_modified = models.DateTimeField(auto_now=True)
     discounts = models.ManyToManyField(Discount, blank=True)
 
+    lectures = PrefetchableRelation('store.VariantItem', variant__course_id='id')
+    # paid enrollments, EnrolledCourse.ENROLLMENT_STATUS_ACTIVE
+    active_enrollments = PrefetchableRelation('store.EnrolledCourse', where={'status': 'a'}, course_id='id')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['datetime_created', 'id']),
+        ]
+
     def __str__(self):
         return self.name
 
+    def is_published(self):
+        return self.platform_status == 'Published' and self.teacher_course_status == 'Published'
+
+
 
 
 
+class CourseSearchTerm(models.Model):
+    """
+      one row of the course search index, maintained by store.search
+    """
+    FIELD_NAME = 'n'
+    FIELD_DESCRIPTION = 'd'
+    FIELD_CATEGORY = 'c'
+    FIELD_TEACHER = 't'
+    FIELD_CHOICES = [
+        (FIELD_NAME, 'Name'),
+        (FIELD_DESCRIPTION, 'Description'),
+        (FIELD_CATEGORY, 'Category'),
+        (FIELD_TEACHER, 'Teacher'),
+    ]
+
+    term = models.CharField(max_length=64)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='search_terms')
+    field = models.CharField(max_length=1, choices=FIELD_CHOICES)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # prefix lookups on term read the matching courses and weights from the index alone
+            models.Index(fields=['term', 'course', 'weight']),
+            models.Index(fields=['course', 'field']),
+        ]
+
+    def __str__(self):
+        return f'{self.term} -> course {self.course_id}'
+
 
 class Variant(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
@@ -151,7 +247,7 @@ class Variant(models.Model):
         return VariantItem.objects.filter(variant=self)
 
 
-class VariantItem(models.Model):
+class VariantItem(LoadedValuesMixin, models.Model):
     variant = models.ForeignKey(Variant, on_delete=models.CASCADE, related_name='variant_items')
     title = models.CharField(max_length=1000)
     description = models.TextField()
@@ -164,88 +260,212 @@ class VariantItem(models.Model):
 
     def __str__(self):
         return f'{self.variant.title} - {self.title}'
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_file_name = str(instance.__dict__.get('file') or '')
+        return instance
+
+    def file_changed(self):
+        return str(self.file or '') != getattr(self, '_loaded_file_name', '')
+
     def save(self, *args, **kwargs):
+        """
+          probing the clip duration is slow, so instead of opening the file
+          here we reset the duration and queue a MediaJob for runmediaworker
+        """
+        file_changed = self.file_changed()
+        if file_changed:
+            self.duration = None
+            self.content_duration = ''
+
         super().save(*args, **kwargs)
+        self._loaded_file_name = str(self.file or '')
 
-        if self.file:
-            """
-              if there is clip file, this function calculate 
-              the duration of the clip and then save it
-            """
-            clip = VideoFileClip(self.file.path)
-            duration_seconds = clip.duration
+        if self.file and file_changed:
+            MediaJob.pending_jobs.update_or_create(variant_item=self, defaults={'file_name': self.file.name})
 
-            minutes, remainder = divmod(duration_seconds, 60)
-            minutes = math.floor(minutes)
-            seconds = math.floor(remainder)
 
-            duration_text = f'{minutes} m {seconds} s'
+class PendingMediaJobManager(models.Manager):
 
-            self.content_duration = duration_text
-            super().save(update_fields=['content_duration'])
+    def get_queryset(self):
+        return super().get_queryset().filter(status=MediaJob.JOB_STATUS_PENDING)
+
+
+class MediaJob(models.Model):
+    JOB_STATUS_PENDING = 'p'
+    JOB_STATUS_RUNNING = 'r'
+    JOB_STATUS_DONE = 'd'
+    JOB_STATUS_FAILED = 'f'
+    JOB_STATUS = [
+        (JOB_STATUS_PENDING, 'Pending'),
+        (JOB_STATUS_RUNNING, 'Running'),
+        (JOB_STATUS_DONE, 'Done'),
+        (JOB_STATUS_FAILED, 'Failed'),
+    ]
 
+    variant_item = models.ForeignKey(VariantItem, on_delete=models.CASCADE, related_name='media_jobs')
+    # the file the job probes
+    file_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=1, choices=JOB_STATUS, default=JOB_STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_started = models.DateTimeField(blank=True, null=True)
+    datetime_finished = models.DateTimeField(blank=True, null=True)
 
-class Question_Answer(models.Model):
-    course = models.ForeignKey(Course, on_delete=models.CASCADE)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
-    title = models.CharField(max_length=1000, blank=True)
-    date = models.DateTimeField(default=timezone.now)   
+    objects = models.Manager()
+    pending_jobs = PendingMediaJobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
 
     def __str__(self):
-        return f'{self.user.username} - {self.course.title}'
-    
+        return f'MediaJob id={self.id} ({self.get_status_display()})'
+
+
+class PendingOutboxEventManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(status=OutboxEvent.EVENT_STATUS_PENDING, available_at__lte=timezone.now())
+
+
+class OutboxEvent(models.Model):
+    """
+      a domain event written in the transaction that caused it and
+      delivered to its consumers by runoutbox (see store.outbox)
+    """
+    EVENT_STATUS_PENDING = 'p'
+    EVENT_STATUS_RUNNING = 'r'
+    EVENT_STATUS_DONE = 'd'
+    EVENT_STATUS_FAILED = 'f'
+    EVENT_STATUS = [
+        (EVENT_STATUS_PENDING, 'Pending'),
+        (EVENT_STATUS_RUNNING, 'Running'),
+        (EVENT_STATUS_DONE, 'Done'),
+        (EVENT_STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=1, choices=EVENT_STATUS, default=EVENT_STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    # retries are delayed by moving this forward
+    available_at = models.DateTimeField(default=timezone.now)
+    datetime_started = models.DateTimeField(blank=True, null=True)
+    datetime_finished = models.DateTimeField(blank=True, null=True)
+
+    objects = models.Manager()
+    pending_events = PendingOutboxEventManager()
+
     class Meta:
-        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id']),
+        ]
 
-    def messages(self):
-        return Question_Answer_Message.objectd.filter(question=self)
+    def __str__(self):
+        return f'OutboxEvent id={self.id} {self.name} ({self.get_status_display()})'
+
+
+class UploadSession(models.Model):
+    """
+      a file uploaded in chunks (see store.uploads), attached to its target
+      field when it is finalized
+    """
+    TARGET_LECTURE_FILE = 'lecture-file'
+    TARGET_COURSE_FILE = 'course-file'
+    TARGET_COURSE_IMAGE = 'course-image'
+    TARGETS = [
+        (TARGET_LECTURE_FILE, 'Lecture file'),
+        (TARGET_COURSE_FILE, 'Course file'),
+        (TARGET_COURSE_IMAGE, 'Course image'),
+    ]
+    UPLOAD_STATUS_OPEN = 'o'
+    UPLOAD_STATUS_COMPLETE = 'c'
+    UPLOAD_STATUS = [
+        (UPLOAD_STATUS_OPEN, 'Open'),
+        (UPLOAD_STATUS_COMPLETE, 'Complete'),
+    ]
 
-    def profile(self):
-        return Customer.objects.get(user=self.user)
+    id = models.UUIDField(primary_key=True, default=uuid4)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    target = models.CharField(max_length=20, choices=TARGETS)
+    target_id = models.PositiveBigIntegerField()
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # set while a request writes the chunk at `received`
+    chunk_started = models.DateTimeField(blank=True, null=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=1, choices=UPLOAD_STATUS, default=UPLOAD_STATUS_OPEN)
+    # the storage name of the finished file
+    file = models.CharField(max_length=255, blank=True)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+    datetime_completed = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'datetime_created']),
+        ]
 
+    def __str__(self):
+        return f'UploadSession {self.id} {self.filename} ({self.received}/{self.size})'
 
-class Question_Answer_Message(models.Model):
+
+class Question_Answer(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
-    question = models.ForeignKey(Question_Answer, on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
-    message = models.TextField(blank=True, null=True)
-    date = models.DateTimeField(default=timezone.now) 
+    title = models.CharField(max_length=1000, blank=True)
+    date = models.DateTimeField(default=timezone.now)   
+    # maintained by store.questions, run reconcile_counters to repair drift
+    reply_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
-        return f'{self.user.username} - {self.course.title}'
-    
+        return f'{self.user} - {self.course}'
+
     class Meta:
-        ordering = ['date']
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['course', 'date', 'id']),
+        ]
 
     def profile(self):
-        return Customer.objects.get(user=self.user)
+        # select_related('user__customer') makes this free
+        return getattr(self.user, 'customer', None) if self.user_id else None
 
 
 class Question_Answer_Message(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
-    question = models.ForeignKey(Question_Answer, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question_Answer, on_delete=models.CASCADE, related_name='messages')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     message = models.TextField(blank=True, null=True)
     
     date = models.DateTimeField(default=timezone.now) 
 
     def __str__(self):
-        return f'{self.user.username} - {self.course.title}'
+        return f'{self.user} - {self.course}'
     
     class Meta:
         ordering = ['date']
+        indexes = [
+            models.Index(fields=['question', 'date', 'id']),
+        ]
 
     def profile(self):
-        return Customer.objects.get(user=self.user)
+        return getattr(self.user, 'customer', None) if self.user_id else None
     
 
-class Customer(models.Model):
+class Customer(ImageHashMixin, LoadedValuesMixin, models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.PROTECT,)
     phone_number = models.CharField(max_length=255)
     birth_date = models.DateField(null=True, blank=True)
     image = models.FileField(upload_to='user_folder', default='default-user.jpg', null=True, blank=True)
+    # content hash of image, names its derivatives (see store.images)
+    image_hash = models.CharField(max_length=64, blank=True)
     country = models.CharField(max_length=255, null=True, blank=True)
     about = models.TextField(blank=True, null=True)
     date = models.DateTimeField(auto_now_add=True)
@@ -291,7 +511,7 @@ class UnpaidOrderManager(models.Manager):
 #         return super().get_queryset()
 
 
-class Order(models.Model):
+class Order(LoadedValuesMixin, models.Model):
     ORDER_STATUS_PAID = 'p'
     ORDER_STATUS_UNPAID = 'u'
     ORDER_STATUS_CANCELED = 'c'
@@ -304,9 +524,14 @@ class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='orders')
     datetime_created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=1, choices=ORDER_STATUS, default=ORDER_STATUS_UNPAID)
+    # sum and number of the items, kept up to date by store.orders
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    items_count = models.PositiveIntegerField(default=0)
 
 
     zarinpal_authority = models.CharField(max_length=255, blank=True)
+    # when zarinpal_authority was requested, the customer pays after that
+    payment_requested_at = models.DateTimeField(blank=True, null=True)
     zarinpal_ref_id = models.CharField(max_length=150, blank=True)
     zarinpal_data = models.TextField(blank=True)
 
@@ -314,15 +539,22 @@ class Order(models.Model):
     objects = models.Manager()
     unpaid_orders = UnpaidOrderManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['datetime_created', 'id']),
+            models.Index(fields=['customer', 'datetime_created', 'id']),
+            models.Index(fields=['status', 'datetime_created', 'total']),
+            models.Index(fields=['total', 'id']),
+        ]
+
     def __str__(self):
         return f'Order id={self.id}'
     
     def get_total_price(self):
-        total = sum([item.get_cost() for item in self.items.all()])
-        return total
+        return self.total
     
 
-class OrderItem(models.Model):
+class OrderItem(LoadedValuesMixin, models.Model):
     order = models.ForeignKey(Order, on_delete=models.PROTECT, related_name='items')
     course = models.ForeignKey(Course, on_delete=models.PROTECT, related_name='order_items')
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE)
@@ -334,6 +566,28 @@ class OrderItem(models.Model):
     def get_cost(self):
         return self.unit_price     
 
+
+class CourseSalesDay(models.Model):
+    """
+      paid sales of a course per day (the day the order was created),
+      maintained by store.sales, rebuild_sales_rollups recomputes it
+    """
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='sales_days')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='sales_days')
+    day = models.DateField()
+    sales_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['teacher', 'course', 'day'], name='unique_course_sales_day'),
+        ]
+        indexes = [
+            models.Index(fields=['teacher', 'day']),
+            models.Index(fields=['day']),
+        ]
+
+
 class CommentManager(models.Manager):
     def get_approved(self):
         return self.get_queryset().filter(status=Comment.COMMENT_STATUS_APPROVED)
@@ -344,7 +598,7 @@ class ApprovedCommentManager(models.Manager):
         return super().get_queryset().filter(status=Comment.COMMENT_STATUS_APPROVED)
 
 
-class Comment(models.Model):
+class Comment(LoadedValuesMixin, models.Model):
     COMMENT_STATUS_WAITING = 'w'
     COMMENT_STATUS_APPROVED = 'a'
     COMMENT_STATUS_NOT_APPROVED = 'na'
@@ -365,6 +619,14 @@ class Comment(models.Model):
     objects = CommentManager()
     Approved = ApprovedCommentManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'datetime_created', 'id']),
+        ]
+
+    def is_approved(self):
+        return self.status == self.COMMENT_STATUS_APPROVED
+
     
 
     
@@ -404,30 +666,41 @@ class CompletedLesson(models.Model):
         return self.course.title    
     
 class EnrolledCourse(models.Model):
+    ENROLLMENT_STATUS_PENDING = 'p'
+    ENROLLMENT_STATUS_ACTIVE = 'a'
+    ENROLLMENT_STATUS = [
+        (ENROLLMENT_STATUS_PENDING, 'Pending payment'),
+        (ENROLLMENT_STATUS_ACTIVE, 'Active'),
+    ]
+
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='enrolled')
     order_item = models.ForeignKey(OrderItem, on_delete=models.CASCADE)
     date = models.DateTimeField(default=timezone.now)
+    status = models.CharField(max_length=1, choices=ENROLLMENT_STATUS, default=ENROLLMENT_STATUS_ACTIVE)
+
+    # maintained by store.progress, run reconcile_counters to repair drift
+    lessons_completed = models.PositiveIntegerField(default=0)
+    lessons_total = models.PositiveIntegerField(default=0)
+    progress = models.FloatField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+
+    # related sets of the enrolled course, all of them can be prefetched
+    letures = PrefetchableRelation('store.VariantItem', variant__course_id='course_id')
+    completed_lesson = PrefetchableRelation('store.CompletedLesson', course_id='course_id', user_id='user_id')
+    curriculum = PrefetchableRelation('store.Variant', course_id='course_id')
+    note = PrefetchableRelation('store.Note', course_id='course_id', user_id='user_id')
+    question_answer = PrefetchableRelation('store.Question_Answer', course_id='course_id')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'id']),
+        ]
 
     def __str__(self):
         return self.course.title
     
-    def letures(self):
-        return VariantItem.objects.filter(variant__course=self.course)
-    
-    def completed_lesson(self):
-        return CompletedLesson.objects.filter(course=self.course, user=self.user)
-    
-    def curriculum(self):
-        return Variant.objects.filter(course=self.course)
-    
-    def note(self):
-        return Note.objects.filter(course=self.course, user=self.user)
-    
-    def question_answer(self):
-        return Question_Answer.objects.filter(course=self.course)
-    
     def review(self):
         return Comment.objects.filter(course=self.course, user=self.user).first()    
 
@@ -453,6 +726,12 @@ class Notification(models.Model):
     seen = models.BooleanField(default=False)
     date = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'seen']),
+            models.Index(fields=['user', 'date', 'id']),
+        ]
+
     def __str__(self):
         return self.type
 
@@ -0,0 +1,189 @@
+import asyncio
+import json
+from collections import Counter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+
+from store.cache import get_cache, is_shared, new_version
+from store.models import Course, Notification, OrderItem
+
+
+UNREAD_TIMEOUT = 60 * 10
+
+
+def unread_key(user_id):
+    return f'store:notifications:unread:{user_id}'
+
+
+def latest_key(user_id):
+    # changes whenever the user gets a notification
+    return f'store:notifications:latest:{user_id}'
+
+
+def notify(notifications):
+    """
+      inserts notifications with one bulk INSERT. Once the transaction
+      commits the cached unread counts of their users go up and the open
+      event streams (see store.views.notification_stream) are woken up.
+    """
+    notifications = [notification for notification in notifications if notification.user_id is not None]
+    if not notifications:
+        return []
+    notifications = Notification.objects.bulk_create(notifications)
+    unread = Counter(notification.user_id for notification in notifications if not notification.seen)
+    transaction.on_commit(lambda: notified(unread))
+    return notifications
+
+
+def notified(unread):
+    cache = get_cache()
+    for user_id, count in unread.items():
+        try:
+            cache.incr(unread_key(user_id), count)
+        except ValueError:
+            # not cached, the next unread_count() counts it
+            pass
+    # the streams only need to know that something changed, they read the
+    # new rows themselves (MySQL doesn't return ids of bulk inserted rows)
+    version = new_version()
+    cache.set_many({latest_key(user_id): version for user_id in unread}, timeout=None)
+
+
+def unread_count(user_id):
+    cache = get_cache()
+    count = cache.get(unread_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, seen=False).count()
+        cache.add(unread_key(user_id), count, timeout=UNREAD_TIMEOUT)
+    return count
+
+
+def mark_all_seen(user_id):
+    """
+      marks every unseen notification of the user seen with one UPDATE
+    """
+    updated = Notification.objects.filter(user_id=user_id, seen=False).update(seen=True)
+    transaction.on_commit(lambda: get_cache().set(unread_key(user_id), 0, timeout=UNREAD_TIMEOUT))
+    return updated
+
+
+def mark_seen(user_id, notification_ids):
+    updated = Notification.objects.filter(user_id=user_id, id__in=notification_ids, seen=False).update(seen=True)
+    if updated:
+        transaction.on_commit(lambda: get_cache().delete(unread_key(user_id)))
+    return updated
+
+
+def orders_paid(order_ids):
+    """
+      tells the teachers about every item of the paid orders and the
+      students that their enrollments are active
+    """
+    items = OrderItem.objects.filter(order_id__in=order_ids) \
+        .values_list('id', 'order_id', 'teacher_id', 'teacher__user_id', 'order__customer__user_id')
+    # a retried delivery must not notify twice
+    sent = set(
+        Notification.objects.filter(order_id__in=order_ids, type__in=['New Order', 'Course Enrollment Completed'])
+        .values_list('type', 'order_id', 'order_item_id')
+    )
+    notifications = []
+    students = {}
+    for item_id, order_id, teacher_id, teacher_user_id, student_user_id in items:
+        if ('New Order', order_id, item_id) not in sent:
+            notifications.append(Notification(
+                user_id=teacher_user_id, teacher_id=teacher_id, order_id=order_id, order_item_id=item_id, type='New Order',
+            ))
+        if ('Course Enrollment Completed', order_id, None) not in sent:
+            students[order_id] = student_user_id
+    notifications.extend(
+        Notification(user_id=user_id, order_id=order_id, type='Course Enrollment Completed') for order_id, user_id in students.items()
+    )
+    return notify(notifications)
+
+
+def comment_saved(comment, created):
+    if created:
+        teacher_id, user_id = Course.objects.filter(id=comment.course_id).values_list('teacher_id', 'teacher__user_id').get()
+        notify([Notification(user_id=user_id, teacher_id=teacher_id, review_id=comment.id, type='New Review')])
+
+
+def question_saved(question, created):
+    if created:
+        teacher_id, user_id = Course.objects.filter(id=question.course_id).values_list('teacher_id', 'teacher__user_id').get()
+        if user_id != question.user_id:
+            notify([Notification(user_id=user_id, teacher_id=teacher_id, type='New Course Question')])
+
+
+def event(name, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {name}', f'data: {json.dumps(data, cls=DjangoJSONEncoder)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+async def stream(user_id, last_id=None, poll_interval=1, heartbeat=15, duration=300, db_check=5):
+    """
+      server-sent events of user_id: a `notification` event for every new
+      notification after last_id and an `unread` event whenever the unread
+      count changes. Every poll is one cache round trip, the database is
+      only read when latest_key() changed. Ends after `duration` seconds,
+      EventSource reconnects with the last event id.
+
+      A local memory cache doesn't see the notifications and reads of other
+      processes, with it every db_check-th poll also asks the database for
+      newer rows (one indexed EXISTS) and recounts the unread ones.
+    """
+    cache = get_cache()
+    check = None if is_shared(cache) else db_check
+    polls = 0
+    notifications = Notification.objects.filter(user_id=user_id).order_by('id')
+    if last_id is None:
+        last_id = (await notifications.aaggregate(last_id=Max('id')))['last_id'] or 0
+    loop = asyncio.get_running_loop()
+    started = sent = loop.time()
+    missing = object()
+    latest = unread = None
+
+    yield 'retry: 3000\n\n'
+    while loop.time() - started < duration:
+        values = await cache.aget_many([unread_key(user_id), latest_key(user_id)])
+        checking = check is not None and polls % check == 0
+        polls += 1
+        changed = values.get(latest_key(user_id), missing) != latest
+        if not changed and checking:
+            changed = await notifications.filter(id__gt=last_id).aexists()
+        if changed:
+            latest = values.get(latest_key(user_id), missing)
+            count = 0
+            async for notification in notifications.filter(id__gt=last_id)[:100]:
+                count += 1
+                last_id = notification.id
+                sent = loop.time()
+                yield event('notification', {
+                    'id': notification.id,
+                    'type': notification.type,
+                    'order': notification.order_id,
+                    'order_item': notification.order_item_id,
+                    'review': notification.review_id,
+                    'date': notification.date,
+                }, notification.id)
+            if count == 100:
+                # read the rest on the next poll
+                latest = None
+
+        count = None if checking else values.get(unread_key(user_id))
+        if count is None:
+            count = await notifications.filter(seen=False).acount()
+            if checking:
+                await cache.aset(unread_key(user_id), count, timeout=UNREAD_TIMEOUT)
+            else:
+                await cache.aadd(unread_key(user_id), count, timeout=UNREAD_TIMEOUT)
+        if count != unread:
+            unread = count
+            sent = loop.time()
+            yield event('unread', {'unread': count})
+        elif loop.time() - sent >= heartbeat:
+            sent = loop.time()
+            yield ': keep-alive\n\n'
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,87 @@
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDay, TruncMonth
+
+from store.counters import loaded_values
+from store.models import Order, OrderItem
+
+
+def item_totals():
+    """
+      total and items_count of an order computed from its items, to be used
+      in an UPDATE or annotate() of orders
+    """
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    return {
+        'total': Coalesce(
+            Subquery(items.annotate(total=Sum('unit_price')).values('total')),
+            Value(0),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        'items_count': Coalesce(Subquery(items.annotate(count=Count('id')).values('count')), Value(0)),
+    }
+
+
+def recompute_totals(order_ids):
+    return Order.objects.filter(id__in=order_ids).update(**item_totals())
+
+
+def order_item_saved(instance, created):
+    old = loaded_values(instance, 'order_id', 'unit_price')
+    if not created and old is not None and (old['order_id'], old['unit_price']) == (instance.order_id, instance.unit_price):
+        return
+    order_ids = {instance.order_id}
+    if old is not None:
+        order_ids.add(old['order_id'])
+    recompute_totals(order_ids)
+
+
+def order_item_deleted(instance):
+    recompute_totals([instance.order_id])
+
+
+def reconcile_orders(chunk_size=1000):
+    """
+      recomputes total and items_count of every order, chunk_size orders at
+      a time, and returns how many of them had drifted
+    """
+    orders = Order.objects.order_by('id').annotate(**{f'actual_{name}': value for name, value in item_totals().items()})
+    drifted = 0
+    last_id = 0
+    while True:
+        chunk = list(orders.filter(id__gt=last_id).only('id', 'total', 'items_count')[:chunk_size])
+        if not chunk:
+            return drifted
+        last_id = chunk[-1].id
+
+        changed = []
+        for order in chunk:
+            if order.total != order.actual_total or order.items_count != order.actual_items_count:
+                order.total = order.actual_total
+                order.items_count = order.actual_items_count
+                changed.append(order)
+        Order.objects.bulk_update(changed, ['total', 'items_count'])
+        drifted += len(changed)
+
+
+PERIODS = {
+    'day': TruncDay,
+    'month': TruncMonth,
+}
+
+
+def revenue(orders, period=None):
+    """
+      revenue, order and item counts of orders with one aggregate query,
+      per day or month when period is given
+    """
+    totals = {
+        'revenue': Coalesce(Sum('total'), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        'orders': Count('id'),
+        'items': Coalesce(Sum('items_count'), Value(0)),
+    }
+    if period is None:
+        return orders.order_by().aggregate(**totals)
+    return list(
+        orders.order_by().annotate(period=PERIODS[period]('datetime_created')).values('period')
+        .annotate(**totals).order_by('period')
+    )
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.models import OutboxEvent
+
+
+# event name -> consumers, every consumer gets a list of payloads
+CONSUMERS = defaultdict(list)
+
+
+def consumer(name):
+    """
+      registers a function as a consumer of the `name` events:
+
+          @outbox.consumer('order_created')
+          def send_welcome_emails(payloads):
+              ...
+
+      Consumers run in runoutbox, a batch of payloads at a time. A batch
+      whose consumer failed is retried as a whole and is delivered again to
+      every consumer of `name`, also those that succeeded, so consumers have
+      to be idempotent.
+    """
+    def register(function):
+        CONSUMERS[name].append(function)
+        return function
+    return register
+
+
+def publish(name, *payloads):
+    """
+      stores events in the current transaction, they are delivered only if
+      it commits
+    """
+    return OutboxEvent.objects.bulk_create([OutboxEvent(name=name, payload=payload) for payload in payloads])
+
+
+def claim_events(batch_size):
+    with transaction.atomic():
+        events = list(OutboxEvent.pending_events.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        if events:
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+                status=OutboxEvent.EVENT_STATUS_RUNNING,
+                attempts=F('attempts') + 1,
+                datetime_started=timezone.now(),
+            )
+    return events
+
+
+def requeue_stale_events(stale_after):
+    started_before = timezone.now() - timedelta(seconds=stale_after)
+    return OutboxEvent.objects.filter(
+        status=OutboxEvent.EVENT_STATUS_RUNNING,
+        datetime_started__lt=started_before,
+    ).update(status=OutboxEvent.EVENT_STATUS_PENDING)
+
+
+def complete_events(events):
+    OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+        status=OutboxEvent.EVENT_STATUS_DONE,
+        error='',
+        datetime_finished=timezone.now(),
+    )
+
+
+def fail_events(events, error, max_attempts, backoff=30):
+    """
+      puts the events back in the queue, delayed backoff * 2^attempts
+      seconds, or marks them failed after max_attempts
+    """
+    now = timezone.now()
+    # event.attempts is the value before claim_events incremented it
+    for attempts in {event.attempts for event in events}:
+        ids = [event.id for event in events if event.attempts == attempts]
+        if attempts + 1 < max_attempts:
+            status = OutboxEvent.EVENT_STATUS_PENDING
+        else:
+            status = OutboxEvent.EVENT_STATUS_FAILED
+        OutboxEvent.objects.filter(id__in=ids).update(
+            status=status,
+            error=str(error),
+            available_at=now + timedelta(seconds=backoff * 2 ** attempts),
+            datetime_finished=now,
+        )
+
+
+def prune_events(older_than):
+    return OutboxEvent.objects.filter(
+        status=OutboxEvent.EVENT_STATUS_DONE,
+        datetime_finished__lt=timezone.now() - older_than,
+    ).delete()[0]
+
+
+def deliver(function, payloads):
+    # runs in a worker thread, which has its own database connection
+    try:
+        return function(payloads)
+    finally:
+        close_old_connections()
+
+
+def dispatch(pool, events, max_attempts, log=None):
+    """
+      delivers claimed events to their consumers in the pool, one task per
+      consumer and event name. Returns the number of delivered events.
+    """
+    batches = defaultdict(list)
+    for event in events:
+        batches[event.name].append(event)
+
+    futures = {}
+    for name, batch in batches.items():
+        payloads = [event.payload for event in batch]
+        for function in CONSUMERS.get(name, []):
+            futures[pool.submit(deliver, function, payloads)] = (name, function)
+
+    failed = {}
+    for future, (name, function) in futures.items():
+        try:
+            future.result()
+        except Exception as error:
+            failed.setdefault(name, f'{function.__module__}.{function.__name__}: {error!r}')
+            if log:
+                log(f'{name} consumer {function.__name__} failed: {error!r}')
+
+    for name, error in failed.items():
+        fail_events(batches[name], error, max_attempts)
+    delivered = [event for name, batch in batches.items() if name not in failed for event in batch]
+    complete_events(delivered)
+    return len(delivered)
@@ -1,5 +1,40 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 class DefaultPagination(PageNumberPagination):
-    paage_size = 10
+    page_size = 10
 
+
+class CreatedCursorPagination(CursorPagination):
+    """
+      keyset pagination for the big tables: every page is an index range
+      scan on (datetime_created, id), no COUNT(*) and no OFFSET
+    """
+    ordering = ('-datetime_created', '-id')
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class DateCursorPagination(CreatedCursorPagination):
+    ordering = ('-date', '-id')
+
+
+class ThreadCursorPagination(CreatedCursorPagination):
+    """
+      messages of a thread, oldest first
+    """
+    ordering = ('date', 'id')
+    page_size = 20
+
+
+class RankedCursorPagination(CreatedCursorPagination):
+    """
+      search results (see store.search) are paged best match first unless
+      the client asked for an explicit ?ordering=
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if 'search_rank' in queryset.query.annotations and ordering == self.ordering:
+            return ('-search_rank', '-id')
+        return ordering
@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from store import outbox, students, zarinpal
+from store.cache import bump_version
+from store.models import EnrolledCourse, Order
+from store.sales import orders_paid
+
+
+def activate_enrollments(order_ids):
+    """
+      makes the enrollments of paid orders active
+    """
+    pending = EnrolledCourse.objects.filter(order_item__order_id__in=order_ids, status=EnrolledCourse.ENROLLMENT_STATUS_PENDING)
+    enrollments = list(pending.values_list('course_id', 'user_id'))
+    course_ids = {course_id for course_id, _ in enrollments}
+    if course_ids:
+        pending.update(status=EnrolledCourse.ENROLLMENT_STATUS_ACTIVE)
+        # update() sends no post_save, the summaries count active enrollments
+        students.forget_summaries([user_id for _, user_id in enrollments])
+        transaction.on_commit(lambda: bump_version('courses', *[f'courses:{course_id}' for course_id in course_ids]))
+    return len(course_ids)
+
+
+def mark_paid(verifications):
+    """
+      stores {order_id: gateway verification} of orders that were paid and
+      activates their enrollments. Orders that aren't unpaid any more (e.g.
+      the callback and the reconciler both verified them) are left alone,
+      returns the ids of the orders that changed.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update().filter(id__in=verifications, status=Order.ORDER_STATUS_UNPAID)
+            .only('id', 'status', 'zarinpal_ref_id', 'zarinpal_data')
+        )
+        for order in orders:
+            data = verifications[order.id]
+            order.status = Order.ORDER_STATUS_PAID
+            order.zarinpal_ref_id = data.get('RefID') or ''
+            order.zarinpal_data = data
+        Order.objects.bulk_update(orders, ['status', 'zarinpal_ref_id', 'zarinpal_data'])
+        activate_enrollments([order.id for order in orders])
+        # bulk_update sends no post_save, the sales rollup is updated here
+        orders_paid([order.id for order in orders])
+        outbox.publish('order_paid', *[{'order_id': order.id} for order in orders])
+    return [order.id for order in orders]
+
+
+def mark_canceled(order_ids):
+    """
+      cancels the orders that are still unpaid and deletes their pending
+      enrollments, returns how many orders were canceled
+    """
+    with transaction.atomic():
+        order_ids = list(
+            Order.objects.select_for_update().filter(id__in=order_ids, status=Order.ORDER_STATUS_UNPAID).values_list('id', flat=True)
+        )
+        if order_ids:
+            Order.objects.filter(id__in=order_ids).update(status=Order.ORDER_STATUS_CANCELED)
+            EnrolledCourse.objects.filter(order_item__order_id__in=order_ids, status=EnrolledCourse.ENROLLMENT_STATUS_PENDING).delete()
+    return len(order_ids)
+
+
+def reconcile_payments(batch_size=100, workers=8, settle_after=timedelta(minutes=15), cancel_after=timedelta(days=1), client=None, log=None):
+    """
+      verifies unpaid orders that went to the gateway (payment_requested_at)
+      at least settle_after ago, batch_size orders at a time in id order and
+      `workers` gateway calls at once. Paid orders are marked paid, orders
+      the gateway says were never paid are canceled once their payment was
+      requested more than cancel_after ago.
+
+      Stops early when the gateway is unavailable. Returns the counts of
+      paid, canceled, pending and failed verifications.
+    """
+    client = client or zarinpal.get_client()
+    now = timezone.now()
+    orders = Order.unpaid_orders.exclude(zarinpal_authority='') \
+        .filter(payment_requested_at__lte=now - settle_after).order_by('id')
+    totals = {'paid': 0, 'canceled': 0, 'pending': 0, 'failed': 0}
+
+    def verify(order):
+        try:
+            return order, client.verify_payment(order.total, order.zarinpal_authority)
+        except zarinpal.GatewayError as error:
+            return order, error
+
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(orders.filter(id__gt=last_id).only('id', 'payment_requested_at', 'zarinpal_authority', 'total')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            paid = {}
+            canceled = []
+            failed = 0
+            for order, result in pool.map(verify, batch):
+                if isinstance(result, Exception):
+                    failed += 1
+                elif result.get('Status') in (zarinpal.PAYMENT_OK, zarinpal.PAYMENT_VERIFIED_BEFORE):
+                    paid[order.id] = result
+                elif result.get('Status') in zarinpal.PAYMENT_FAILED and order.payment_requested_at <= now - cancel_after:
+                    canceled.append(order.id)
+                else:
+                    totals['pending'] += 1
+
+            totals['paid'] += len(mark_paid(paid)) if paid else 0
+            totals['canceled'] += mark_canceled(canceled) if canceled else 0
+            totals['failed'] += failed
+            if log:
+                log(f'Orders up to {last_id}: {len(paid)} paid, {len(canceled)} canceled, {failed} failed')
+            if failed == len(batch):
+                if log:
+                    log('The gateway is unavailable, stopping')
+                break
+    return totals
@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from store.models import Course, EnrolledCourse, Teacher, UploadSession, VariantItem
 import copy
 
 class IsAdminOrReadOnly(permissions.BasePermission):
@@ -12,6 +13,77 @@ class SendPrivateEmailToCustomerPermission(permissions.BasePermission):
     def has_permission(self, request, view):
         return bool(request.user and request.user.has_perm('store.send_private_email'))    
     
+class IsTeacherOrAdmin(permissions.BasePermission):
+    """
+      staff, or the user of the teacher in the teacher_id url kwarg
+    """
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        return bool(
+            request.user and request.user.is_authenticated
+            and Teacher.objects.filter(id=view.kwargs['teacher_id'], user_id=request.user.id).exists()
+        )
+
+
+class CanViewStudentSummary(permissions.BasePermission):
+    """
+      students see their own summary, teachers those of the students of
+      their courses and staff anyone's
+    """
+    def has_permission(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return False
+        if request.user.is_staff:
+            return True
+        user_ids = set(view.get_user_ids()) - {request.user.id}
+        if not user_ids:
+            return True
+        students = EnrolledCourse.objects.filter(
+            course__teacher__user_id=request.user.id, user_id__in=user_ids, status=EnrolledCourse.ENROLLMENT_STATUS_ACTIVE,
+        ).values('user_id').distinct()
+        return students.count() == len(user_ids)
+
+
+class IsEnrolledOrTeacherOrReadOnly(permissions.BasePermission):
+    """
+      anyone can read, students with an active enrollment in the course_pk
+      course, its teacher and staff can write
+    """
+    def has_permission(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        if not (request.user and request.user.is_authenticated):
+            return False
+        if request.user.is_staff:
+            return True
+        course_id = view.kwargs['course_pk']
+        return EnrolledCourse.objects.filter(
+            course_id=course_id, user_id=request.user.id, status=EnrolledCourse.ENROLLMENT_STATUS_ACTIVE,
+        ).exists() or Course.objects.filter(id=course_id, teacher__user_id=request.user.id).exists()
+
+
+class CanUploadToTarget(permissions.BasePermission):
+    """
+      staff, or the teacher of the course an upload is for
+    """
+    def has_permission(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return False
+        if request.user.is_staff or request.method != 'POST' or view.action != 'create':
+            return True
+        target = request.data.get('target')
+        try:
+            target_id = int(request.data.get('target_id'))
+        except (TypeError, ValueError):
+            # the serializer reports it
+            return True
+        courses = Course.objects.filter(teacher__user_id=request.user.id)
+        if target == UploadSession.TARGET_LECTURE_FILE:
+            return VariantItem.objects.filter(id=target_id, variant__course__in=courses).exists()
+        return courses.filter(id=target_id).exists()
+
+
 import copy
 class CustomDjangoModelPermissions(permissions.DjangoModelPermissions):
     def __init__(self) -> None:
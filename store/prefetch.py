@@ -0,0 +1,225 @@
+from functools import lru_cache
+
+from django.apps import apps
+from django.db import models
+from django.db.models import F, Prefetch
+from django.utils.functional import cached_property
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+class PrefetchableRelationManager(models.Manager):
+    """
+      manager returned by PrefetchableRelation for one instance, it reads
+      from the prefetch cache when the relation was prefetched
+    """
+
+    def __init__(self, relation, instance):
+        super().__init__()
+        self.model = relation.model
+        self.relation = relation
+        self.instance = instance
+
+    def _apply_rel_filters(self, queryset):
+        return queryset.filter(**self.relation.filters_for(self.instance))
+
+    def get_queryset(self):
+        try:
+            return self.instance._prefetched_objects_cache[self.relation.name]
+        except (AttributeError, KeyError):
+            return self._apply_rel_filters(super().get_queryset())
+
+
+class PrefetchableRelation:
+    """
+      related set that is not a plain foreign key, e.g. the CompletedLesson
+      rows matching both the course and the user of an enrollment.
+
+          completed_lesson = PrefetchableRelation('store.CompletedLesson', course_id='course_id', user_id='user_id')
+
+      each keyword maps a lookup on the related model to an attribute of the
+      instance, `where` adds fixed filters. It can be used in
+      prefetch_related() like a reverse foreign key and then costs one query
+      for the whole queryset.
+    """
+
+    def __init__(self, related_model, where=None, **match):
+        self.related_model = related_model
+        self.where = where or {}
+        self.match = match
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    @cached_property
+    def model(self):
+        if isinstance(self.related_model, str):
+            return apps.get_model(self.related_model)
+        return self.related_model
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return PrefetchableRelationManager(self, instance)
+
+    def filters_for(self, instance):
+        return {**self.where, **{lookup: getattr(instance, attr) for lookup, attr in self.match.items()}}
+
+    def is_cached(self, instance):
+        return self.name in instance.__dict__ or self.name in getattr(instance, '_prefetched_objects_cache', {})
+
+    def get_prefetch_querysets(self, instances, querysets=None):
+        queryset = querysets[0] if querysets else self.model._default_manager.all()
+        queryset = queryset.filter(**self.where)
+
+        keys = {}
+        for index, (lookup, attr) in enumerate(self.match.items()):
+            values = {getattr(instance, attr) for instance in instances}
+            queryset = queryset.filter(**{f'{lookup}__in': values})
+            keys[f'_prefetch_{self.name}_{index}'] = F(lookup)
+        queryset = queryset.annotate(**keys)
+
+        def rel_obj_attr(obj):
+            return tuple(getattr(obj, key) for key in keys)
+
+        def instance_attr(instance):
+            return tuple(getattr(instance, attr) for attr in self.match.values())
+
+        return queryset, rel_obj_attr, instance_attr, False, self.name, False
+
+
+class QuerysetPlan:
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+
+    def add_select(self, lookup):
+        if lookup and lookup not in self.select_related:
+            self.select_related.append(lookup)
+
+    def add_prefetch(self, lookup, model=None, plan=None):
+        self.prefetch_related.append((lookup, model, plan))
+
+    def merge(self, plan, prefix):
+        for lookup in plan.select_related:
+            self.add_select(f'{prefix}__{lookup}')
+        for lookup, model, child_plan in plan.prefetch_related:
+            self.add_prefetch(f'{prefix}__{lookup}', model, child_plan)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        prefetches = []
+        for lookup, model, plan in self.prefetch_related:
+            if plan is None:
+                prefetches.append(lookup)
+            else:
+                prefetches.append(Prefetch(lookup, queryset=plan.apply(model._default_manager.all())))
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+
+def resolve_relation(model, attr):
+    """
+      returns (related model, is_many) for a relation attribute of model or
+      None when attr is a plain field, property or method
+    """
+    descriptor = getattr(model, attr, None)
+    if isinstance(descriptor, PrefetchableRelation):
+        return descriptor.model, True
+
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        name = field.get_accessor_name() if field.auto_created and not field.concrete else field.name
+        if name == attr:
+            return field.related_model, field.many_to_many or field.one_to_many
+    return None
+
+
+def resolve_path(model, source_attrs):
+    """
+      splits source_attrs into the longest chain of relations that can be
+      joined or prefetched, returning (lookup, related model, is_many)
+    """
+    lookup = []
+    for attr in source_attrs:
+        relation = resolve_relation(model, attr)
+        if relation is None:
+            break
+        model, is_many = relation
+        lookup.append(attr)
+        if is_many:
+            return '__'.join(lookup), model, True
+    return '__'.join(lookup), model, False
+
+
+def build_plan(serializer, model):
+    plan = QuerysetPlan()
+
+    for field in serializer.fields.values():
+        if field.source == '*':
+            if isinstance(field, serializers.BaseSerializer):
+                child_plan = build_plan(field, model)
+                plan.select_related.extend(l for l in child_plan.select_related if l not in plan.select_related)
+                plan.prefetch_related.extend(child_plan.prefetch_related)
+            continue
+
+        source_attrs = field.source_attrs
+
+        if isinstance(field, serializers.ListSerializer):
+            lookup, related_model, is_many = resolve_path(model, source_attrs)
+            if is_many:
+                plan.add_prefetch(lookup, related_model, build_plan(field.child, related_model))
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            lookup, related_model, is_many = resolve_path(model, source_attrs)
+            if lookup and is_many:
+                plan.add_prefetch(lookup)
+            elif lookup:
+                plan.add_select(lookup)
+                plan.merge(build_plan(field, related_model), lookup)
+            continue
+
+        if isinstance(field, ManyRelatedField):
+            lookup, related_model, is_many = resolve_path(model, source_attrs)
+            if is_many:
+                plan.add_prefetch(lookup)
+            continue
+
+        # plain fields and primary key related fields only need the joins
+        # leading up to the attribute, e.g. source='user.first_name'
+        if len(source_attrs) > 1 or (isinstance(field, RelatedField) and not field.use_pk_only_optimization()):
+            attrs = source_attrs if isinstance(field, RelatedField) else source_attrs[:-1]
+            lookup, related_model, is_many = resolve_path(model, attrs)
+            if lookup and is_many:
+                plan.add_prefetch(lookup)
+            elif lookup:
+                plan.add_select(lookup)
+
+    meta = getattr(serializer, 'Meta', None)
+    for lookup in getattr(meta, 'select_related', []):
+        plan.add_select(lookup)
+    for lookup in getattr(meta, 'prefetch_related', []):
+        plan.add_prefetch(lookup)
+
+    return plan
+
+
+@lru_cache(maxsize=None)
+def get_plan(serializer_class, model):
+    return build_plan(serializer_class(), model)
+
+
+def plan_queryset(serializer_class, queryset):
+    """
+      adds the select_related()/prefetch_related() calls needed to render
+      queryset with serializer_class, so the number of queries doesn't
+      depend on the number of rows
+
+      SerializerMethodFields can't be inspected, a serializer can list their
+      lookups in Meta.select_related and Meta.prefetch_related
+    """
+    return get_plan(serializer_class, queryset.model).apply(queryset)
@@ -0,0 +1,142 @@
+import math
+
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf
+
+from store.counters import loaded_values
+from store.models import CompletedLesson, EnrolledCourse, Variant, VariantItem
+
+
+def percent(completed, total):
+    return Coalesce(Cast(completed, FloatField()) * 100 / NullIf(total, Value(0)), Value(0.0))
+
+
+def course_lessons():
+    """
+      the number of lessons of the course in the row's course_id
+    """
+    lessons = VariantItem.objects.filter(variant__course_id=OuterRef('course_id')).order_by().values('variant__course_id')
+    return Coalesce(Subquery(lessons.annotate(count=Count('id')).values('count')), Value(0))
+
+
+def lesson_counts():
+    """
+      lessons_total, lessons_completed and last_activity of an enrollment
+      computed from the curriculum and the completed lessons, to be used in
+      an UPDATE or annotate() of enrollments
+    """
+    completed = CompletedLesson.objects.filter(course_id=OuterRef('course_id'), user_id=OuterRef('user_id')).order_by()
+    return {
+        'lessons_total': course_lessons(),
+        'lessons_completed': Coalesce(
+            Subquery(completed.values('user_id').annotate(count=Count('variant_item_id', distinct=True)).values('count')),
+            Value(0),
+        ),
+        'last_activity': Subquery(completed.order_by('-date').values('date')[:1]),
+    }
+
+
+def recompute_progress(enrollments):
+    enrollments.update(**lesson_counts())
+    return enrollments.update(progress=percent(F('lessons_completed'), F('lessons_total')))
+
+
+def lessons_changed(enrollments, completed=0, total=0, last_activity=None):
+    """
+      adds completed and total lessons (both may be negative) to the
+      enrollments queryset in one UPDATE.
+
+      progress has to be assigned first: MySQL evaluates SET from left to
+      right and would read the already incremented counters.
+    """
+    if completed < 0:
+        enrollments = enrollments.filter(lessons_completed__gte=-completed)
+    if total < 0:
+        enrollments = enrollments.filter(lessons_total__gte=-total)
+    values = {
+        'progress': percent(F('lessons_completed') + completed, F('lessons_total') + total),
+        'lessons_completed': F('lessons_completed') + completed,
+        'lessons_total': F('lessons_total') + total,
+    }
+    if last_activity is not None:
+        values['last_activity'] = last_activity
+    enrollments.update(**values)
+
+
+def lesson_completed(lesson, created):
+    if not created or lesson.user_id is None:
+        return
+    enrollments = EnrolledCourse.objects.filter(user_id=lesson.user_id, course_id=lesson.course_id)
+    # completing a lesson again only counts as activity
+    again = CompletedLesson.objects.filter(user_id=lesson.user_id, variant_item_id=lesson.variant_item_id).exclude(id=lesson.id).exists()
+    # lessons can be completed with an older date, last_activity only moves forward
+    lessons_changed(enrollments, completed=0 if again else 1, last_activity=Coalesce(Greatest(F('last_activity'), Value(lesson.date)), Value(lesson.date)))
+
+
+def lesson_uncompleted(lesson):
+    if lesson.user_id is None:
+        return
+    enrollments = EnrolledCourse.objects.filter(user_id=lesson.user_id, course_id=lesson.course_id)
+    again = CompletedLesson.objects.filter(user_id=lesson.user_id, variant_item_id=lesson.variant_item_id).exists()
+    # the last activity falls back to the latest lesson left
+    lessons_changed(enrollments, completed=0 if again else -1, last_activity=lesson_counts()['last_activity'])
+
+
+def curriculum_changed(variant_id, delta):
+    course_id = Variant.objects.filter(id=variant_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        lessons_changed(EnrolledCourse.objects.filter(course_id=course_id), total=delta)
+
+
+def variant_item_saved(item, created):
+    if created:
+        curriculum_changed(item.variant_id, 1)
+        return
+    old = loaded_values(item, 'variant_id')
+    if old is None or old['variant_id'] == item.variant_id:
+        return
+    # a lesson moved to a section of another course leaves the old course
+    courses = dict(Variant.objects.filter(id__in=[old['variant_id'], item.variant_id]).values_list('id', 'course_id'))
+    old_course_id, course_id = courses.get(old['variant_id']), courses.get(item.variant_id)
+    if old_course_id != course_id:
+        if old_course_id is not None:
+            lessons_changed(EnrolledCourse.objects.filter(course_id=old_course_id), total=-1)
+        if course_id is not None:
+            lessons_changed(EnrolledCourse.objects.filter(course_id=course_id), total=1)
+
+
+def variant_item_deleted(item):
+    curriculum_changed(item.variant_id, -1)
+
+
+def enrollment_saved(enrollment, created):
+    if created:
+        recompute_progress(EnrolledCourse.objects.filter(id=enrollment.id))
+
+
+def reconcile_progress(chunk_size=1000):
+    """
+      recomputes the progress of every enrollment, chunk_size enrollments
+      at a time, and returns how many of them had drifted
+    """
+    fields = ['lessons_total', 'lessons_completed', 'last_activity']
+    enrollments = EnrolledCourse.objects.order_by('id').annotate(**{f'actual_{name}': value for name, value in lesson_counts().items()})
+    drifted = 0
+    last_id = 0
+    while True:
+        chunk = list(enrollments.filter(id__gt=last_id).only('id', 'progress', *fields)[:chunk_size])
+        if not chunk:
+            return drifted
+        last_id = chunk[-1].id
+
+        changed = []
+        for enrollment in chunk:
+            actual = {name: getattr(enrollment, f'actual_{name}') for name in fields}
+            progress = actual['lessons_completed'] * 100 / actual['lessons_total'] if actual['lessons_total'] else 0.0
+            if any(getattr(enrollment, name) != value for name, value in actual.items()) or not math.isclose(enrollment.progress, progress):
+                actual['progress'] = progress
+                for name, value in actual.items():
+                    setattr(enrollment, name, value)
+                changed.append(enrollment)
+        EnrolledCourse.objects.bulk_update(changed, [*fields, 'progress'])
+        drifted += len(changed)
@@ -0,0 +1,59 @@
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from store.models import Question_Answer, Question_Answer_Message
+
+
+LATEST_MESSAGES = 3
+
+
+def latest_messages(count=LATEST_MESSAGES):
+    """
+      prefetches the last `count` messages of every question with their
+      authors into question.latest_messages, one query for the whole page
+      of questions however long the threads are
+    """
+    messages = Question_Answer_Message.objects.select_related('user__customer').order_by('-date', '-id')
+    return Prefetch('messages', queryset=messages[:count], to_attr='latest_messages')
+
+
+def replies_changed(question_id, delta):
+    questions = Question_Answer.objects.filter(id=question_id)
+    if delta < 0:
+        questions = questions.filter(reply_count__gte=-delta)
+    questions.update(reply_count=F('reply_count') + delta)
+
+
+def message_saved(message, created):
+    if created:
+        replies_changed(message.question_id, 1)
+
+
+def message_deleted(message):
+    replies_changed(message.question_id, -1)
+
+
+def reconcile_questions(chunk_size=1000):
+    """
+      recomputes reply_count of every question, chunk_size questions at a
+      time, and returns how many of them had drifted
+    """
+    messages = Question_Answer_Message.objects.filter(question=OuterRef('pk')).order_by().values('question')
+    questions = Question_Answer.objects.order_by('id').annotate(
+        actual_reply_count=Coalesce(Subquery(messages.annotate(count=Count('id')).values('count')), Value(0)),
+    )
+    drifted = 0
+    last_id = 0
+    while True:
+        chunk = list(questions.filter(id__gt=last_id).only('id', 'reply_count')[:chunk_size])
+        if not chunk:
+            return drifted
+        last_id = chunk[-1].id
+
+        changed = []
+        for question in chunk:
+            if question.reply_count != question.actual_reply_count:
+                question.reply_count = question.actual_reply_count
+                changed.append(question)
+        Question_Answer.objects.bulk_update(changed, ['reply_count'])
+        drifted += len(changed)
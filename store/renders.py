@@ -1,29 +1,65 @@
 from rest_framework.renderers import JSONRenderer
 
+
+def error_message(data):
+    try:
+        if isinstance(data, dict):
+            first_error_object = list(data.values())[0]
+            if isinstance(first_error_object, list):
+                return first_error_object[0]
+            return first_error_object
+        return data["detail"]
+    except:
+        return ''
+
+
+def envelope(data, status_code):
+    response = {
+        "success": True,
+        "code": status_code,
+        "data": data,
+        "message": None,
+    }
+
+    if not str(status_code).startswith('2'):
+        response["success"] = False
+        response["data"] = None
+        response["message"] = error_message(data)
+    return response
+
+
 class CustomRenderer(JSONRenderer):
     def render(self, data, accepted_media_type=None, renderer_context=None):
         status_code = renderer_context['response'].status_code
-        response = {
-            "success": True,
-            "code": status_code,
-            "data": data,
-            "message": None,
-        }
-
-        if not str(status_code).startswith('2'):
-            response["success"] = False
-            response["data"] = None
-            try:
-                if isinstance(data, dict):
-                    first_error_object = list(data.values())[0]  
-                    if isinstance(first_error_object, list):
-                        error_message = first_error_object[0]
-                    else:
-                        error_message = first_error_object
-                else:
-                    error_message = data["detail"]
-            except:
-                error_message =''
-            response["message"] = error_message
-        return super(CustomRenderer,self).render(response,accepted_media_type,renderer_context)
-        
+        return super(CustomRenderer,self).render(envelope(data, status_code),accepted_media_type,renderer_context)
+
+
+class StreamingJSONRenderer(CustomRenderer):
+    """
+      writes the same envelope as CustomRenderer for a list, item by item,
+      so the whole list is never held in memory. Use it through
+      store.mixins.StreamingListMixin.
+    """
+    chunk_size = 64 * 1024
+
+    def render_stream(self, items, status_code=200, renderer_context=None):
+        head = self.encode(envelope([], status_code), renderer_context)
+        # split the rendered envelope around the empty data list
+        before, after = head.split(b'[]', 1)
+
+        buffer = [before, b'[']
+        size = len(before) + 1
+        for index, item in enumerate(items):
+            if index:
+                buffer.append(b',')
+            chunk = self.encode(item, renderer_context)
+            buffer.append(chunk)
+            size += len(chunk) + 1
+            if size >= self.chunk_size:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+        buffer.extend([b']', after])
+        yield b''.join(buffer)
+
+    def encode(self, data, renderer_context=None):
+        return JSONRenderer.render(self, data, renderer_context=renderer_context)
@@ -0,0 +1,161 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncDay, TruncMonth
+from django.utils import timezone
+
+from store.counters import loaded_values
+from store.models import CourseSalesDay, Order, OrderItem
+
+
+def day_bounds(first_day, last_day):
+    """
+      aware datetimes from the start of first_day to the end of last_day, so
+      range filters on datetime_created can use its index
+    """
+    start = timezone.make_aware(datetime.combine(first_day, time.min))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min))
+    return start, end
+
+
+def sales_rows(items):
+    """
+      order items grouped by teacher, course and the day of their order
+    """
+    return list(
+        items.order_by().annotate(day=TruncDate('order__datetime_created'))
+        .values('teacher_id', 'course_id', 'day')
+        .annotate(sales_count=Count('id'), revenue=Sum('unit_price'))
+    )
+
+
+def add_sales(rows, sign=1):
+    """
+      adds (or with sign=-1 subtracts) rows of sales to the rollup. Missing
+      rows are inserted first, then every touched row is locked and updated
+      in one statement, so concurrent payments can't lose an increment.
+    """
+    deltas = {}
+    for row in rows:
+        key = (row['teacher_id'], row['course_id'], row['day'])
+        count, revenue = deltas.get(key, (0, 0))
+        deltas[key] = (count + sign * row['sales_count'], revenue + sign * row['revenue'])
+    if not deltas:
+        return 0
+
+    with transaction.atomic():
+        CourseSalesDay.objects.bulk_create(
+            [CourseSalesDay(teacher_id=teacher_id, course_id=course_id, day=day) for teacher_id, course_id, day in deltas],
+            ignore_conflicts=True,
+        )
+        days = CourseSalesDay.objects.select_for_update().filter(
+            course_id__in={course_id for _, course_id, _ in deltas},
+            day__in={day for _, _, day in deltas},
+        )
+        changed = []
+        for sales_day in days:
+            key = (sales_day.teacher_id, sales_day.course_id, sales_day.day)
+            if key in deltas:
+                sales_day.sales_count += deltas[key][0]
+                sales_day.revenue += deltas[key][1]
+                changed.append(sales_day)
+        CourseSalesDay.objects.bulk_update(changed, ['sales_count', 'revenue'])
+    return len(changed)
+
+
+def orders_paid(order_ids, sign=1):
+    return add_sales(sales_rows(OrderItem.objects.filter(order_id__in=order_ids)), sign)
+
+
+def order_saved(order, created):
+    old = loaded_values(order, 'status')
+    was_paid = old is not None and old['status'] == Order.ORDER_STATUS_PAID
+    is_paid = order.status == Order.ORDER_STATUS_PAID
+    if (old is not None or created) and was_paid != is_paid:
+        orders_paid([order.id], 1 if is_paid else -1)
+
+
+def order_item_saved(item, created):
+    fields = ('order_id', 'teacher_id', 'course_id', 'unit_price')
+    old = loaded_values(item, *fields)
+    if not created and (old is None or all(old[field] == getattr(item, field) for field in fields)):
+        return
+    paid = dict(
+        Order.objects.filter(id__in={item.order_id, old['order_id'] if old else item.order_id}, status=Order.ORDER_STATUS_PAID)
+        .annotate(day=TruncDate('datetime_created')).values_list('id', 'day')
+    )
+    rows = []
+    if not created and old['order_id'] in paid:
+        rows.append({'teacher_id': old['teacher_id'], 'course_id': old['course_id'], 'day': paid[old['order_id']],
+                     'sales_count': -1, 'revenue': -old['unit_price']})
+    if item.order_id in paid:
+        rows.append({'teacher_id': item.teacher_id, 'course_id': item.course_id, 'day': paid[item.order_id],
+                     'sales_count': 1, 'revenue': item.unit_price})
+    add_sales(rows)
+
+
+def order_item_deleted(item):
+    day = Order.objects.filter(id=item.order_id, status=Order.ORDER_STATUS_PAID) \
+        .annotate(day=TruncDate('datetime_created')).values_list('day', flat=True).first()
+    if day is not None:
+        add_sales([{'teacher_id': item.teacher_id, 'course_id': item.course_id, 'day': day,
+                    'sales_count': 1, 'revenue': item.unit_price}], -1)
+
+
+def rebuild_rollups(since=None, days_per_chunk=31, log=None):
+    """
+      recomputes the rollup from paid order items, days_per_chunk days per
+      transaction starting at since (the first order by default). Each
+      chunk replaces its days, so the rebuild can be stopped and rerun.
+    """
+    paid = Order.objects.filter(status=Order.ORDER_STATUS_PAID)
+    first = paid.order_by('datetime_created').values_list('datetime_created', flat=True).first()
+    if first is None:
+        return 0
+    day = since or timezone.localdate(first)
+    today = timezone.localdate()
+    written = 0
+    while day <= today:
+        last_day = min(day + timedelta(days=days_per_chunk - 1), today)
+        start, end = day_bounds(day, last_day)
+        rows = sales_rows(OrderItem.objects.filter(
+            order__status=Order.ORDER_STATUS_PAID, order__datetime_created__gte=start, order__datetime_created__lt=end,
+        ))
+        with transaction.atomic():
+            CourseSalesDay.objects.filter(day__gte=day, day__lte=last_day).delete()
+            CourseSalesDay.objects.bulk_create([CourseSalesDay(**row) for row in rows], batch_size=1000)
+        written += len(rows)
+        if log:
+            log(f'{day} - {last_day}: {len(rows)} rows')
+        day = last_day + timedelta(days=1)
+    return written
+
+
+PERIODS = {
+    'day': TruncDay,
+    'month': TruncMonth,
+}
+
+
+def teacher_sales(teacher_id, first_day, last_day, period='day', course_id=None):
+    """
+      sales and revenue of a teacher between two days (inclusive) read from
+      the rollup: the totals, a series per day or month and the totals per
+      course, with two queries on the (teacher, day) index
+    """
+    days = CourseSalesDay.objects.filter(teacher_id=teacher_id, day__gte=first_day, day__lte=last_day).order_by()
+    if course_id is not None:
+        days = days.filter(course_id=course_id)
+    totals = {
+        'sales': Coalesce(Sum('sales_count'), Value(0)),
+        'revenue': Coalesce(Sum('revenue'), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    }
+    series = list(days.annotate(period=PERIODS[period]('day')).values('period').annotate(**totals).order_by('period'))
+    courses = list(days.values('course_id', course_name=F('course__name')).annotate(**totals).order_by('-revenue', 'course_id'))
+    return {
+        'sales': sum(row['sales'] for row in courses),
+        'revenue': sum((row['revenue'] for row in courses), 0),
+        'series': series,
+        'courses': courses,
+    }
@@ -0,0 +1,179 @@
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from store.models import Course, CourseSearchTerm
+
+
+WEIGHTS = {
+    CourseSearchTerm.FIELD_NAME: 10,
+    CourseSearchTerm.FIELD_CATEGORY: 4,
+    CourseSearchTerm.FIELD_TEACHER: 4,
+    CourseSearchTerm.FIELD_DESCRIPTION: 1,
+}
+
+# course attribute holding the text of each indexed field
+SOURCES = {
+    CourseSearchTerm.FIELD_NAME: 'name',
+    CourseSearchTerm.FIELD_DESCRIPTION: 'description',
+    CourseSearchTerm.FIELD_CATEGORY: 'category.title',
+    CourseSearchTerm.FIELD_TEACHER: 'teacher.full_name',
+}
+
+# the course columns each indexed field depends on
+COLUMNS = {
+    CourseSearchTerm.FIELD_NAME: 'name',
+    CourseSearchTerm.FIELD_DESCRIPTION: 'description',
+    CourseSearchTerm.FIELD_CATEGORY: 'category_id',
+    CourseSearchTerm.FIELD_TEACHER: 'teacher_id',
+}
+
+TERM_LENGTH = CourseSearchTerm._meta.get_field('term').max_length
+MIN_TERM_LENGTH = 2
+BATCH_SIZE = 1000
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+      lower cased words of text, unicode aware so persian titles are indexed too
+    """
+    return [
+        token[:TERM_LENGTH]
+        for token in TOKEN_RE.findall((text or '').lower())
+        if len(token) >= MIN_TERM_LENGTH
+    ]
+
+
+def field_text(course, field):
+    value = course
+    for attr in SOURCES[field].split('.'):
+        value = getattr(value, attr)
+    return value
+
+
+def build_terms(course_id, field, text):
+    weight = WEIGHTS[field]
+    return [
+        CourseSearchTerm(term=term, course_id=course_id, field=field, weight=weight * count)
+        for term, count in Counter(tokenize(text)).items()
+    ]
+
+
+def index_course(course, fields=None):
+    """
+      replaces the index rows of course for fields (all by default)
+    """
+    fields = fields or list(WEIGHTS)
+    terms = []
+    for field in fields:
+        terms.extend(build_terms(course.id, field, field_text(course, field)))
+    with transaction.atomic():
+        CourseSearchTerm.objects.filter(course_id=course.id, field__in=fields).delete()
+        CourseSearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+
+def course_saved(course, created):
+    old = getattr(course, '_loaded_values', None)
+    if created or old is None:
+        index_course(course)
+        return
+    changed = [
+        field for field, column in COLUMNS.items()
+        if column not in old or old[column] != getattr(course, column)
+    ]
+    if changed:
+        index_course(course, changed)
+
+
+def reindex_field(courses, field, text):
+    """
+      gives every course of the courses queryset the same text for field,
+      used when a category or teacher is renamed
+    """
+    with transaction.atomic():
+        CourseSearchTerm.objects.filter(course__in=courses, field=field).delete()
+        ids = courses.order_by('id').values_list('id', flat=True)
+        last_id = 0
+        while True:
+            chunk = list(ids.filter(id__gt=last_id)[:BATCH_SIZE])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            CourseSearchTerm.objects.bulk_create(
+                [term for course_id in chunk for term in build_terms(course_id, field, text)],
+                batch_size=BATCH_SIZE,
+            )
+
+
+def category_saved(category, created):
+    old = getattr(category, '_loaded_values', None)
+    if not created and (old is None or old.get('title') != category.title):
+        reindex_field(Course.objects.filter(category_id=category.id), CourseSearchTerm.FIELD_CATEGORY, category.title)
+
+
+def teacher_saved(teacher, created):
+    old = getattr(teacher, '_loaded_values', None)
+    if not created and (old is None or old.get('full_name') != teacher.full_name):
+        reindex_field(Course.objects.filter(teacher_id=teacher.id), CourseSearchTerm.FIELD_TEACHER, teacher.full_name)
+
+
+def search_courses(queryset, query, fields=None):
+    """
+      courses of queryset containing a word starting with every word of
+      query, annotated with search_rank and ordered by it. fields limits the
+      match to some of the indexed fields.
+
+      Every word is one range scan on the (term, course, weight) index.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return queryset
+
+    terms = CourseSearchTerm.objects.all()
+    if fields:
+        terms = terms.filter(field__in=fields)
+
+    # terms are stored lower cased, istartswith is a plain LIKE 'word%' that
+    # MySQL can answer with a range scan (startswith would be LIKE BINARY)
+    matches = Q()
+    for token in tokens:
+        queryset = queryset.filter(id__in=terms.filter(term__istartswith=token).values('course_id'))
+        matches |= Q(term__istartswith=token)
+
+    rank = terms.filter(matches, course_id=OuterRef('id')).order_by().values('course_id') \
+        .annotate(rank=Sum('weight')).values('rank')
+    return queryset.annotate(search_rank=Coalesce(Subquery(rank), Value(0))).order_by('-search_rank', '-id')
+
+
+def rebuild_index(chunk_size=BATCH_SIZE, log=None):
+    """
+      rebuilds the whole index chunk_size courses at a time and returns the
+      number of indexed courses
+    """
+    CourseSearchTerm.objects.all().delete()
+    courses = Course.objects.select_related('category', 'teacher').only(
+        'id', 'name', 'description', 'category__title', 'teacher__full_name',
+    ).order_by('id')
+    indexed = 0
+    last_id = 0
+    while True:
+        chunk = list(courses.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return indexed
+        last_id = chunk[-1].id
+        terms = [
+            term
+            for course in chunk
+            for field in WEIGHTS
+            for term in build_terms(course.id, field, field_text(course, field))
+        ]
+        with transaction.atomic():
+            CourseSearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+        indexed += len(chunk)
+        if log:
+            log(f'{indexed} courses indexed')
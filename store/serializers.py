@@ -1,24 +1,65 @@
+from datetime import timedelta
 from decimal import Decimal
 from rest_framework import serializers
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.utils.text import slugify
-from django.db import transaction
-from store.models import Cart, CartItem, Category, Certificate, CompletedLesson, Customer, EnrolledCourse, Note, Notification, Order, OrderItem, Course, Comment, Question_Answer, Question_Answer_Message, Teacher, Variant, VariantItem, Wishlist
+from store.models import Cart, CartItem, Category, Certificate, CompletedLesson, Customer, EnrolledCourse, MediaJob, Note, Notification, Order, OrderItem, Course, Comment, Question_Answer, Question_Answer_Message, Teacher, UploadSession, Variant, VariantItem, Wishlist
+from store.carts import cart_store
+from store.checkout import checkout
+from store import images, uploads
 
 
 # DOLLORS_TO_RIALS = 500000
 TAX = 1.09
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+      urls of the resized copies of an image by size and format (see
+      store.images), null until they are derived
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image_hash')
+        super().__init__(**kwargs)
+
+    def to_representation(self, image_hash):
+        urls = images.image_urls(image_hash)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {size: {image_format: request.build_absolute_uri(url) for image_format, url in formats.items()} for size, formats in urls.items()}
+
+
 class CategorySerializer(serializers.ModelSerializer):
+    images = ImageVariantsField()
+    courses_count = serializers.IntegerField(read_only=True)
+    published_courses_count = serializers.IntegerField(read_only=True)
    
     class Meta:
         model = Category
-        fields = ['id', 'title', 'image','slug']
+        fields = ['id', 'title', 'image', 'images', 'slug', 'courses_count', 'published_courses_count']
 
     # def get_num_of_products(self, category):
     #     return category.products.count()
 
 
+class CategoryCourseSerializer(serializers.ModelSerializer):
+    title = serializers.CharField(source='name')
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, source='unit_price')
+
+    class Meta:
+        model = Course
+        fields = ['id', 'title', 'slug', 'image', 'price']
+
+
+class CategoryTreeSerializer(serializers.ModelSerializer):
+    courses = CategoryCourseSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Category
+        fields = ['id', 'title', 'image', 'slug', 'courses']
+
+
 class VariantItemSerializer(serializers.ModelSerializer):
         
     class Meta:
@@ -26,6 +67,27 @@ class VariantItemSerializer(serializers.ModelSerializer):
         fields = '__all__' 
 
 
+class MediaJobSerializer(serializers.ModelSerializer):
+    status = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = MediaJob
+        fields = ['id', 'variant_item', 'status', 'attempts', 'error', 'datetime_created', 'datetime_started', 'datetime_finished']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'target_id', 'filename', 'size', 'sha256', 'received', 'status', 'file', 'datetime_created', 'datetime_completed']
+        read_only_fields = ['received', 'status', 'file', 'datetime_completed']
+
+    def create(self, validated_data):
+        return uploads.start(self.context['request'].user, **validated_data)
+
+
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
@@ -60,7 +122,7 @@ class CustomerSerializer(serializers.ModelSerializer):
 
 
 class Question_Answer_MessageSerializer(serializers.ModelSerializer):
-    profile = CustomerSerializer(many=False)
+    profile = CustomerSerializer(source='user.customer', read_only=True)
     class Meta:
         model = Question_Answer_Message
         fields = '__all__'                 
@@ -69,8 +131,8 @@ class Question_Answer_MessageSerializer(serializers.ModelSerializer):
 
 
 class Question_AnswerSerializer(serializers.ModelSerializer):
-    messages = Question_Answer_MessageSerializer(many=True)
-    profile = CustomerSerializer(many=False)
+    messages = Question_Answer_MessageSerializer(many=True, read_only=True)
+    profile = CustomerSerializer(source='user.customer', read_only=True)
 
     class Meta:
         model = Question_Answer
@@ -78,10 +140,54 @@ class Question_AnswerSerializer(serializers.ModelSerializer):
 
 
 
+class QuestionMessageSerializer(serializers.ModelSerializer):
+    profile = CustomerSerializer(source='user.customer', read_only=True)
+
+    class Meta:
+        model = Question_Answer_Message
+        fields = ['id', 'question', 'user', 'message', 'date', 'profile']
+        read_only_fields = ['question', 'user', 'date']
+
+    def create(self, validated_data):
+        question = self.context['question']
+        return Question_Answer_Message.objects.create(
+            course_id=question.course_id,
+            question_id=question.id,
+            user_id=self.context['user_id'],
+            **validated_data,
+        )
+
+
+class QuestionSerializer(serializers.ModelSerializer):
+    profile = CustomerSerializer(source='user.customer', read_only=True)
+    # filled by store.questions.latest_messages()
+    latest_messages = QuestionMessageSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Question_Answer
+        fields = ['id', 'course', 'user', 'title', 'date', 'reply_count', 'profile', 'latest_messages']
+        read_only_fields = ['course', 'user', 'date', 'reply_count']
+
+    def create(self, validated_data):
+        question = Question_Answer.objects.create(course_id=int(self.context['course_pk']), user_id=self.context['user_id'], **validated_data)
+        question.latest_messages = []
+        return question
+
+
+
+class VariantSerializer(serializers.ModelSerializer):
+    variant_items = VariantItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Variant
+        fields = '__all__'         
+
+
+
 class EnrolledCourseSerializer(serializers.ModelSerializer):
     letures = VariantItemSerializer(many=True, read_only=True)
     completed_lesson = CompletedLessonSerializer(many=True, read_only=True)
-    curriculum = VariantItemSerializer(many=True, read_only=True)
+    curriculum = VariantSerializer(many=True, read_only=True)
     note = NoteSerializer(many=True, read_only=True)
     question_answer = Question_AnswerSerializer(many=True, read_only=True)
     comment= CommentSerializer(many=True, read_only=True)
@@ -96,9 +202,10 @@ class CourseSerializer(serializers.ModelSerializer):
     title = serializers.CharField(max_length=255, source='name')
     price = serializers.DecimalField(max_digits=255, decimal_places=2, source='unit_price')
     price_with_tax = serializers.SerializerMethodField(method_name='calculate_tax')
-    students = EnrolledCourseSerializer(many=True, read_only=True)
-    curiculum = VariantItemSerializer(many=True, read_only=True)
+    students = EnrolledCourseSerializer(source='active_enrollments', many=True, read_only=True)
+    curiculum = VariantSerializer(source='variant_set', many=True, read_only=True)
     lectures = VariantItemSerializer(many=True, read_only=True)
+    images = ImageVariantsField()
     # category = CategorySerializer()
     # category = serializers.HyperlinkedRelatedField(
     #     queryset = Category.objects.all(),
@@ -107,7 +214,7 @@ class CourseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Course
-        fields = ['id', 'title', 'price','price_with_tax', 'category', 'description', 'teacher', 'file', 'image', 'language', 'level', 'platform_status','curiculum' , 'students', 'lectures', 'teacher_course_status', 'featured', 'datetime_created']
+        fields = ['id', 'title', 'price','price_with_tax', 'category', 'description', 'teacher', 'file', 'image', 'images', 'language', 'level', 'platform_status','curiculum' , 'students', 'lectures', 'teacher_course_status', 'featured', 'datetime_created']
 
 
 
@@ -135,6 +242,16 @@ class CourseSerializer(serializers.ModelSerializer):
 
 
 
+class CourseListSerializer(CourseSerializer):
+    """
+      course lists leave out the enrollments of every course, they are on
+      the detail page
+    """
+
+    class Meta(CourseSerializer.Meta):
+        fields = [field for field in CourseSerializer.Meta.fields if field != 'students']
+
+
 #روش اول
 # class ProductSerializer(serializers.Serializer):
 #     id = serializers.IntegerField()
@@ -157,67 +274,37 @@ class CourseSerializer(serializers.ModelSerializer):
   
 
 
-class CartCourseSerializer(serializers.ModelSerializer):
-
-    class Meta:
-        model= Course
-        fields = ['id', 'name', 'unit_price']
+class CartItemCourseSerializer(serializers.Serializer):
+    """
+      input of adding or changing a cart item, the cart store (store.carts)
+      checks that the course exists
+    """
+    course = serializers.IntegerField()
 
 
-class UpdateCartItemSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = CartItem
-        fields = ['course']
+class CartItemsBulkSerializer(serializers.Serializer):
+    add = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=100)
+    remove = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=100)
 
 
+class CartCourseSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    unit_price = serializers.DecimalField(max_digits=6, decimal_places=2)
 
-class AddCartItemSerializer(serializers.ModelSerializer):
 
-    class Meta: 
-        model = CartItem
-        fields = ['id', 'course']
-
-    def create(self, validated_data):
-        cart_id = self.context['cart_pk']
-
-        course = validated_data.get('course')
-        
-
-        try:
-            cart_item =CartItem.objects.get(cart_id=cart_id, course_id=course.id)
-            
-            cart_item.save()
-
-        except CartItem.DoesNotExist:
-            cart_item = CartItem.objects.create(cart_id=cart_id, **validated_data)
-
-        self.instance = cart_item
-        return cart_item   
-
-
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
     course = CartCourseSerializer()
 
-    class Meta:
-        model = CartItem
-        fields = ['id', 'course']
-
-    
-
-class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
-    total_price = serializers.SerializerMethodField()
-
-   
-    class Meta:
-        model = Cart
-        fields = ['id', 'items', 'total_price']
-        read_only_fields= ['id']
-
-    def get_total_price(self, cart):
-       return sum([item.course.unit_price for item in cart.items.all()])
-    
 
+class CartSerializer(serializers.Serializer):
+    """
+      a cart as the cart store (store.carts) returns it
+    """
+    id = serializers.UUIDField()
+    items = CartItemSerializer(many=True)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
 
 
 class OrderCourseSerializer(serializers.ModelSerializer):
@@ -251,7 +338,7 @@ class OrderSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'status', 'datetime_created', 'items' ]
+        fields = ['id', 'customer', 'status', 'datetime_created', 'total', 'items_count', 'items' ]
 
 
 
@@ -262,89 +349,80 @@ class OrderForAdminSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'status', 'datetime_created', 'items' ]
+        fields = ['id', 'customer', 'status', 'datetime_created', 'total', 'items_count', 'items' ]
 
 
-class OrderUpdateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Order
-        fields = ['status']
+class OrderRevenueSerializer(serializers.Serializer):
+    period = serializers.DateTimeField(required=False)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    orders = serializers.IntegerField()
+    items = serializers.IntegerField()
 
 
+class TeacherSalesQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    period = serializers.ChoiceField(choices=['day', 'month'], default='day')
+    course = serializers.IntegerField(required=False)
 
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate())
+        data.setdefault('start', data['end'] - timedelta(days=29))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'start': ['start must not be after end.']})
+        return data
 
-class OrderCreateSerializer(serializers.Serializer):
-    cart_id = serializers.UUIDField()
-
-    def validate_cart_id(self, cart_id):
-        # try:
-        #     if Cart.objects.prefetch_related('items').get(id=cart_id).items.coount() == 0:
-        #         raise serializers.ValidationError('Your cart is empty.Please add some products')
-        # except Cart.DoesNotExist:
-        #     raise serializers.ValidationError('There is no cart with this cart id !')  
 
+class SalesPeriodSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    sales = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
 
-         if not Cart.objects.filter(id=cart_id).exists():
-            raise serializers.ValidationError('There is no cart with this cart id')
 
-         if CartItem.objects.filter(cart_id=cart_id).count() == 0:
-             raise serializers.ValidationError('Your cart is empty, please add some courses')
-         return cart_id
-    
-    def save(self, **kwargs):
-        with transaction.atomic():
-            cart_id = self.validated_data['cart_id']
-            user_id = self.context['user_id']
-            customer = Customer.objects.get(user_id=user_id)
+class CourseSalesSerializer(serializers.Serializer):
+    course_id = serializers.IntegerField()
+    course_name = serializers.CharField()
+    sales = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
 
-            order = Order()
-            order.customer = customer
-            order.save()
 
-            cart_items = CartItem.objects.select_related('course').filter(cart_id=cart_id)
+class TeacherSalesSerializer(serializers.Serializer):
+    sales = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    series = SalesPeriodSerializer(many=True)
+    courses = CourseSalesSerializer(many=True)
 
-            order_items = [
-                OrderItem(
-                    order=order,
-                    course=cart_item.course,
-                    unit_price=cart_item.course.unit_price,
-                    teacher=cart_item.course.teacher,
-                ) for cart_item in cart_items
-            ]
 
+class OrderUpdateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ['status']
 
-            # order_items = list()
-            # for cart_item in cart_items:
-            #     order_item = OrderItem()
-            #     order_item.order= order
-            #     order_item.product_id = cart_item.product_id
-            #     order_item.unit_price = cart_item.product.unit_price
-            #     order_item.quantity = cart_item.quantity
 
-            #     order_items.append(order_item)
 
-            OrderItem.objects.bulk_create(order_items)   
 
-            Cart.objects.get(id=cart_id).delete()
+class OrderCreateSerializer(serializers.Serializer):
+    cart_id = serializers.UUIDField()
 
-            return order
+    def save(self, **kwargs):
+        cart_id = self.validated_data['cart_id']
+        # a cart kept in the cache (store.carts.CacheCartStore) is written to the database first
+        with cart_store().checking_out(cart_id):
+            return checkout(cart_id, self.context['user_id'])
 
 class TeacherSerializer(serializers.ModelSerializer):
+    students = serializers.IntegerField(source='students_count', read_only=True)
+    courses = serializers.IntegerField(source='courses_count', read_only=True)
+    review = serializers.IntegerField(source='reviews_count', read_only=True)
+    images = ImageVariantsField()
 
     class Meta:
         model = Teacher
-        fields = ['user', 'image', 'full_name', 'bio', 'facebook', 'twitter', 'about', 'country', 'students', 'courses', 'review']        
+        fields = ['user', 'image', 'images', 'full_name', 'bio', 'facebook', 'twitter', 'about', 'country', 'students', 'courses', 'review', 'average_rating']
+        read_only_fields = ['average_rating']        
             
 
 
-class VariantSerializer(serializers.ModelSerializer):
-    variant_items = VariantItemSerializer(many=True)
-
-    class Meta:
-        model = Variant
-        fields = '__all__'         
-
-
 class CertificateSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -360,6 +438,10 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = '__all__'           
 
 
+class NotificationIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), max_length=100)
+
+
 class WishlistSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -367,7 +449,16 @@ class WishlistSerializer(serializers.ModelSerializer):
         fields = '__all__'           
 
 
+class EnrollmentProgressSerializer(serializers.ModelSerializer):
+    course_name = serializers.CharField(source='course.name', read_only=True)
+
+    class Meta:
+        model = EnrolledCourse
+        fields = ['id', 'course', 'course_name', 'status', 'date', 'lessons_completed', 'lessons_total', 'progress', 'last_activity']
+
+
 class StudentSummarySerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
     total_courses = serializers.IntegerField(default=0)
     completed_lessons = serializers.IntegerField(default=0)
     achieved_certificates = serializers.IntegerField(default=0)
@@ -1,9 +1,208 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
-from store.models import Customer
+from store import carts, counters, images, notifications, orders, progress, questions, sales, search, students
+from store.cache import bump_version
+from store.models import Category, Certificate, Comment, CompletedLesson, Course, Customer, EnrolledCourse, Note, Order, OrderItem, Question_Answer, Question_Answer_Message, Teacher, Variant, VariantItem
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_profile_for_newly_created_user(sender, instance, created, **kwargs):
     if created:
-        Customer.objects.create(user=instance)
\ No newline at end of file
+        Customer.objects.create(user=instance)
+
+
+@receiver(post_save, sender=OrderItem)
+def count_students_on_order_item_save(sender, instance, created, **kwargs):
+    counters.order_item_saved(instance, created)
+
+
+@receiver(post_delete, sender=OrderItem)
+def count_students_on_order_item_delete(sender, instance, **kwargs):
+    counters.order_item_deleted(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+def update_order_totals_on_order_item_save(sender, instance, created, **kwargs):
+    orders.order_item_saved(instance, created)
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_order_totals_on_order_item_delete(sender, instance, **kwargs):
+    orders.order_item_deleted(instance)
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_order_save(sender, instance, created, **kwargs):
+    sales.order_saved(instance, created)
+
+
+@receiver(post_save, sender=OrderItem)
+def update_sales_on_order_item_save(sender, instance, created, **kwargs):
+    sales.order_item_saved(instance, created)
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_sales_on_order_item_delete(sender, instance, **kwargs):
+    sales.order_item_deleted(instance)
+
+
+@receiver(post_save, sender=EnrolledCourse)
+@receiver(post_delete, sender=EnrolledCourse)
+@receiver(post_save, sender=CompletedLesson)
+@receiver(post_delete, sender=CompletedLesson)
+@receiver(post_save, sender=Certificate)
+@receiver(post_delete, sender=Certificate)
+def forget_student_summary(sender, instance, **kwargs):
+    students.forget_summaries([instance.user_id])
+
+
+@receiver(post_save, sender=CompletedLesson)
+def update_progress_on_completed_lesson_save(sender, instance, created, **kwargs):
+    progress.lesson_completed(instance, created)
+
+
+@receiver(post_delete, sender=CompletedLesson)
+def update_progress_on_completed_lesson_delete(sender, instance, **kwargs):
+    progress.lesson_uncompleted(instance)
+
+
+@receiver(post_save, sender=VariantItem)
+def update_progress_on_variant_item_save(sender, instance, created, **kwargs):
+    progress.variant_item_saved(instance, created)
+
+
+@receiver(post_delete, sender=VariantItem)
+def update_progress_on_variant_item_delete(sender, instance, **kwargs):
+    progress.variant_item_deleted(instance)
+
+
+@receiver(post_save, sender=EnrolledCourse)
+def set_progress_on_enrollment_save(sender, instance, created, **kwargs):
+    progress.enrollment_saved(instance, created)
+
+
+@receiver(post_save, sender=Question_Answer_Message)
+def count_replies_on_message_save(sender, instance, created, **kwargs):
+    questions.message_saved(instance, created)
+
+
+@receiver(post_delete, sender=Question_Answer_Message)
+def count_replies_on_message_delete(sender, instance, **kwargs):
+    questions.message_deleted(instance)
+
+
+@receiver(post_save, sender=Comment)
+def notify_teacher_on_comment_save(sender, instance, created, **kwargs):
+    notifications.comment_saved(instance, created)
+
+
+@receiver(post_save, sender=Question_Answer)
+def notify_teacher_on_question_save(sender, instance, created, **kwargs):
+    notifications.question_saved(instance, created)
+
+
+@receiver(post_save, sender=Course)
+def count_courses_on_course_save(sender, instance, created, **kwargs):
+    counters.course_saved(instance, created)
+
+
+@receiver(post_save, sender=Course)
+def index_course_on_save(sender, instance, created, **kwargs):
+    search.course_saved(instance, created)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def forget_cart_course(sender, instance, **kwargs):
+    carts.forget_course(instance.id)
+
+
+@receiver(post_save, sender=Category)
+def reindex_courses_on_category_save(sender, instance, created, **kwargs):
+    search.category_saved(instance, created)
+
+
+@receiver(post_save, sender=Teacher)
+def reindex_courses_on_teacher_save(sender, instance, created, **kwargs):
+    search.teacher_saved(instance, created)
+
+
+@receiver(post_delete, sender=Course)
+def count_courses_on_course_delete(sender, instance, **kwargs):
+    counters.course_deleted(instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_reviews_on_comment_save(sender, instance, created, **kwargs):
+    counters.comment_saved(instance, created)
+
+
+@receiver(post_delete, sender=Comment)
+def count_reviews_on_comment_delete(sender, instance, **kwargs):
+    counters.comment_deleted(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_responses(sender, instance, **kwargs):
+    # course lists are searched by category title
+    bump_version('categories', f'categories:{instance.id}', 'category-tree', 'courses')
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_responses(sender, instance, **kwargs):
+    category_ids = {instance.category_id, getattr(instance, '_loaded_values', {}).get('category_id')}
+    bump_version(
+        'courses', f'courses:{instance.id}', 'category-tree', 'categories',
+        *(f'categories:{category_id}' for category_id in category_ids if category_id),
+    )
+
+
+@receiver(post_save, sender=Teacher)
+def invalidate_course_lists(sender, instance, **kwargs):
+    # course lists are searched by teacher name
+    bump_version('courses')
+
+
+@receiver(post_save, sender=Variant)
+@receiver(post_delete, sender=Variant)
+def invalidate_course_of_variant(sender, instance, **kwargs):
+    # the curriculum is part of the course lists too
+    bump_version('courses', f'courses:{instance.course_id}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=EnrolledCourse)
+@receiver(post_delete, sender=EnrolledCourse)
+@receiver(post_save, sender=CompletedLesson)
+@receiver(post_delete, sender=CompletedLesson)
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+@receiver(post_save, sender=Question_Answer)
+@receiver(post_delete, sender=Question_Answer)
+@receiver(post_save, sender=Question_Answer_Message)
+@receiver(post_delete, sender=Question_Answer_Message)
+def invalidate_course_of_nested_object(sender, instance, **kwargs):
+    # nested in the students of a course, which only its detail page shows
+    # (CourseListSerializer), so student activity leaves the lists cached
+    bump_version(f'courses:{instance.course_id}')
+
+
+@receiver(post_save, sender=VariantItem)
+@receiver(post_delete, sender=VariantItem)
+def invalidate_course_of_variant_item(sender, instance, **kwargs):
+    # a lesson moved to another course changes both
+    old = counters.loaded_values(instance, 'variant_id')
+    variant_ids = {instance.variant_id, old['variant_id'] if old else instance.variant_id}
+    course_ids = Variant.objects.filter(id__in=variant_ids).values_list('course_id', flat=True)
+    bump_version('courses', *(f'courses:{course_id}' for course_id in course_ids))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Teacher)
+def derive_images_on_image_save(sender, instance, created, **kwargs):
+    images.image_saved(instance, created)
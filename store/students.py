@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core.models import CustomUser
+from store.cache import get_cache
+from store.models import Certificate, CompletedLesson, EnrolledCourse
+
+
+SUMMARY_TIMEOUT = 60 * 10
+
+# unpaid enrollments aren't courses of the student yet
+SUMMARY_ROWS = {
+    'total_courses': EnrolledCourse.objects.filter(status=EnrolledCourse.ENROLLMENT_STATUS_ACTIVE),
+    'completed_lessons': CompletedLesson.objects.all(),
+    'achieved_certificates': Certificate.objects.all(),
+}
+
+
+def summary_key(user_id):
+    return f'store:student-summary:{user_id}'
+
+
+def count_of(queryset):
+    rows = queryset.filter(user_id=OuterRef('pk')).order_by().values('user_id')
+    return Coalesce(Subquery(rows.annotate(count=Count('id')).values('count')), Value(0))
+
+
+def compute_summaries(user_ids):
+    """
+      the summaries of the users that exist, with one query of three
+      correlated counts on the user indexes
+    """
+    rows = CustomUser.objects.filter(id__in=user_ids).order_by() \
+        .annotate(**{name: count_of(queryset) for name, queryset in SUMMARY_ROWS.items()}) \
+        .values('id', *SUMMARY_ROWS)
+    return {row['id']: {'user_id': row['id'], **{name: row[name] for name in SUMMARY_ROWS}} for row in rows}
+
+
+def get_summaries(user_ids):
+    """
+      {user_id: summary} of user_ids in their order, cached per user.
+      Users that don't exist are left out.
+    """
+    cache = get_cache()
+    user_ids = list(dict.fromkeys(user_ids))
+    cached = cache.get_many([summary_key(user_id) for user_id in user_ids])
+    summaries = {user_id: cached[summary_key(user_id)] for user_id in user_ids if summary_key(user_id) in cached}
+
+    missing = [user_id for user_id in user_ids if user_id not in summaries]
+    if missing:
+        computed = compute_summaries(missing)
+        cache.set_many({summary_key(user_id): summary for user_id, summary in computed.items()}, timeout=SUMMARY_TIMEOUT)
+        summaries.update(computed)
+    return {user_id: summaries[user_id] for user_id in user_ids if user_id in summaries}
+
+
+def forget_summaries(user_ids):
+    """
+      drops the cached summaries once the current transaction commits, so
+      nothing reads and caches the old counts in between
+    """
+    keys = [summary_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
@@ -1,3 +1,802 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Barrier, Thread
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+import requests
+
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.test import APIClient
+
+from core.models import CustomUser
+from store.cache import get_cache, get_version, version_timeout
+from store.carts import CacheCartStore, CartBusy
+from store.checkout import checkout
+from store.consumers import send_order_created
+from store.counters import reconcile_teachers
+from store.lectures import parse_range
+from store import images, uploads
+from store.media import claim_jobs, complete_job
+from store.notifications import stream, unread_key
+from store.payments import mark_canceled, mark_paid, reconcile_payments
+from store.progress import reconcile_progress
+from store.sales import rebuild_rollups, teacher_sales
+from store.search import search_courses, tokenize
+from store.signals import order_created
+from store.zarinpal import GatewayUnavailable, ZarinpalClient
+from store.models import Cart, CartItem, Category, Comment, CompletedLesson, Course, CourseSalesDay, EnrolledCourse, MediaJob, Note, Notification, Order, OrderItem, Teacher, UploadSession, Variant, VariantItem
+
+
+def make_user(username, **kwargs):
+    return CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='secret', **kwargs)
+
+
+def make_teacher(username='teacher'):
+    return Teacher.objects.create(user=make_user(username), full_name=username.title())
+
+
+def make_course(teacher=None, name='Python for beginners', category=None, **kwargs):
+    category = category or Category.objects.create(title='Programming', slug=f'programming-{Category.objects.count()}')
+    kwargs.setdefault('description', 'A course')
+    kwargs.setdefault('unit_price', 10)
+    return Course.objects.create(name=name, slug='course', teacher=teacher or make_teacher(), category=category, **kwargs)
+
+
+def make_lecture(course, title='Lecture', **kwargs):
+    variant = Variant.objects.filter(course=course).first() or Variant.objects.create(course=course, title='Section')
+    return VariantItem.objects.create(variant=variant, title=title, description='', **kwargs)
+
+
+@override_settings(MEDIA_ROOT='/tmp/store-tests/media')
+class MediaJobTests(TestCase):
+
+    def test_saving_a_file_queues_a_job_of_that_file(self):
+        lecture = make_lecture(make_course())
+        lecture.file.save('first.mp4', ContentFile(b'clip'))
+
+        job = MediaJob.objects.get(variant_item=lecture)
+        self.assertEqual(job.file_name, lecture.file.name)
+
+    def test_a_stale_job_does_not_overwrite_the_duration_of_a_replaced_file(self):
+        lecture = make_lecture(make_course())
+        lecture.file.save('first.mp4', ContentFile(b'clip'))
+        [job] = claim_jobs(10)
+
+        lecture.file.save('second.mp4', ContentFile(b'clip'))
+        complete_job(job, 90)
+
+        lecture.refresh_from_db()
+        self.assertIsNone(lecture.duration)
+        # the new file got a job of its own
+        self.assertEqual(MediaJob.pending_jobs.get(variant_item=lecture).file_name, lecture.file.name)
+
+        [new_job] = claim_jobs(10)
+        complete_job(new_job, 90)
+        lecture.refresh_from_db()
+        self.assertEqual(lecture.duration, timedelta(seconds=90))
+
+
+class TeacherCounterTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.course = make_course(self.teacher)
+
+    def counters(self):
+        self.teacher.refresh_from_db()
+        return self.teacher.students_count, self.teacher.courses_count, self.teacher.reviews_count, self.teacher.average_rating
+
+    def test_courses_count_follows_publishing(self):
+        self.assertEqual(self.counters()[1], 1)
+        self.course.platform_status = 'Review'
+        self.course.save()
+        self.assertEqual(self.counters()[1], 0)
+        self.course.platform_status = 'Published'
+        self.course.save()
+        self.assertEqual(self.counters()[1], 1)
+
+    def test_students_are_counted_once_per_teacher(self):
+        customer = make_user('student').customer
+        second_course = make_course(self.teacher, name='Python for experts', category=self.course.category)
+        for course in (self.course, second_course):
+            order = Order.objects.create(customer=customer)
+            OrderItem.objects.create(order=order, course=course, teacher=self.teacher, unit_price=10)
+        self.assertEqual(self.counters()[0], 1)
+
+        OrderItem.objects.filter(course=second_course).get().delete()
+        self.assertEqual(self.counters()[0], 1)
+        OrderItem.objects.get().delete()
+        self.assertEqual(self.counters()[0], 0)
+
+    def test_only_approved_reviews_are_averaged(self):
+        review = Comment.objects.create(course=self.course, name='a', body='good', rating=4)
+        self.assertEqual(self.counters()[2:], (0, 0))
+        review.status = Comment.COMMENT_STATUS_APPROVED
+        review.save()
+        Comment.objects.create(course=self.course, name='b', body='fine', rating=2, status=Comment.COMMENT_STATUS_APPROVED)
+        self.assertEqual(self.counters()[2:], (2, 3.0))
+        review.delete()
+        self.assertEqual(self.counters()[2:], (1, 2.0))
+
+    def test_reconcile_repairs_drift(self):
+        Teacher.objects.filter(id=self.teacher.id).update(courses_count=7, reviews_count=3)
+        self.assertEqual(reconcile_teachers(), 1)
+        self.assertEqual(self.counters(), (0, 1, 0, 0))
+
+
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.course = make_course()
+        self.comments = [Comment.objects.create(course=self.course, name=f'c{i}', body='text', rating=5) for i in range(7)]
+        self.url = f'/store/courses/{self.course.id}/comments/'
+
+    def pages(self, url):
+        client = APIClient()
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            yield response.data
+            url = response.data['next']
+
+    def test_pages_walk_every_row_once_newest_first(self):
+        ids = [comment['id'] for page in self.pages(self.url + '?page_size=3') for comment in page['results']]
+        self.assertEqual(ids, [comment.id for comment in reversed(self.comments)])
+
+    def test_rows_inserted_while_paging_do_not_shift_pages(self):
+        pages = self.pages(self.url + '?page_size=3')
+        first = [comment['id'] for comment in next(pages)['results']]
+        Comment.objects.create(course=self.course, name='new', body='text', rating=5)
+        rest = [comment['id'] for page in pages for comment in page['results']]
+        self.assertEqual(first + rest, [comment.id for comment in reversed(self.comments)])
+
+    def test_pages_are_not_counted(self):
+        with CaptureQueriesContext(connection) as queries:
+            APIClient().get(self.url)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+
+class CourseSearchTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher('ali')
+        self.python = make_course(self.teacher, name='Python basics', description='Learn programming')
+        self.django = make_course(self.teacher, name='Django web development', description='Python on the web', category=self.python.category)
+
+    def search(self, query, **kwargs):
+        return list(search_courses(Course.objects.all(), query, **kwargs).values_list('id', flat=True))
+
+    def test_tokenize_lowercases_and_drops_short_words(self):
+        self.assertEqual(tokenize('A Python, برنامه نویسی!'), ['python', 'برنامه', 'نویسی'])
+
+    def test_prefixes_match_and_names_rank_first(self):
+        self.assertEqual(self.search('pyth'), [self.python.id, self.django.id])
+        self.assertEqual(self.search('python web'), [self.django.id])
+        self.assertEqual(self.search('rust'), [])
+
+    def test_fields_limit_the_match(self):
+        self.assertEqual(self.search('python', fields=['n']), [self.python.id])
+
+    def test_renames_are_reindexed(self):
+        self.django.name = 'Flask web development'
+        self.django.save()
+        self.assertEqual(self.search('django'), [])
+        self.assertEqual(self.search('flask'), [self.django.id])
+
+        self.teacher.full_name = 'Sara'
+        self.teacher.save()
+        self.assertEqual(self.search('sara'), [self.django.id, self.python.id])
+
+        category = self.python.category
+        category.title = 'Backend'
+        category.save()
+        self.assertCountEqual(self.search('backend'), [self.python.id, self.django.id])
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.course = make_course()
+        self.student = make_user('student')
+
+    def test_student_activity_only_invalidates_the_course_detail(self):
+        lists, detail = get_version('courses'), get_version(f'courses:{self.course.id}')
+        Note.objects.create(course=self.course, user=self.student, note='remember')
+        self.assertEqual(get_version('courses'), lists)
+        self.assertNotEqual(get_version(f'courses:{self.course.id}'), detail)
+
+    def test_course_lists_leave_out_the_students(self):
+        response = APIClient().get('/store/courses/')
+        self.assertNotIn('students', response.data['results'][0])
+        self.assertIn('students', APIClient().get(f'/store/courses/{self.course.id}/').data)
+
+    @override_settings(STORE_LOCAL_CACHE_TIMEOUT=30)
+    def test_versions_expire_in_a_local_cache(self):
+        self.assertEqual(version_timeout(), 30)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}):
+            self.assertIsNone(version_timeout())
+
+
+class CartTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.course = make_course()
+        self.other = make_course(self.course.teacher, name='Django', category=self.course.category, unit_price=25)
+
+    def add(self, client, cart_id, course):
+        return client.post(f'/store/carts/{cart_id}/items/', {'course': course.id})
+
+    def test_carts_come_out_the_same_from_both_stores(self):
+        shapes = []
+        for backend in ('store.carts.DatabaseCartStore', 'store.carts.CacheCartStore'):
+            with self.settings(STORE_CART_BACKEND=backend):
+                client = APIClient()
+                cart_id = client.post('/store/carts/').data['id']
+                self.assertEqual(self.add(client, cart_id, self.course).status_code, 201)
+                self.add(client, cart_id, self.other)
+                cart = client.get(f'/store/carts/{cart_id}/').data
+                items = client.get(f'/store/carts/{cart_id}/items/').data['results']
+                shapes.append((sorted(cart), cart['total_price'], sorted(items[0]), sorted(items[0]['course'])))
+        self.assertEqual(shapes[0], shapes[1])
+        self.assertEqual(shapes[0][1], 35)
+
+    def test_items_are_addressed_by_the_ids_the_api_returns(self):
+        for backend in ('store.carts.DatabaseCartStore', 'store.carts.CacheCartStore'):
+            with self.subTest(backend), self.settings(STORE_CART_BACKEND=backend):
+                client = APIClient()
+                cart_id = client.post('/store/carts/').data['id']
+                item_id = self.add(client, cart_id, self.course).data['id']
+                self.assertEqual(client.get(f'/store/carts/{cart_id}/items/{item_id}/').data['course']['id'], self.course.id)
+
+                item_id = client.patch(f'/store/carts/{cart_id}/items/{item_id}/', {'course': self.other.id}).data['id']
+                self.assertEqual(client.get(f'/store/carts/{cart_id}/items/').data['results'][0]['id'], item_id)
+                self.assertEqual(client.delete(f'/store/carts/{cart_id}/items/{item_id}/').status_code, 204)
+                self.assertEqual(client.get(f'/store/carts/{cart_id}/').data['items'], [])
+
+    def test_checkout_writes_the_cart_under_its_lock(self):
+        store = CacheCartStore()
+        cart_id = store.create()['id']
+        store.add_item(cart_id, self.course.id)
+        client = APIClient()
+        client.force_authenticate(make_user('student'))
+
+        with self.settings(STORE_CART_BACKEND='store.carts.CacheCartStore'):
+            with store.locked(cart_id), patch('store.carts.LOCK_WAIT', 0):
+                self.assertEqual(client.post('/store/orders/', {'cart_id': cart_id}).status_code, 503)
+                with self.assertRaises(CartBusy):
+                    store.persist([cart_id])
+            self.assertFalse(Cart.objects.exists())
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post('/store/orders/', {'cart_id': cart_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OrderItem.objects.get().course_id, self.course.id)
+        self.assertFalse(Cart.objects.exists())
+        with self.assertRaises(NotFound):
+            store.get(cart_id)
+
+    def test_a_locked_cart_is_busy(self):
+        store = CacheCartStore()
+        cart_id = store.create()['id']
+        with store.locked(cart_id), patch('store.carts.LOCK_WAIT', 0), self.assertRaises(CartBusy):
+            store.add_item(cart_id, self.course.id)
+        store.add_item(cart_id, self.course.id)
+        self.assertEqual(store.get(cart_id)['total_price'], 10)
+
+    def test_persist_keeps_the_creation_time(self):
+        store = CacheCartStore()
+        cart_id = store.create()['id']
+        store.add_item(cart_id, self.course.id)
+        created_at = store.load(cart_id)['created_at'] - timedelta(days=2)
+        entry = store.load(cart_id)
+        entry['created_at'] = created_at
+        store.save(entry)
+
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(Cart.objects.get(id=cart_id).created_at, created_at)
+        self.assertEqual(list(CartItem.objects.values_list('course_id', flat=True)), [self.course.id])
+
+
+def make_cart(*courses):
+    cart = Cart.objects.create()
+    CartItem.objects.bulk_create([CartItem(cart=cart, course=course) for course in courses])
+    return cart
+
+
+class CheckoutTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.course = make_course()
+        self.student = make_user('student')
+
+    def test_checkout_turns_the_cart_into_a_pending_order(self):
+        order = checkout(make_cart(self.course).id, self.student.id)
+
+        self.assertEqual((order.total, order.items_count), (10, 1))
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(EnrolledCourse.objects.get().status, EnrolledCourse.ENROLLMENT_STATUS_PENDING)
+
+    def test_only_paid_enrollments_are_students(self):
+        order = checkout(make_cart(self.course).id, self.student.id)
+        url = f'/store/courses/{self.course.id}/'
+        self.assertEqual(APIClient().get(url).data['students'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_paid({order.id: {'RefID': '1'}})
+        self.assertEqual([student['user'] for student in APIClient().get(url).data['students']], [self.student.id])
+
+    def test_canceling_deletes_the_pending_enrollments(self):
+        order = checkout(make_cart(self.course).id, self.student.id)
+        self.assertEqual(mark_canceled([order.id]), 1)
+        self.assertFalse(EnrolledCourse.objects.exists())
+        self.assertEqual(mark_canceled([order.id]), 0)
+
+    def test_order_changelist_loads_the_customers_with_the_orders(self):
+        client = self.client
+        client.force_login(make_user('admin', is_staff=True, is_superuser=True))
+
+        def changelist_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(client.get('/admin/store/order/').status_code, 200)
+            return len(queries)
+
+        Order.objects.create(customer=self.student.customer, total=10)
+        one_order = changelist_queries()
+        for index in range(4):
+            Order.objects.create(customer=make_user(f'buyer{index}').customer, total=10)
+        self.assertEqual(changelist_queries(), one_order)
+
+
+class ParallelCheckoutTests(TransactionTestCase):
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_a_cart_is_checked_out_once(self):
+        cart = make_cart(make_course())
+        student = make_user('student')
+        barrier = Barrier(4)
+        results = []
+
+        def run():
+            barrier.wait()
+            try:
+                results.append(checkout(cart.id, student.id))
+            except ValidationError as error:
+                results.append(error)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len([result for result in results if isinstance(result, Order)]), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(EnrolledCourse.objects.count(), 1)
+
+
+@patch('store.zarinpal.time.sleep')
+class ZarinpalClientTests(TestCase):
+
+    def gateway(self, *results, **kwargs):
+        client = ZarinpalClient(merchant_id='merchant', retries=2, **kwargs)
+        client.session.post = Mock(side_effect=results)
+        return client
+
+    def answer(self, status_code, data=None):
+        return Mock(status_code=status_code, json=Mock(return_value=data or {}))
+
+    def test_connect_timeouts_and_bad_gateways_are_retried(self, sleep):
+        client = self.gateway(requests.ConnectTimeout(), self.answer(502), self.answer(200, {'Status': 100}))
+        self.assertEqual(client.verify_payment(1000, 'A1'), {'Status': 100})
+        self.assertEqual(client.session.post.call_count, 3)
+
+    def test_read_timeouts_are_not_retried(self, sleep):
+        client = self.gateway(requests.ReadTimeout(), self.answer(200))
+        with self.assertRaises(GatewayUnavailable):
+            client.request_payment(1000, 'course', 'http://testserver/')
+        self.assertEqual(client.session.post.call_count, 1)
+
+    def test_retries_stop_at_the_deadline(self, sleep):
+        client = self.gateway(self.answer(503), self.answer(503), self.answer(200), deadline=0.5)
+        with self.assertRaises(GatewayUnavailable):
+            client.verify_payment(1000, 'A1')
+        # the second backoff (0.6s) doesn't fit
+        self.assertEqual(client.session.post.call_count, 2)
+        timeout = client.session.post.call_args.kwargs['timeout']
+        self.assertLessEqual(max(timeout), 0.5)
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.python = make_course(self.teacher)
+        self.django = make_course(self.teacher, name='Django', category=self.python.category, unit_price=30)
+        self.customer = make_user('student').customer
+
+    def order(self, *courses, paid=True):
+        order = Order.objects.create(customer=self.customer)
+        for course in courses:
+            OrderItem.objects.create(order=order, course=course, teacher=self.teacher, unit_price=course.unit_price)
+        if paid:
+            order = Order.objects.get(id=order.id)
+            order.status = Order.ORDER_STATUS_PAID
+            order.save()
+        return order
+
+    def rollup(self):
+        return sorted(CourseSalesDay.objects.values_list('course_id', 'day', 'sales_count', 'revenue'))
+
+    def test_only_paid_orders_are_rolled_up(self):
+        self.order(self.python, paid=False)
+        self.assertEqual(self.rollup(), [])
+        self.order(self.python, self.django)
+        today = timezone.localdate()
+        self.assertEqual(self.rollup(), [(self.python.id, today, 1, 10), (self.django.id, today, 1, 30)])
+
+    def test_the_rollup_follows_changes_and_matches_a_rebuild(self):
+        self.order(self.python)
+        order = self.order(self.python, self.django)
+        OrderItem.objects.get(order=order, course=self.django).delete()
+        order = Order.objects.get(id=order.id)
+        order.status = Order.ORDER_STATUS_CANCELED
+        order.save()
+        self.order(self.django)
+
+        incremental = [row for row in self.rollup() if row[2]]
+        rebuild_rollups()
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_teacher_sales(self):
+        self.order(self.python, self.django)
+        self.order(self.django)
+        today = timezone.localdate()
+
+        sales = teacher_sales(self.teacher.id, today, today)
+        self.assertEqual((sales['sales'], sales['revenue']), (3, 70))
+        self.assertEqual([(row['course_id'], row['sales']) for row in sales['courses']], [(self.django.id, 2), (self.python.id, 1)])
+        self.assertEqual(len(sales['series']), 1)
+        self.assertEqual(teacher_sales(self.teacher.id, today, today, course_id=self.python.id)['revenue'], 10)
+
+
+class StudentSummaryTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.teacher = make_teacher()
+        self.course = make_course(self.teacher)
+        self.student = make_user('student')
+        self.order = checkout(make_cart(self.course).id, self.student.id)
+
+    def summary(self, user, user_id):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(f'/store/student/summary/{user_id}/')
+
+    def test_unpaid_enrollments_are_not_counted(self):
+        self.assertEqual(self.summary(self.student, self.student.id).data[0]['total_courses'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_paid({self.order.id: {'RefID': '1'}})
+        self.assertEqual(self.summary(self.student, self.student.id).data[0]['total_courses'], 1)
+
+    def test_teachers_only_see_their_students(self):
+        other_teacher = make_teacher('other')
+        self.assertEqual(self.summary(self.teacher.user, self.student.id).status_code, 403)
+        mark_paid({self.order.id: {'RefID': '1'}})
+        self.assertEqual(self.summary(self.teacher.user, self.student.id).status_code, 200)
+        self.assertEqual(self.summary(other_teacher.user, self.student.id).status_code, 403)
+        self.assertEqual(self.summary(make_user('admin', is_staff=True), self.student.id).status_code, 200)
+
+
+class ProgressTests(TestCase):
+
+    def setUp(self):
+        self.course = make_course()
+        self.lessons = [make_lecture(self.course, f'Lesson {i}') for i in range(4)]
+        self.student = make_user('student')
+        checkout(make_cart(self.course).id, self.student.id)
+
+    def enrollment(self):
+        return EnrolledCourse.objects.values('lessons_completed', 'lessons_total', 'progress', 'last_activity').get(course=self.course)
+
+    def complete(self, lesson, date=None):
+        return CompletedLesson.objects.create(
+            course=self.course, user=self.student, variant_item=lesson, **({'date': date} if date else {}),
+        )
+
+    def test_completing_lessons_moves_the_progress(self):
+        self.complete(self.lessons[0])
+        self.complete(self.lessons[0])
+        self.complete(self.lessons[1])
+        enrollment = self.enrollment()
+        self.assertEqual((enrollment['lessons_completed'], enrollment['lessons_total'], enrollment['progress']), (2, 4, 50))
+
+        make_lecture(self.course, 'Lesson 4')
+        self.assertEqual(self.enrollment()['progress'], 40)
+        self.assertEqual(reconcile_progress(), 0)
+
+    def test_an_older_completion_keeps_the_last_activity(self):
+        latest = self.complete(self.lessons[0]).date
+        self.complete(self.lessons[1], date=latest - timedelta(days=3))
+        self.assertEqual(self.enrollment()['last_activity'], latest)
+
+    def test_a_lesson_moved_to_another_course_leaves_its_totals(self):
+        other = make_course(self.course.teacher, name='Django', category=self.course.category)
+        make_lecture(other, 'Intro')
+        checkout(make_cart(other).id, self.student.id)
+
+        lesson = VariantItem.objects.get(id=self.lessons[3].id)
+        lesson.variant = Variant.objects.get(course=other)
+        lesson.save()
+
+        totals = dict(EnrolledCourse.objects.values_list('course_id', 'lessons_total'))
+        self.assertEqual(totals, {self.course.id: 3, other.id: 2})
+        self.assertEqual(reconcile_progress(), 0)
+
+
+class NotificationStreamTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = make_user('teacher')
+
+    async def test_a_local_cache_still_sees_other_processes(self):
+        events = stream(self.user.id, last_id=0, poll_interval=0, db_check=1)
+        self.assertEqual(await anext(events), 'retry: 3000\n\n')
+        self.assertIn('"unread": 0', await anext(events))
+
+        # written by another process: neither this cache's latest key nor
+        # its unread count change
+        notification = await Notification.objects.acreate(user=self.user, type='New Order')
+        await get_cache().aset(unread_key(self.user.id), 0)
+        self.assertIn(f'id: {notification.id}\nevent: notification', await anext(events))
+        self.assertIn('"unread": 1', await anext(events))
+        await events.aclose()
+
+
+class OrderCreatedConsumerTests(TestCase):
+
+    def test_a_failing_receiver_fails_the_batch_after_the_others_ran(self):
+        order = Order.objects.create(customer=make_user('student').customer)
+        received = []
+
+        def failing(sender, order, **kwargs):
+            raise RuntimeError('mail server down')
+
+        def recording(sender, order, **kwargs):
+            received.append(order.id)
+
+        order_created.connect(failing)
+        order_created.connect(recording)
+        self.addCleanup(order_created.disconnect, failing)
+        self.addCleanup(order_created.disconnect, recording)
+
+        with self.assertRaisesMessage(RuntimeError, 'mail server down'):
+            send_order_created([{'order_id': order.id}])
+        self.assertEqual(received, [order.id])
+
+
+@override_settings(MEDIA_ROOT='/tmp/store-tests/media', FILE_UPLOAD_PERMISSIONS=0o640)
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.lesson = make_lecture(make_course())
+        self.data = b'0123456789' * 10
+        self.session = uploads.start(
+            make_user('uploader'), UploadSession.TARGET_LECTURE_FILE, self.lesson.id, 'clip.mp4', len(self.data),
+            hashlib.sha256(self.data).hexdigest(),
+        )
+
+    def send(self, offset, length):
+        return uploads.write_chunk(self.session, offset, io.BytesIO(self.data[offset:offset + length]), length)
+
+    def test_chunks_are_assembled_and_attached(self):
+        self.send(0, 60)
+        self.send(60, 40)
+        session = uploads.finalize(self.session)
+
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.file.name, session.file)
+        with self.lesson.file.open('rb') as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertEqual(stat.S_IMODE(os.stat(self.lesson.file.path).st_mode), 0o640)
+        self.assertEqual(MediaJob.pending_jobs.get(variant_item=self.lesson).file_name, session.file)
+
+    def test_a_failed_save_leaves_no_file_in_storage(self):
+        self.send(0, 100)
+        directory = self.lesson.file.storage.path('course_file')
+        os.makedirs(directory, exist_ok=True)
+        stored = set(os.listdir(directory))
+        with patch.object(VariantItem, 'save', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            uploads.finalize(self.session)
+
+        self.assertEqual(set(os.listdir(directory)), stored)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.UPLOAD_STATUS_OPEN)
+        session = uploads.finalize(self.session)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.file.name, session.file)
+
+    def test_an_offset_being_written_is_not_taken_twice(self):
+        UploadSession.objects.filter(id=self.session.id).update(chunk_started=timezone.now())
+        with self.assertRaises(uploads.UploadConflict):
+            self.send(0, 60)
+        with open(uploads.part_path(self.session), 'rb') as part:
+            self.assertEqual(part.read(), b'')
+
+    def test_a_failed_chunk_releases_its_offset(self):
+        with self.assertRaises(ValidationError):
+            uploads.write_chunk(self.session, 0, io.BytesIO(self.data[:30]), 60)
+        self.assertEqual(UploadSession.objects.values_list('received', 'chunk_started').get(), (0, None))
+        self.send(0, 60)
+        self.assertEqual(UploadSession.objects.get().received, 60)
+
+
+class RangeTests(TestCase):
+
+    def test_parse_range(self):
+        cases = {
+            None: None,
+            'bytes=0-99': (0, 99),
+            'bytes=100-': (100, 999),
+            'bytes=900-5000': (900, 999),
+            'bytes=-100': (900, 999),
+            'bytes=-5000': (0, 999),
+            'bytes=0-1,5-9': None,
+            'items=0-9': None,
+            'bytes=-': None,
+        }
+        for header, byte_range in cases.items():
+            with self.subTest(header):
+                self.assertEqual(parse_range(header, 1000), byte_range)
+
+    def test_unsatisfiable_ranges_raise(self):
+        for header in ('bytes=1000-', 'bytes=50-10'):
+            with self.subTest(header), self.assertRaises(ValueError):
+                parse_range(header, 1000)
+
+    @override_settings(MEDIA_ROOT='/tmp/store-tests/media')
+    def test_a_preview_is_served_in_ranges(self):
+        lesson = make_lecture(make_course(), preview=True)
+        lesson.file.save('preview.mp4', ContentFile(bytes(range(100))))
+        url = f'/store/lectures/{lesson.id}/media/'
+
+        response = APIClient().get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(APIClient().get(url, HTTP_RANGE='bytes=200-').status_code, 416)
+
+
+def png(color):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), color).save(buffer, format='PNG')
+    return ContentFile(buffer.getvalue())
+
+
+@override_settings(MEDIA_ROOT='/tmp/store-tests/media', STORE_IMAGE_SIZES={'small': 320}, STORE_IMAGE_FORMATS=('webp', 'jpeg'))
+class ImageTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.pool.shutdown)
+        self.teacher = make_teacher()
+        self.course = make_course(self.teacher)
+
+    def derive(self, *instances):
+        return images.derive_images(self.pool, [type(instance).objects.get(id=instance.id) for instance in instances])
+
+    def test_the_derivatives_are_named_by_the_content_hash(self):
+        self.course.image.save('cover.png', png('red'))
+        self.assertEqual(self.derive(self.course), 1)
+
+        self.course.refresh_from_db()
+        with self.course.image.open('rb') as file:
+            self.assertEqual(self.course.image_hash, hashlib.sha256(file.read()).hexdigest())
+        for image_format in ('webp', 'jpeg'):
+            path = os.path.join('/tmp/store-tests/media', images.derived_name(self.course.image_hash, 'small', image_format))
+            with self.subTest(image_format):
+                self.assertTrue(os.path.exists(path))
+        self.assertIn('small', APIClient().get(f'/store/courses/{self.course.id}/').data['images'])
+
+    def test_an_image_that_was_derived_before_is_not_resized_again(self):
+        self.course.image.save('cover.png', png('blue'))
+        self.derive(self.course)
+        other = make_course(self.teacher, name='Django', category=self.course.category)
+        other.image.save('copy.png', png('blue'))
+
+        with patch('PIL.Image.open') as image_open:
+            self.derive(other)
+        image_open.assert_not_called()
+        other.refresh_from_db()
+        self.course.refresh_from_db()
+        self.assertEqual(other.image_hash, self.course.image_hash)
+
+    def test_a_replaced_image_loses_its_hash(self):
+        self.course.image.save('cover.png', png('green'))
+        self.derive(self.course)
+        self.course.refresh_from_db()
+        self.course.image.save('new.png', png('white'))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.image_hash, '')
+
+    def test_a_stale_save_keeps_the_hash(self):
+        self.course.image.save('cover.png', png('yellow'))
+        stale = Course.objects.get(id=self.course.id)
+        self.derive(self.course)
+
+        stale.name = 'Renamed'
+        stale.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.name, 'Renamed')
+        self.assertNotEqual(self.course.image_hash, '')
+
+    def test_teacher_images_invalidate_their_courses(self):
+        self.teacher.image.save('face.png', png('black'))
+        versions = get_version('courses'), get_version(f'courses:{self.course.id}')
+        self.derive(self.teacher)
+        self.assertNotEqual(get_version('courses'), versions[0])
+        self.assertNotEqual(get_version(f'courses:{self.course.id}'), versions[1])
+
+
+class PaymentTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.student = make_user('student')
+        self.order = checkout(make_cart(make_course()).id, self.student.id)
+        Order.objects.filter(id=self.order.id).update(datetime_created=timezone.now() - timedelta(days=2))
+        self.gateway = Mock()
+        self.gateway.request_payment.return_value = {'Status': 100, 'Authority': 'A1'}
+        self.gateway.start_pay_url.return_value = 'https://gateway.example/A1'
+        self.gateway.verify_payment.return_value = {'Status': -21}
+
+    def pay(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        with patch('store.zarinpal.get_client', return_value=self.gateway):
+            return client.get(f'/store/orders/{self.order.id}/pay/')
+
+    def test_an_old_order_sent_to_the_gateway_just_now_is_left_alone(self):
+        self.assertEqual(self.pay().status_code, 302)
+        totals = reconcile_payments(client=self.gateway)
+
+        self.assertEqual(totals, {'paid': 0, 'canceled': 0, 'pending': 0, 'failed': 0})
+        self.gateway.verify_payment.assert_not_called()
+        self.assertEqual(Order.objects.get().status, Order.ORDER_STATUS_UNPAID)
+
+    def test_abandoned_payments_are_canceled(self):
+        self.pay()
+        Order.objects.update(payment_requested_at=timezone.now() - timedelta(minutes=30))
+        self.assertEqual(reconcile_payments(client=self.gateway)['pending'], 1)
+
+        Order.objects.update(payment_requested_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(reconcile_payments(client=self.gateway)['canceled'], 1)
+        self.assertEqual(Order.objects.get().status, Order.ORDER_STATUS_CANCELED)
+
+    def test_paying_does_not_overwrite_a_concurrent_status_change(self):
+        def paid_meanwhile(*args, **kwargs):
+            Order.objects.update(status=Order.ORDER_STATUS_PAID)
+            return {'Status': 100, 'Authority': 'A1'}
+
+        self.gateway.request_payment.side_effect = paid_meanwhile
+        self.assertEqual(self.pay().status_code, 409)
+        self.assertEqual(Order.objects.get().status, Order.ORDER_STATUS_PAID)
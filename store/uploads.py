@@ -0,0 +1,221 @@
+import hashlib
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from store.models import Course, UploadSession, VariantItem
+
+
+COPY_SIZE = 1024 * 1024
+
+# a chunk that is being written for longer was abandoned (the process died)
+CHUNK_TIMEOUT = 60 * 10
+
+# target: (model, field)
+TARGETS = {
+    UploadSession.TARGET_LECTURE_FILE: (VariantItem, 'file'),
+    UploadSession.TARGET_COURSE_FILE: (Course, 'file'),
+    UploadSession.TARGET_COURSE_IMAGE: (Course, 'image'),
+}
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The upload is not at this offset.'
+    default_code = 'conflict'
+
+
+def upload_dir():
+    return Path(getattr(settings, 'STORE_UPLOAD_DIR', Path(settings.MEDIA_ROOT) / 'uploads'))
+
+
+def max_size():
+    return getattr(settings, 'STORE_UPLOAD_MAX_SIZE', 10 * 1024 ** 3)
+
+
+def max_chunk():
+    return getattr(settings, 'STORE_UPLOAD_MAX_CHUNK', 64 * 1024 ** 2)
+
+
+def part_path(session):
+    return upload_dir() / f'{session.id}.part'
+
+
+def target_instance(target, target_id):
+    model, field = TARGETS[target]
+    try:
+        return model.objects.get(id=target_id), field
+    except model.DoesNotExist:
+        raise ValidationError({'target_id': [f'Invalid pk "{target_id}" - object does not exist.']})
+
+
+def start(user, target, target_id, filename, size, sha256=''):
+    if size > max_size():
+        raise ValidationError({'size': [f'Uploads are limited to {max_size()} bytes.']})
+    target_instance(target, target_id)
+    session = UploadSession.objects.create(
+        user=user, target=target, target_id=target_id, filename=os.path.basename(filename), size=size, sha256=sha256.lower(),
+    )
+    upload_dir().mkdir(parents=True, exist_ok=True)
+    part_path(session).touch()
+    return session
+
+
+def write_chunk(session, offset, stream, length, chunk_sha256=None):
+    """
+      copies `length` bytes of stream (the request body, never read into
+      memory as a whole) to the part file at offset. Chunks must come in
+      order, a client that lost its connection asks for `received` and
+      resumes from there.
+    """
+    if session.status != UploadSession.UPLOAD_STATUS_OPEN:
+        raise UploadConflict('The upload is already finalized.')
+    if offset != session.received:
+        raise UploadConflict(f'The upload is at offset {session.received}.')
+    if length <= 0 or length > max_chunk():
+        raise ValidationError({'chunk': [f'Send between 1 and {max_chunk()} bytes.']})
+    if offset + length > session.size:
+        raise ValidationError({'chunk': ['The chunk ends after the end of the file.']})
+
+    # the offset is claimed before any byte is written, a concurrent request
+    # for the same offset (or a finalize) loses here
+    started = timezone.now()
+    claimed = UploadSession.objects.filter(
+        Q(chunk_started__isnull=True) | Q(chunk_started__lt=started - timedelta(seconds=CHUNK_TIMEOUT)),
+        id=session.id, received=offset, status=UploadSession.UPLOAD_STATUS_OPEN,
+    ).update(chunk_started=started)
+    if not claimed:
+        raise UploadConflict()
+    chunk = UploadSession.objects.filter(id=session.id, chunk_started=started)
+    try:
+        write_part(session, offset, stream, length, chunk_sha256)
+    except Exception:
+        chunk.update(chunk_started=None)
+        raise
+
+    if not chunk.update(received=offset + length, chunk_started=None):
+        # the claim was taken over after CHUNK_TIMEOUT
+        raise UploadConflict()
+    session.received = offset + length
+    return session
+
+
+def write_part(session, offset, stream, length, chunk_sha256=None):
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path(session), 'r+b') as part:
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_SIZE, length - written))
+            if not data:
+                break
+            part.write(data)
+            digest.update(data)
+            written += len(data)
+    if written != length:
+        raise ValidationError({'chunk': [f'Expected {length} bytes, received {written}.']})
+    if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+        raise ValidationError({'chunk': ['The chunk does not match its checksum.']})
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for data in iter(lambda: part.read(COPY_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def finalize(session, sha256=''):
+    """
+      verifies the checksum and attaches the file to the target field. With
+      the local storage the part file is renamed into place, other storages
+      get it streamed by storage.save(). When the save or the commit fails
+      the stored file is moved back (or deleted) and the session stays open.
+    """
+    undo = []
+    try:
+        with transaction.atomic():
+            # a second finalize of the same session waits here and then fails
+            session = UploadSession.objects.select_for_update().get(id=session.id)
+            return finalize_locked(session, sha256, undo)
+    except BaseException:
+        for step in undo:
+            step()
+        raise
+
+
+def finalize_locked(session, sha256, undo):
+    if session.status != UploadSession.UPLOAD_STATUS_OPEN:
+        raise UploadConflict('The upload is already finalized.')
+    if session.received != session.size:
+        raise UploadConflict(f'The upload is at offset {session.received} of {session.size}.')
+    if session.chunk_started is not None and session.chunk_started >= timezone.now() - timedelta(seconds=CHUNK_TIMEOUT):
+        raise UploadConflict('A chunk is being written.')
+    sha256 = (sha256 or session.sha256).lower()
+    path = part_path(session)
+    if sha256 and file_sha256(path) != sha256:
+        raise ValidationError({'sha256': ['The file does not match its checksum.']})
+
+    instance, field = target_instance(session.target, session.target_id)
+    file_field = getattr(instance, field)
+    storage = file_field.storage
+    name = file_field.field.generate_filename(instance, session.filename)
+    try:
+        storage_path = storage.path(name)
+    except NotImplementedError:
+        storage_path = None
+    if storage_path is not None:
+        name = storage.get_available_name(name, max_length=file_field.field.max_length)
+        storage_path = storage.path(name)
+        os.makedirs(os.path.dirname(storage_path), exist_ok=True)
+        os.replace(path, storage_path)
+        undo.append(lambda: os.replace(storage_path, path))
+        # storage.save() applies FILE_UPLOAD_PERMISSIONS, the renamed part file keeps the umask's mode
+        mode = getattr(storage, 'file_permissions_mode', None)
+        if mode is not None:
+            os.chmod(storage_path, mode)
+    else:
+        with open(path, 'rb') as part:
+            name = storage.save(name, File(part), max_length=file_field.field.max_length)
+        undo.append(lambda: storage.delete(name))
+        transaction.on_commit(lambda: path.unlink(missing_ok=True))
+
+    setattr(instance, field, name)
+    # VariantItem.save() queues the MediaJob of the new file
+    instance.save()
+
+    session.status = UploadSession.UPLOAD_STATUS_COMPLETE
+    session.file = name
+    session.sha256 = sha256
+    session.datetime_completed = timezone.now()
+    session.save(update_fields=['status', 'file', 'sha256', 'datetime_completed'])
+    return session
+
+
+def abort(session):
+    part_path(session).unlink(missing_ok=True)
+    session.delete()
+
+
+def prune_sessions(older_than):
+    """
+      deletes the sessions (and part files) that were opened more than
+      older_than seconds ago and never finalized
+    """
+    created_before = timezone.now() - timedelta(seconds=older_than)
+    sessions = UploadSession.objects.filter(status=UploadSession.UPLOAD_STATUS_OPEN, datetime_created__lt=created_before)
+    count = 0
+    for session in sessions.iterator():
+        abort(session)
+        count += 1
+    return count
+
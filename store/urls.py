@@ -12,12 +12,19 @@ router.register('categories', views.CategoryViewSet, basename='category')
 router.register('carts', views.CartViewSet, basename='cart')
 router.register('customers', views.CustomerViewSet, basename='customer')
 router.register('orders', views.OrderViewSet, basename='order')
+router.register('media-jobs', views.MediaJobViewSet, basename='media-job')
+router.register('notifications', views.NotificationViewSet, basename='notification')
+router.register('uploads', views.UploadSessionViewSet, basename='upload')
 
 
 
 
 courses_router = routers.NestedDefaultRouter(router, 'courses', lookup='course')
 courses_router.register('comments', views.CommentViewSet, basename='course-comments')
+courses_router.register('questions', views.QuestionViewSet, basename='course-questions')
+
+questions_router = routers.NestedDefaultRouter(courses_router, 'questions', lookup='question')
+questions_router.register('messages', views.QuestionMessageViewSet, basename='question-messages')
 
 
 
@@ -28,6 +35,12 @@ urlpatterns = [
 
     path('orders/<int:order_id>/pay/', views.OrderPayView.as_view(), name='order-pay'),
     path('orders/verify', views.OrderVerifyView.as_view(), name='order_verify'),
-    path('student/summary/<user_id>/', views.StudentSummaryAPIView.as_view(), name='student_summary'),
-
-] + router.urls + courses_router.urls + cart_items_router.urls
+    path('student/progress/', views.StudentProgressAPIView.as_view(), name='student_progress'),
+    path('student/summary/', views.StudentSummaryAPIView.as_view(), name='student_summary_batch'),
+    path('student/summary/<int:user_id>/', views.StudentSummaryAPIView.as_view(), name='student_summary'),
+    path('teachers/<int:teacher_id>/sales/', views.TeacherSalesAPIView.as_view(), name='teacher-sales'),
+    path('notifications/stream/', views.notification_stream, name='notification-stream'),
+    path('lectures/<int:variant_item_id>/media/', views.lecture_media, name='lecture-media'),
+    path('cache-stats/', views.CacheStatsAPIView.as_view(), name='cache-stats'),
+
+] + router.urls + courses_router.urls + questions_router.urls + cart_items_router.urls
@@ -1,9 +1,11 @@
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.db.models import Count, Prefetch
+from django.db.models import Count, Prefetch, Q
 from config import settings
 from django.utils import timezone
 
 from django.urls import reverse
+from django.views.decorators.http import require_safe
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
@@ -13,43 +15,61 @@ from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.generics import ListAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet 
 from rest_framework.viewsets import GenericViewSet
-from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
+from rest_framework.mixins import CreateModelMixin, ListModelMixin, RetrieveModelMixin, DestroyModelMixin
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny 
 #ReadOnlyModelViewSet   instead of     ModelViewSet | for only read and get objects without deleting and updating
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from core.models import CustomUser
-from store.filters import CourseFilter
-from store.models import Cart, CartItem, Category, Certificate, Comment, CompletedLesson, Course, Customer, EnrolledCourse, Notification, Order, OrderItem
-from store.paginations import DefaultPagination
-from store.permissions import CustomDjangoModelPermissions, IsAdminOrReadOnly, SendPrivateEmailToCustomerPermission
-from store.serializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CategorySerializer, CommentSerializer, CourseSerializer, CustomerSerializer, OrderCreateSerializer, OrderForAdminSerializer, OrderSerializer, OrderUpdateSerializer, StudentSummarySerializer, UpdateCartItemSerializer
+from store.filters import CourseFilter, CourseSearchFilter, OrderFilter
+from store.cache import get_cache, get_metrics, get_version, record, reset_metrics
+from store.carts import cart_store
+from store.mixins import StreamingListMixin, VersionedCacheMixin
+from store.models import PUBLISHED_COURSE, Cart, CartItem, Category, Certificate, Comment, CompletedLesson, Course, Customer, EnrolledCourse, MediaJob, Notification, Order, OrderItem, Question_Answer, Question_Answer_Message, UploadSession
+from store.paginations import CreatedCursorPagination, DateCursorPagination, RankedCursorPagination, ThreadCursorPagination
+from store.orders import PERIODS, revenue
+from store import lectures, notifications
+from store.payments import mark_paid
+from store.questions import latest_messages
+from store.sales import teacher_sales
+from store.students import get_summaries
+from store import uploads
+from store.prefetch import plan_queryset
+from store.permissions import CustomDjangoModelPermissions, CanUploadToTarget, CanViewStudentSummary, IsAdminOrReadOnly, IsEnrolledOrTeacherOrReadOnly, IsTeacherOrAdmin, SendPrivateEmailToCustomerPermission
+from store.serializers import CartItemCourseSerializer, CartItemSerializer, CartItemsBulkSerializer, CartSerializer, CategorySerializer, CategoryTreeSerializer, CommentSerializer, CourseListSerializer, CourseSerializer, CustomerSerializer, EnrollmentProgressSerializer, MediaJobSerializer, NotificationIdsSerializer, NotificationSerializer, OrderCreateSerializer, OrderForAdminSerializer, OrderRevenueSerializer, OrderSerializer, OrderUpdateSerializer, QuestionMessageSerializer, QuestionSerializer, StudentSummarySerializer, TeacherSalesQuerySerializer, TeacherSalesSerializer, UploadSessionSerializer
 
-from .signals import order_created
 
 from store import zarinpal
-import requests
-import json 
 
 
 
 
 #class-based view
 #productlist and product detail both together including post put patch delete-------------------------------------------------
-class CourseViewSet(ModelViewSet):
+class CourseViewSet(StreamingListMixin, VersionedCacheMixin, ModelViewSet):
 
      serializer_class = CourseSerializer
-     filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
+     filter_backends = [CourseSearchFilter, DjangoFilterBackend, OrderingFilter]
      filterset_class = CourseFilter
      ordering_fields = ['name', 'unit_price']
-     search_fields = ['name', 'category__title']
-     #----custom pagination----
-     # pagination_class = DefaultPagination
-     #-------------------------
+     pagination_class = RankedCursorPagination
      # filterset_fields = ['category_id', 'inventory']
      
      permission_classes = [IsAdminOrReadOnly]
      queryset = Course.objects.all()
+     cache_name = 'courses'
+
+     def get_queryset(self):
+          return plan_queryset(self.get_serializer_class(), super().get_queryset())
+
+     def get_serializer_class(self):
+          if self.action == 'list':
+               return CourseListSerializer
+          return CourseSerializer
       
      def get_serializer_context(self):
           return {'request': self.request}
@@ -63,19 +83,46 @@ class CourseViewSet(ModelViewSet):
 
 
 #category list and category detail both together-------------------------------------------------------
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(VersionedCacheMixin, ModelViewSet):
      serializer_class = CategorySerializer
-     queryset = Category.objects.prefetch_related('courses').all()
+     cache_name = 'categories'
+     queryset = Category.objects.annotate(
+          courses_count=Count('courses'),
+          published_courses_count=Count('courses', filter=Q(courses__platform_status='Published', courses__teacher_course_status='Published')),
+     ).order_by('title')
      permission_classes = [IsAdminOrReadOnly]
 
 
      def destroy(self, request, pk):
-          category = get_object_or_404(Category.objects.prefetch_related('courses'), pk=pk)
-          if category.courses.count() > 0:
+          category = get_object_or_404(Category, pk=pk)
+          if category.courses.exists():
               return Response({'error': 'there is some courses related to this category'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
               
           category.delete()
           return Response(status=status.HTTP_204_NO_CONTENT)
+
+     @action(detail=False)
+     def tree(self, request):
+          """
+            categories with their published courses, cached until a category
+            or course changes (see store.signals.handlers)
+          """
+          version = get_version('category-tree')
+          etag = f'"category-tree-{version}"'
+          if etag in request.headers.get('If-None-Match', ''):
+               return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+          cache = get_cache()
+          cache_key = f'store:category-tree:{version}'
+          data = cache.get(cache_key)
+          record('categories-tree', 'misses' if data is None else 'hits')
+          if data is None:
+               categories = Category.objects.prefetch_related(
+                    Prefetch('courses', queryset=Course.objects.filter(PUBLISHED_COURSE).order_by('name')),
+               )
+               data = CategoryTreeSerializer(categories, many=True).data
+               cache.set(cache_key, data)
+          return Response(data, headers={'ETag': etag})
 #-------------------------------------------------------------------------------------------------------
 
 
@@ -183,6 +230,7 @@ class CategoryViewSet(ModelViewSet):
 
 class CommentViewSet(ModelViewSet):
      serializer_class = CommentSerializer
+     pagination_class = CreatedCursorPagination
 
      def get_queryset(self):
           course_pk = self.kwargs['course_pk']
@@ -192,34 +240,157 @@ class CommentViewSet(ModelViewSet):
           return{'course_pk': self.kwargs['course_pk']}
 
 
-class CartItemViewSet(ModelViewSet):
-     http_method_names = ['get', 'post', 'patch', 'delete']
+class QuestionViewSet(CreateModelMixin, ListModelMixin, RetrieveModelMixin, GenericViewSet):
+     """
+       Q&A threads of a course, newest first, each with its reply count and
+       latest messages. Two queries per page however long the threads are.
+     """
+     serializer_class = QuestionSerializer
+     pagination_class = DateCursorPagination
+     permission_classes = [IsEnrolledOrTeacherOrReadOnly]
 
-     
      def get_queryset(self):
-          cart_pk = self.kwargs['cart_pk']
-          return CartItem.objects.select_related('course').filter(cart_id=cart_pk).all()
-
+          return Question_Answer.objects.filter(course_id=self.kwargs['course_pk']) \
+               .select_related('user__customer').prefetch_related(latest_messages())
 
-     def get_serializer_class(self):
-          if self.request.method == 'POST':
-               return AddCartItemSerializer
-          elif self.request.method == 'PATCH':
-               return UpdateCartItemSerializer
-          return CartItemSerializer
-     
      def get_serializer_context(self):
-          return{'cart_pk': self.kwargs['cart_pk']}
+          return {'course_pk': self.kwargs['course_pk'], 'user_id': self.request.user.id}
+
 
+class QuestionMessageViewSet(CreateModelMixin, ListModelMixin, GenericViewSet):
+     """
+       all messages of a thread, oldest first and cursor paginated
+     """
+     serializer_class = QuestionMessageSerializer
+     pagination_class = ThreadCursorPagination
+     permission_classes = [IsEnrolledOrTeacherOrReadOnly]
 
-class CartViewSet(CreateModelMixin,
-                   RetrieveModelMixin,
-                   DestroyModelMixin,
-                   GenericViewSet):
+     def get_queryset(self):
+          return Question_Answer_Message.objects.filter(
+               question_id=self.kwargs['question_pk'], course_id=self.kwargs['course_pk'],
+          ).select_related('user__customer')
+
+     def get_serializer_context(self):
+          context = {'user_id': self.request.user.id}
+          if self.request.method == 'POST':
+               context['question'] = get_object_or_404(
+                    Question_Answer.objects.only('id', 'course_id'), id=self.kwargs['question_pk'], course_id=self.kwargs['course_pk'],
+               )
+          return context
+
+
+class CartItemViewSet(GenericViewSet):
+     """
+       items of a cart, read and written through the cart store (store.carts).
+       Clients address items by the ids these responses return: CartItem ids
+       with DatabaseCartStore, course ids with CacheCartStore.
+     """
+     http_method_names = ['get', 'post', 'patch', 'delete']
+     serializer_class = CartItemCourseSerializer
+     # never read, the browsable API asks for a queryset
+     queryset = CartItem.objects.none()
+
+     def list(self, request, cart_pk):
+          items = cart_store().items(cart_pk)
+          page = self.paginate_queryset(items)
+          if page is not None:
+               return self.get_paginated_response(CartItemSerializer(page, many=True).data)
+          return Response(CartItemSerializer(items, many=True).data)
+
+     def create(self, request, cart_pk):
+          serializer = self.get_serializer(data=request.data)
+          serializer.is_valid(raise_exception=True)
+          item = cart_store().add_item(cart_pk, serializer.validated_data['course'])
+          return Response({'id': item['id'], 'course': item['course']['id']}, status=status.HTTP_201_CREATED)
+
+     def retrieve(self, request, cart_pk, pk):
+          return Response(CartItemSerializer(cart_store().get_item(cart_pk, pk)).data)
+
+     def partial_update(self, request, cart_pk, pk):
+          serializer = self.get_serializer(data=request.data)
+          serializer.is_valid(raise_exception=True)
+          item = cart_store().update_item(cart_pk, pk, serializer.validated_data['course'])
+          # with CacheCartStore the id of an item is its course id and changes here
+          return Response({'id': item['id'], 'course': item['course']['id']})
+
+     def destroy(self, request, cart_pk, pk):
+          cart_store().remove_item(cart_pk, pk)
+          return Response(status=status.HTTP_204_NO_CONTENT)
+
+     @action(detail=False, methods=['POST'], serializer_class=CartItemsBulkSerializer)
+     def bulk(self, request, cart_pk):
+          """
+            {"add": [course ids], "remove": [course ids]}, adding a course that
+            is in the cart or removing one that isn't does nothing
+          """
+          serializer = self.get_serializer(data=request.data)
+          serializer.is_valid(raise_exception=True)
+          return Response(CartSerializer(cart_store().update_items(cart_pk, **serializer.validated_data)).data)
+
+
+class CartViewSet(GenericViewSet):
+     """
+       carts live in the cart store (store.carts), STORE_CART_BACKEND picks
+       the database or the cache
+     """
      serializer_class = CartSerializer
-     queryset = Cart.objects.prefetch_related('items__course').all()
+     queryset = Cart.objects.none()
      lookup_value_regex = '[0-9a-fA-F]{8}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{12}'
 
+     def create(self, request):
+          return Response(CartSerializer(cart_store().create()).data, status=status.HTTP_201_CREATED)
+
+     def retrieve(self, request, pk):
+          return Response(CartSerializer(cart_store().get(pk)).data)
+
+     def destroy(self, request, pk):
+          cart_store().delete(pk)
+          return Response(status=status.HTTP_204_NO_CONTENT)
+
+class MediaJobViewSet(ReadOnlyModelViewSet):
+     serializer_class = MediaJobSerializer
+     queryset = MediaJob.objects.order_by('-id')
+     filter_backends = [DjangoFilterBackend]
+     filterset_fields = ['status', 'variant_item']
+     permission_classes = [IsAdminUser]
+
+
+class UploadSessionViewSet(CreateModelMixin, RetrieveModelMixin, GenericViewSet):
+     """
+       chunked uploads of lecture and course files (store.uploads): POST
+       opens one, PUT sends the next chunk at ?offset= (or an Upload-Offset
+       header), GET tells a client that lost its connection where to
+       resume, POST finalize attaches the file and DELETE aborts it.
+     """
+     serializer_class = UploadSessionSerializer
+     permission_classes = [CanUploadToTarget]
+     lookup_value_regex = '[0-9a-f-]{36}'
+
+     def get_queryset(self):
+          return UploadSession.objects.filter(user_id=self.request.user.id)
+
+     def update(self, request, pk):
+          session = self.get_object()
+          offset = request.query_params.get('offset', request.headers.get('Upload-Offset', ''))
+          if not offset.isdigit():
+               raise ValidationError({'offset': ['Send the offset of the chunk.']})
+          length = request.headers.get('Content-Length', '')
+          if not length.isdigit():
+               raise ValidationError({'chunk': ['Send the Content-Length of the chunk.']})
+          # request.stream is the unparsed body, it is copied to the part file piece by piece
+          uploads.write_chunk(session, int(offset), request.stream, int(length), request.headers.get('Upload-Checksum'))
+          return Response(self.get_serializer(session).data)
+
+     @action(detail=True, methods=['post'])
+     def finalize(self, request, pk):
+          session = uploads.finalize(self.get_object(), request.data.get('sha256', ''))
+          return Response(self.get_serializer(session).data)
+
+     def destroy(self, request, pk):
+          uploads.abort(self.get_object())
+          return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class CustomerViewSet(ModelViewSet):
      serializer_class = CustomerSerializer   
      queryset = Customer.objects.all()
@@ -245,22 +416,22 @@ class CustomerViewSet(ModelViewSet):
 
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(StreamingListMixin, ModelViewSet):
 
      http_method_names = ['get', 'post', 'delete', 'patch', 'options','head']
+     pagination_class = CreatedCursorPagination
+     filter_backends = [DjangoFilterBackend, OrderingFilter]
+     filterset_class = OrderFilter
+     ordering_fields = ['datetime_created', 'total', 'items_count']
      
      def get_permissions(self):
-          if self.request.method in ['PATCH', 'DELETE']:
+          if self.request.method in ['PATCH', 'DELETE'] or self.action == 'revenue':
                return [IsAdminUser()]
           return [IsAuthenticated()]
           
 
      def get_queryset(self):
-          queryset = Order.objects.prefetch_related(
-               Prefetch(
-                    'items', queryset=OrderItem.objects.select_related('course'),
-                    )
-          ).select_related('customer__user').all()
+          queryset = plan_queryset(self.get_serializer_class(), Order.objects.all())
           
           user = self.request.user
 
@@ -289,6 +460,24 @@ class OrderViewSet(ModelViewSet):
           return {'user_id': self.request.user.id}
      
 
+     @action(detail=False)
+     def revenue(self, request):
+          """
+            revenue of the filtered orders (paid ones unless ?status= is
+            given) from one aggregate query, ?period=day or month splits it
+          """
+          period = request.query_params.get('period')
+          if period is not None and period not in PERIODS:
+               raise ValidationError({'period': [f'Choose one of: {", ".join(PERIODS)}.']})
+
+          queryset = Order.objects.all()
+          if 'status' not in request.query_params:
+               queryset = queryset.filter(status=Order.ORDER_STATUS_PAID)
+          queryset = DjangoFilterBackend().filter_queryset(request, queryset, self)
+
+          result = revenue(queryset, period)
+          return Response(OrderRevenueSerializer(result, many=period is not None).data)
+
      def create(self, request, *args, **kwargs):
           create_order_serializer  = OrderCreateSerializer(data=request.data,
                        context={'user_id': self.request.user.id},                                    
@@ -296,8 +485,6 @@ class OrderViewSet(ModelViewSet):
           create_order_serializer.is_valid(raise_exception=True)
           created_order = create_order_serializer.save()
 
-          order_created.send_robust(self.__class__, order=created_order)
-
           serializer= OrderSerializer(created_order)
           return Response(serializer.data)
 
@@ -311,8 +498,10 @@ class OrderPayView(APIView):
     def get(self, request, order_id):
         order = get_object_or_404(Order, id=order_id)
 
-        if order.status == 'p':
+        if order.status == Order.ORDER_STATUS_PAID:
             return Response('This order has been paid!')
+        if order.status != Order.ORDER_STATUS_UNPAID:
+            return Response({'error': 'This order was canceled.'}, status=status.HTTP_400_BAD_REQUEST)
 
         request.session['order_pay'] = {
             'order_id': order.id,
@@ -322,32 +511,25 @@ class OrderPayView(APIView):
             'order_id': int(order_id),
         }
 
-        req_data = {
-            "MerchantID": settings.ZARINPALL_MERCHANT_ID,
-            "Amount": int(order.get_total_price()),
-            "Description": 'Mystore',
-            "Phone": '',
-            "CallbackURL": request.build_absolute_uri(reverse('store:order_verify')),
-        }
-
-        request_header = {
-            "accept": "application/json",
-            "content-type": "application/json"
-        }
-        res = requests.post(zarinpal.ZP_API_REQUEST, data=json.dumps(req_data), headers=request_header)
-        print(res)
-        # print(res.json()['data'])
-
-        data = res.json()
-        print(data)
-        authority = data['Authority']
-        order.zarinpal_authority = authority
-        order.save()
+        try:
+            data = zarinpal.get_client().request_payment(
+                order.total,
+                'Mystore',
+                request.build_absolute_uri(reverse('store:order_verify')),
+            )
+        except zarinpal.GatewayError as error:
+            return Response({'error': str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         if 'errors' not in data or len(data['errors']) == 0:
-            return redirect(zarinpal.ZP_API_STARTPAY.format(sandbox=zarinpal.sandbox, authority=authority))
+            authority = data['Authority']
+            # only these columns, the reconciler or a verify may have changed the status meanwhile
+            updated = Order.unpaid_orders.filter(id=order.id).update(
+                zarinpal_authority=authority, payment_requested_at=timezone.now(),
+            )
+            if not updated:
+                return Response({'error': 'This order is not unpaid any more.'}, status=status.HTTP_409_CONFLICT)
+            return redirect(zarinpal.get_client().start_pay_url(authority))
         else:
-            print(data['errors'])
             # Need to ckeak for order.return_products_to_cart
             return Response({'error': 'Error from zarinpal'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
@@ -363,79 +545,196 @@ class OrderVerifyView(APIView):
         order = get_object_or_404(Order, zarinpal_authority=payment_authority)
 
         if payment_status == 'OK':
-            request_header = {
-                "accept": "application/json",
-                "content-type": "application/json",
-            }
+            try:
+                data = zarinpal.get_client().verify_payment(order.total, payment_authority)
+            except zarinpal.GatewayError as error:
+                return Response({'error': str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+            payment_code = data.get('Status')
+
+            if payment_code == zarinpal.PAYMENT_OK:
+                mark_paid({order.id: data})
+
+                return Response({'success': 'Your payment has been successfully completed!'}, status=status.HTTP_200_OK)
+                # Need to ckeak for order.return_products_to_cart
+            elif payment_code == zarinpal.PAYMENT_VERIFIED_BEFORE:
+                mark_paid({order.id: data})
+                return Response({'success': 'Your payment has been successfully completed.'
+                                ' Of course, this transaction has already been registered!'}, status=status.HTTP_200_OK)
+
+            else:
+                # Need to ckeak for order.return_products_to_cart
+                errors = data.get('errors') or {}
+                error_code = errors.get('code', payment_code)
+                error_message = errors.get('message')
+                return Response({'error': f'The transaction was unsuccessful! {error_message} {error_code} '}, status=status.HTTP_400_BAD_REQUEST)
 
-            req_data = {
-                'MerchantID': settings.ZARINPALL_MERCHANT_ID,
-                'Amount': int(order.get_total_price()),
-                'Authority': payment_authority,
-            }
+        else:
 
-            res = requests.post(
-                    zarinpal.ZP_API_VERIFY,
-                    data=json.dumps(req_data),
-                    headers=request_header,
+            # Need to ckeak for order.return_products_to_cart
+            return Response({'error': 'The transaction was unsuccessful or canceled by user !'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-                )
-            if 'errors' not in res.json():
-                data = res.json()
-                payment_code = data['Status']
 
-                if payment_code == 100:
-                    order.status = 'p'
-                    order.zarinpal_ref_id = data['RefID']
-                    order.zarinpal_data = data
-                    order.save()
 
+class CacheStatsAPIView(APIView):
+     """
+       hit/miss counters of the catalog response caches, DELETE resets them
+     """
+     permission_classes = [IsAdminUser]
+     metrics = ['courses-list', 'courses-retrieve', 'categories-list', 'categories-retrieve', 'categories-tree']
 
+     def get(self, request):
+          return Response(get_metrics(self.metrics))
 
+     def delete(self, request):
+          reset_metrics(self.metrics)
+          return Response(status=status.HTTP_204_NO_CONTENT)
 
-                    return Response({'success': 'Your payment has been successfully completed!'}, status=status.HTTP_200_OK)
-                    # Need to ckeak for order.return_products_to_cart
-                elif payment_code == 101:
-                    return Response({'success': 'Your payment has been successfully completed.'
-                                    ' Of course, this transaction has already been registered!'}, status=status.HTTP_200_OK)
 
-                else:
-                    # Need to ckeak for order.return_products_to_cart
-                    error_code = res.json().get('errors', {}).get('code')
-                    # error_message = res.json()['errors']['message']
-                    error_message = res.json().get('errors', {}).get('message')
-                    return Response({'error': f'The transaction was unsuccessful! {error_message} {error_code} '}, status=status.HTTP_400_BAD_REQUEST)
 
-        else:
+class TeacherSalesAPIView(APIView):
+     """
+       sales of a teacher from the daily rollups (store.sales), between
+       ?start= and ?end= (the last 30 days by default) per ?period=day or
+       month, optionally of one ?course=
+     """
+     permission_classes = [IsTeacherOrAdmin]
 
-            # Need to ckeak for order.return_products_to_cart
-            return Response({'error': 'The transaction was unsuccessful or canceled by user !'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+     def get(self, request, teacher_id):
+          query = TeacherSalesQuerySerializer(data=request.query_params)
+          query.is_valid(raise_exception=True)
+          params = query.validated_data
+
+          result = teacher_sales(teacher_id, params['start'], params['end'], params['period'], params.get('course'))
+          return Response(TeacherSalesSerializer(result).data)
 
 
 
 class StudentSummaryAPIView(ListAPIView):
+     """
+       course, lesson and certificate counts of a student, or of many with
+       student/summary/?ids=1,2,3 (at most 100), cached per user
+     """
      serializer_class = StudentSummarySerializer
-     permission_classes = [AllowAny]
+     permission_classes = [CanViewStudentSummary]
+     max_ids = 100
+
+     def get_user_ids(self):
+          if 'user_id' in self.kwargs:
+               return [self.kwargs['user_id']]
+          try:
+               user_ids = [int(user_id) for user_id in self.request.query_params.get('ids', '').split(',') if user_id.strip()]
+          except ValueError:
+               raise ValidationError({'ids': ['Enter a comma separated list of user ids.']})
+          if not user_ids or len(user_ids) > self.max_ids:
+               raise ValidationError({'ids': [f'Enter between 1 and {self.max_ids} user ids.']})
+          return user_ids
 
      def get_queryset(self):
-          user_id = self.kwargs['user_id']
-          user = CustomUser.objects.get(id=user_id)
-
-          total_courses = EnrolledCourse.objects.filter(user=user).count()
-          completed_lessons = CompletedLesson.objects.filter(user=user).count()
-          achieved_certificates = Certificate.objects.filter(user=user).count() 
-
-          return [{
-               'total_courses': total_courses,
-               'completed_lessons': completed_lessons,
-               'achieved_certificates': achieved_certificates,
-               }]
+          summaries = list(get_summaries(self.get_user_ids()).values())
+          if not summaries and 'user_id' in self.kwargs:
+               raise NotFound()
+          return summaries
              
      def list(self, request, *args, **kwargs):
           queryset = self.get_queryset()
           serializer = self.get_serializer(queryset, many=True)
-          return Response(serializer.data)             
-     
+          return Response(serializer.data)
+
 
 
-     
\ No newline at end of file
+class StudentProgressAPIView(ListAPIView):
+     """
+       the enrollments of the current user with their stored progress
+       (store.progress), newest first, one query per page
+     """
+     serializer_class = EnrollmentProgressSerializer
+     permission_classes = [IsAuthenticated]
+     pagination_class = DateCursorPagination
+
+     def get_queryset(self):
+          return EnrolledCourse.objects.filter(user_id=self.request.user.id).select_related('course').only(
+               'id', 'course', 'course__name', 'status', 'date', 'lessons_completed', 'lessons_total', 'progress', 'last_activity',
+          )
+
+
+
+class NotificationViewSet(ListModelMixin, GenericViewSet):
+     """
+       notifications of the current user, newest first. The unread count
+       comes from the cache, marking them seen is one UPDATE.
+     """
+     serializer_class = NotificationSerializer
+     permission_classes = [IsAuthenticated]
+     pagination_class = DateCursorPagination
+
+     def get_queryset(self):
+          queryset = Notification.objects.filter(user_id=self.request.user.id)
+          seen = self.request.query_params.get('seen')
+          if seen in ('true', 'false'):
+               queryset = queryset.filter(seen=seen == 'true')
+          return queryset
+
+     @action(detail=False)
+     def unread(self, request):
+          return Response({'unread': notifications.unread_count(request.user.id)})
+
+     @action(detail=False, methods=['post'], url_path='mark-all-seen')
+     def mark_all_seen(self, request):
+          return Response({'updated': notifications.mark_all_seen(request.user.id)})
+
+     @action(detail=False, methods=['post'], url_path='mark-seen', serializer_class=NotificationIdsSerializer)
+     def mark_seen(self, request):
+          serializer = NotificationIdsSerializer(data=request.data)
+          serializer.is_valid(raise_exception=True)
+          return Response({'updated': notifications.mark_seen(request.user.id, serializer.validated_data['ids'])})
+
+
+
+def stream_user_id(request):
+     # EventSource and <video> can't send headers, the access token may come as ?token=
+     header = request.headers.get('Authorization', '').split()
+     raw_token = request.GET.get('token') or (header[1] if len(header) == 2 else None)
+     if not raw_token:
+          return None
+     try:
+          return AccessToken(raw_token)[jwt_settings.USER_ID_CLAIM]
+     except (TokenError, KeyError):
+          return None
+
+
+async def notification_stream(request):
+     """
+       server-sent events of the current user's notifications and unread
+       count (store.notifications.stream), served by config/asgi.py
+     """
+     user_id = stream_user_id(request)
+     if user_id is None:
+          return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+     last_id = request.headers.get('Last-Event-ID')
+     response = StreamingHttpResponse(
+          notifications.stream(user_id, int(last_id) if last_id and last_id.isdigit() else None),
+          content_type='text/event-stream',
+     )
+     response['Cache-Control'] = 'no-cache'
+     # nginx must not buffer the stream
+     response['X-Accel-Buffering'] = 'no'
+     return response
+
+
+
+@require_safe
+def lecture_media(request, variant_item_id):
+     """
+       the file of a lecture for its enrolled students, teacher and staff
+       (anyone for previews), with Range requests for seeking
+     """
+     item = lectures.lecture(variant_item_id)
+     user_id = stream_user_id(request)
+     if not lectures.can_watch(user_id, item):
+          if user_id is None:
+               return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+          return JsonResponse({'detail': 'You are not enrolled in this course.'}, status=403)
+     response = lectures.lecture_response(item, request.headers.get('Range'))
+     response['Cache-Control'] = 'public, max-age=3600' if item.preview else 'private, max-age=3600'
+     return response
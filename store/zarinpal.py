@@ -1,11 +1,204 @@
+import threading
+import time
+
+import requests
 from django.conf import settings
+from django.test.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+ZP_API_REQUEST = "{api_base}/pg/rest/WebGate/PaymentRequest.json"
+ZP_API_VERIFY = "{api_base}/pg/rest/WebGate/PaymentVerification.json"
+ZP_API_STARTPAY = "{api_base}/pg/StartPay/{authority}"
+CallbackURL = 'http://127.0.0.1:8000/orders/verify'
+
+PAYMENT_OK = 100
+PAYMENT_VERIFIED_BEFORE = 101
+# no payment was made for the authority, or it failed
+PAYMENT_FAILED = (-21, -22)
+
+RETRY_STATUSES = (502, 503, 504)
+BACKOFF_FACTOR = 0.3
+
+
+def default_api_base():
+    # ZARINPAL_API_BASE points the client somewhere else, e.g. at runfakezarinpal
+    sandbox = 'sandbox' if settings.SANDBOX else 'www'
+    return getattr(settings, 'ZARINPAL_API_BASE', None) or f"https://{sandbox}.zarinpal.com"
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(GatewayError):
+    """
+      the gateway timed out, failed or the circuit breaker is open
+    """
+
+
+class CircuitBreaker:
+    """
+      opens after `failure_threshold` failures in a row, calls fail at once
+      while it is open. After `reset_timeout` seconds one call is let
+      through, its result closes or reopens the breaker.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                return True
+            return False
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+def never_sent(error):
+    """
+      True when the request failed before reaching the gateway. Only these
+      are retried, a request that timed out while reading may have created
+      a payment already.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class ZarinpalClient:
+    """
+      talks to the gateway over one pooled session. Every call has a
+      connect and read timeout and a deadline for all of its attempts,
+      connections that fail and 502/503/504 answers are retried a few times
+      with backoff, and a circuit breaker stops calling a gateway that keeps
+      failing.
+    """
+
+    def __init__(self, merchant_id=None, timeout=None, retries=None, pool_size=None, breaker=None, deadline=None, api_base=None):
+        self.merchant_id = merchant_id or settings.ZARINPALL_MERCHANT_ID
+        self.api_base = api_base or default_api_base()
+        self.timeout = timeout or getattr(settings, 'ZARINPAL_TIMEOUT', (3.05, 10))
+        self.retries = getattr(settings, 'ZARINPAL_RETRIES', 2) if retries is None else retries
+        self.deadline = deadline or getattr(settings, 'ZARINPAL_DEADLINE', 15)
+        self.breaker = breaker or CircuitBreaker(
+            getattr(settings, 'ZARINPAL_BREAKER_THRESHOLD', 5),
+            getattr(settings, 'ZARINPAL_BREAKER_RESET', 30),
+        )
+
+        pool_size = pool_size or getattr(settings, 'ZARINPAL_POOL_SIZE', 10)
+        self.session = requests.Session()
+        self.session.headers.update({'accept': 'application/json', 'content-type': 'application/json'})
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def send(self, url, data):
+        """
+          posts data, retrying what never reached the gateway and 502/503/504
+          answers (verification is idempotent (101), a repeated payment
+          request only leaves an unused authority behind) until the
+          deadline. Each attempt's timeouts are cut to the time left.
+        """
+        deadline = time.monotonic() + self.deadline
+        connect, read = self.timeout
+        for attempt in range(self.retries + 1):
+            left = deadline - time.monotonic()
+            try:
+                response = self.session.post(url, json=data, timeout=(min(connect, left), min(read, left)))
+            except requests.RequestException as error:
+                if not never_sent(error) or attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+            backoff = BACKOFF_FACTOR * 2 ** attempt
+            if time.monotonic() + backoff >= deadline:
+                raise requests.Timeout(f'No answer within {self.deadline} seconds')
+            time.sleep(backoff)
+
+    def post(self, url, data):
+        if not self.breaker.allow():
+            raise GatewayUnavailable('The payment gateway is unavailable, try again later')
+        try:
+            response = self.send(url, data)
+            if response.status_code >= 500:
+                raise GatewayUnavailable(f'The payment gateway answered {response.status_code}')
+            data = response.json()
+        except (requests.RequestException, ValueError) as error:
+            self.breaker.failed()
+            raise GatewayUnavailable(f'The payment gateway failed: {error}') from error
+        except GatewayUnavailable:
+            self.breaker.failed()
+            raise
+        self.breaker.succeeded()
+        return data
+
+    def request_payment(self, amount, description, callback_url, phone=''):
+        return self.post(ZP_API_REQUEST.format(api_base=self.api_base), {
+            'MerchantID': self.merchant_id,
+            'Amount': int(amount),
+            'Description': description,
+            'Phone': phone,
+            'CallbackURL': callback_url,
+        })
+
+    def verify_payment(self, amount, authority):
+        return self.post(ZP_API_VERIFY.format(api_base=self.api_base), {
+            'MerchantID': self.merchant_id,
+            'Amount': int(amount),
+            'Authority': authority,
+        })
+
+    def start_pay_url(self, authority):
+        return ZP_API_STARTPAY.format(api_base=self.api_base, authority=authority)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+      the client of this process, sharing one connection pool
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ZarinpalClient()
+    return _client
 
-if settings.SANDBOX:
-    sandbox = 'sandbox'
-else:
-    sandbox = 'www'
 
-ZP_API_REQUEST = f"https://{sandbox}.zarinpal.com/pg/rest/WebGate/PaymentRequest.json"
-ZP_API_VERIFY = f"https://{sandbox}.zarinpal.com/pg/rest/WebGate/PaymentVerification.json"
-ZP_API_STARTPAY = "https://{sandbox}.zarinpal.com/pg/StartPay/{authority}"
-CallbackURL = 'http://127.0.0.1:8000/orders/verify'
\ No newline at end of file
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    # the client reads its settings once, e.g. override_settings(ZARINPAL_API_BASE=...) needs a new one
+    global _client
+    if setting.startswith('ZARINPAL') or setting == 'SANDBOX':
+        with _client_lock:
+            _client = None